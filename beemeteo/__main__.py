@@ -2,18 +2,107 @@ import json
 import logging
 import sys
 
+from concurrent.futures import ThreadPoolExecutor
+
 import click
+import pandas as pd
 import pytz
 
-from beemeteo.sources.cams import CAMS
-from beemeteo.sources.darksky import DarkSky
-from beemeteo.sources.meteogalicia import MeteoGalicia
+from beemeteo import export
+from beemeteo import registry
+from beemeteo.sources import DEFAULT_CHUNK_DAYS
+from beemeteo.stations.stations import Stations
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def _plan(source, station, date_from, date_to, hbase_table):
+    return pd.DataFrame(
+        [
+            (
+                station.latitude,
+                station.longitude,
+                day_from.date(),
+                day_to.date(),
+                (day_to - day_from).days + 1,
+            )
+            for day_from, day_to in source.plan(
+                station.latitude,
+                station.longitude,
+                pytz.timezone(station.timezone),
+                date_from,
+                date_to,
+                hbase_table,
+            )
+        ],
+        columns=["latitude", "longitude", "date_from", "date_to", "days"],
+    )
+
+
+def _get_data(
+    source, station, date_from, date_to, hbase_table, max_workers, writer
+):
+    try:
+        data = source.get_data(
+            station.latitude,
+            station.longitude,
+            pytz.timezone(station.timezone),
+            date_from,
+            date_to,
+            hbase_table,
+            max_workers,
+        )
+        if hbase_table is not None:
+            source.save(data, hbase_table)
+        if writer.per_station:
+            writer.write(station, data)
+            return pd.DataFrame({})
+    except Exception as e:
+        logger.error(
+            "Could not get data for station (%s, %s): %s"
+            % (station.latitude, station.longitude, e)
+        )
+        return None
+    return data
+
+
+def _stream_data(
+    source,
+    station,
+    date_from,
+    date_to,
+    hbase_table,
+    max_workers,
+    chunk_days,
+    writer,
+):
+    try:
+        for data in source.iter_data(
+            station.latitude,
+            station.longitude,
+            pytz.timezone(station.timezone),
+            date_from,
+            date_to,
+            hbase_table,
+            max_workers,
+            chunk_days,
+        ):
+            if len(data) == 0:
+                continue
+            if hbase_table is not None:
+                source.save(data, hbase_table)
+            writer.write(station, data)
+    except Exception as e:
+        logger.error(
+            "Could not get data for station (%s, %s): %s"
+            % (station.latitude, station.longitude, e)
+        )
+        return None
+    return pd.DataFrame({})
+
+
 @click.command()
 @click.option("--name", type=str, help="Raw data source name")
 @click.option(
@@ -21,6 +110,11 @@ logger = logging.getLogger(__name__)
 )
 @click.option("--latitude", type=float, help="Station's latitude")
 @click.option("--longitude", type=float, help="Station's longitude")
+@click.option(
+    "--stations",
+    type=click.File("rb"),
+    help="Stations file, with latitude, longitude and optionally timezone",
+)
 @click.option("--timezone", type=str, help="Station's timezone")
 @click.option(
     "--date-from", type=click.DateTime(formats=["%Y-%m-%d"]), help="Start date"
@@ -31,38 +125,196 @@ logger = logging.getLogger(__name__)
 @click.option(
     "--hbase-table", type=str, help="Source HBase table name for raw data"
 )
+@click.option(
+    "--plan",
+    is_flag=True,
+    help="Print the requests that would be made to the source and exit",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=1,
+    help="Number of requests to make to the source at the same time",
+)
+@click.option(
+    "--station-workers",
+    type=int,
+    default=1,
+    help="Number of stations to process at the same time",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False, writable=True),
+    help="Directory to write one file per station instead of stdout",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(export.FORMATS),
+    default="csv",
+    help="Output format",
+)
+@click.option(
+    "--output",
+    type=click.Path(writable=True),
+    help="File to write to instead of stdout, or root directory of the "
+    "dataset with --partitioned",
+)
+@click.option(
+    "--partitioned",
+    is_flag=True,
+    help="Write a dataset partitioned by source, station, year and month, "
+    "adding files to the existing partitions",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Get, save and write data a chunk of days at a time, so that "
+    "memory does not grow with the range",
+)
+@click.option(
+    "--chunk-days",
+    type=int,
+    default=DEFAULT_CHUNK_DAYS,
+    help="Days in each chunk when streaming",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Print the time spent in each stage and where each day came from",
+)
+@click.option(
+    "--metrics-json",
+    type=click.Path(dir_okay=False, writable=True),
+    help="File to write the metrics to, as JSON",
+)
+@click.option(
+    "--metrics-prometheus",
+    type=click.Path(dir_okay=False, writable=True),
+    help="File to write the metrics to, for the node exporter's textfile "
+    "collector",
+)
 def main(
     name,
     filename,
     latitude,
     longitude,
+    stations,
     timezone,
     date_from,
     date_to,
     hbase_table,
+    plan,
+    max_workers,
+    station_workers,
+    output_dir,
+    output_format,
+    output,
+    partitioned,
+    stream,
+    chunk_days,
+    profile,
+    metrics_json,
+    metrics_prometheus,
 ):
     """
     Gets raw data from source
     """
 
-    sources = {
-        "cams": CAMS,
-        "darksky": DarkSky,
-        "meteogalicia": MeteoGalicia,
-    }
-
-    source = sources.get(name)(json.load(filename))
-    data = source.get_data(
-        latitude,
-        longitude,
-        pytz.timezone(timezone),
-        date_from,
-        date_to,
-        hbase_table,
+    if partitioned and output is None:
+        raise click.UsageError("--partitioned needs --output")
+    if output is not None and output_dir is not None:
+        raise click.UsageError("--output and --output-dir are exclusive")
+
+    try:
+        source_class = registry.get(name)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    source = source_class(json.load(filename))
+    try:
+        stations = Stations.from_options(
+            stations, latitude, longitude, timezone
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    writer = export.writer(
+        output_format,
+        output,
+        output_dir,
+        partitioned,
+        source=name,
+        schema=source.columns(),
     )
-    if hbase_table is not None:
-        source.save(data, hbase_table)
-    data.to_csv(sys.stdout, index=False)
+
+    with ThreadPoolExecutor(max_workers=station_workers) as executor:
+        if plan:
+            results = executor.map(
+                lambda station: _plan(
+                    source, station, date_from, date_to, hbase_table
+                ),
+                stations.itertuples(),
+            )
+        elif stream:
+            results = executor.map(
+                lambda station: _stream_data(
+                    source,
+                    station,
+                    date_from,
+                    date_to,
+                    hbase_table,
+                    max_workers,
+                    chunk_days,
+                    writer,
+                ),
+                stations.itertuples(),
+            )
+        else:
+            results = executor.map(
+                lambda station: _get_data(
+                    source,
+                    station,
+                    date_from,
+                    date_to,
+                    hbase_table,
+                    max_workers,
+                    writer,
+                ),
+                stations.itertuples(),
+            )
+        results = list(results)
+
+    failed = [
+        (station.latitude, station.longitude)
+        for station, data in zip(stations.itertuples(), results)
+        if data is None
+    ]
+    results = [data for data in results if data is not None and len(data)]
+    if results and plan:
+        planned = pd.concat(results)
+        planned.to_csv(sys.stdout, index=False)
+        quota = getattr(source, "quota", None)
+        if quota is not None:
+            fit = quota.plan(len(planned))
+            logger.info(
+                "%d request(s), %d of them fit in today's quota, %d day(s) "
+                "of quota needed"
+                % (fit["requests"], fit["today"], fit["days"])
+            )
+    elif results:
+        writer.write(None, pd.concat(results, ignore_index=True))
+    writer.close()
+    source.http.log_stats()
+    if profile:
+        click.echo(source.metrics.summary(), err=True)
+    if metrics_json is not None:
+        source.metrics.write_json(metrics_json)
+    if metrics_prometheus is not None:
+        source.metrics.write_prometheus(metrics_prometheus)
+    if failed:
+        raise click.ClickException(
+            "Could not get data for %d station(s): %s"
+            % (len(failed), ", ".join("(%s, %s)" % s for s in failed))
+        )
 
 
 if __name__ == "__main__":
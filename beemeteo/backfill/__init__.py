@@ -0,0 +1,397 @@
+import collections
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import pytz
+
+from beemeteo.quota import is_quota_exceeded
+from beemeteo.sources import DEFAULT_CHUNK_DAYS
+from beemeteo.sources import _local_dt_to_ts
+from beemeteo.sources import _split_range
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRIES = 3
+# seconds before the first retry of a unit, doubled after each attempt
+DEFAULT_BACKOFF = 5
+MAX_BACKOFF = 600
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+Unit = collections.namedtuple(
+    "Unit",
+    ["source", "latitude", "longitude", "timezone", "date_from", "date_to"],
+)
+
+
+def work_units(
+    source, stations, date_from, date_to, chunk_days=DEFAULT_CHUNK_DAYS
+):
+    """
+    Breaks a backfill into work units of chunk_days days of a station. Units
+    share their limits, as get_data includes date_to.
+
+    :param source: source name
+    :param stations: dataframe with latitude, longitude and timezone columns
+    :param date_from: start date
+    :param date_to: end date
+    :param chunk_days: days in each unit
+    :return: list of Unit, station by station and in order
+    """
+    result = []
+    for station in stations.itertuples():
+        for day_from, day_to in _split_range(date_from, date_to, chunk_days):
+            result.append(
+                Unit(
+                    source,
+                    station.latitude,
+                    station.longitude,
+                    station.timezone,
+                    day_from,
+                    day_to,
+                )
+            )
+    return result
+
+
+class Checkpoint:
+    """
+    Local SQLite store of the state of the work units of backfills, so that
+    an interrupted one resumes with the units it had not finished. Every
+    change is committed at once, a crash loses at most the units in
+    progress.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: SQLite database, created when missing
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                "source TEXT NOT NULL, "
+                "latitude REAL NOT NULL, "
+                "longitude REAL NOT NULL, "
+                "date_from TEXT NOT NULL, "
+                "date_to TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "rows INTEGER, "
+                "error TEXT, "
+                "updated TEXT, "
+                "PRIMARY KEY "
+                "(source, latitude, longitude, date_from, date_to))"
+            )
+
+    @staticmethod
+    def _key(unit):
+        return (
+            unit.source,
+            float(unit.latitude),
+            float(unit.longitude),
+            unit.date_from.isoformat(),
+            unit.date_to.isoformat(),
+        )
+
+    def add(self, units):
+        """
+        Records new units as pending, keeping the state of known ones
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO units "
+                "(source, latitude, longitude, date_from, date_to, status) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [self._key(unit) + (PENDING,) for unit in units],
+            )
+
+    def status(self, unit):
+        """
+        :return: (status, attempts), None for unknown units
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT status, attempts FROM units WHERE source = ? AND "
+                "latitude = ? AND longitude = ? AND date_from = ? AND "
+                "date_to = ?",
+                self._key(unit),
+            ).fetchone()
+
+    def pending(self, units):
+        """
+        :return: units that are not done yet, in order
+        """
+        with self._lock:
+            done = set(
+                self._connection.execute(
+                    "SELECT source, latitude, longitude, date_from, date_to "
+                    "FROM units WHERE status = ?",
+                    (DONE,),
+                )
+            )
+        return [unit for unit in units if self._key(unit) not in done]
+
+    def done(self, unit, rows, attempts=1):
+        self._update(unit, DONE, attempts, rows=rows)
+
+    def failed(self, unit, error, attempts=1):
+        self._update(unit, FAILED, attempts, error=str(error))
+
+    def _update(self, unit, status, attempts, rows=None, error=None):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE units SET status = ?, attempts = attempts + ?, "
+                "rows = ?, error = ?, updated = ? WHERE source = ? AND "
+                "latitude = ? AND longitude = ? AND date_from = ? AND "
+                "date_to = ?",
+                (
+                    status,
+                    attempts,
+                    rows,
+                    error,
+                    datetime.datetime.utcnow().isoformat(),
+                )
+                + self._key(unit),
+            )
+
+    def summary(self):
+        """
+        :return: dict with the number of units of each status
+        """
+        with self._lock:
+            return dict(
+                self._connection.execute(
+                    "SELECT status, COUNT(*) FROM units GROUP BY status"
+                )
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class Progress:
+    """
+    Logs the units done, their rate and the estimated time to finish
+    """
+
+    def __init__(self, total, done=0, clock=time.monotonic):
+        """
+        :param total: units of the backfill
+        :param done: units already done by previous runs
+        """
+        self.total = total
+        self.done = done
+        self.failed = 0
+        self._done_before = done
+        self._clock = clock
+        self._start = clock()
+        self._lock = threading.Lock()
+
+    def rate(self):
+        """
+        :return: units done by this run per second
+        """
+        elapsed = self._clock() - self._start
+        return (self.done - self._done_before) / elapsed if elapsed else 0.0
+
+    def eta(self):
+        """
+        :return: estimated seconds to finish, None before the first unit
+        """
+        rate = self.rate()
+        if rate == 0:
+            return None
+        return (self.total - self.done - self.failed) / rate
+
+    def update(self, unit, ok=True):
+        with self._lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            eta = self.eta()
+            logger.info(
+                "Backfill %d/%d units (%.1f%%), %d failed, %.2f units/s, "
+                "ETA %s, last: (%s, %s) %s - %s"
+                % (
+                    self.done,
+                    self.total,
+                    100.0 * self.done / max(1, self.total),
+                    self.failed,
+                    self.rate(),
+                    "unknown" if eta is None else timedelta(seconds=int(eta)),
+                    unit.latitude,
+                    unit.longitude,
+                    unit.date_from.date(),
+                    unit.date_to.date(),
+                )
+            )
+
+
+class Backfill:
+    """
+    Gets the data of many stations over a long range, a work unit at a time,
+    saving each one to HBase and/or writing it before recording it as done
+    in a checkpoint. Failed units are retried with exponential backoff, and
+    the ones still failing are left for the next run. Once the daily quota
+    of the source is used, the units left wait for the next run too.
+    """
+
+    def __init__(
+        self,
+        source,
+        checkpoint,
+        hbase_table=None,
+        writer=None,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        workers=1,
+        max_workers=1,
+        sleep=time.sleep,
+    ):
+        """
+        :param source: Source
+        :param checkpoint: Checkpoint
+        :param hbase_table: HBase table to save the data to
+        :param writer: writer of beemeteo.export to write the data to
+        :param retries: attempts of a unit after the first one
+        :param backoff: seconds before the first retry of a unit
+        :param workers: units processed at the same time
+        :param max_workers: requests of a unit made at the same time
+        """
+        if hbase_table is None and writer is None:
+            raise ValueError("A backfill needs an HBase table or a writer")
+        self.source = source
+        self.checkpoint = checkpoint
+        self.hbase_table = hbase_table
+        self.writer = writer
+        self.retries = retries
+        self.backoff = backoff
+        self.workers = workers
+        self.max_workers = max_workers
+        self._sleep = sleep
+        self._quota_used = threading.Event()
+
+    def run(self, units):
+        """
+        Processes the units that are not done yet
+
+        :param units: units of the backfill, as returned by work_units()
+        :return: units that are not done, because they failed after every
+            retry or the quota was used
+        """
+        self.checkpoint.add(units)
+        pending = self.checkpoint.pending(units)
+        # the first unit of each station, whose first instant no previous
+        # unit writes
+        firsts = set()
+        seen = set()
+        for unit in units:
+            if (unit.latitude, unit.longitude) not in seen:
+                seen.add((unit.latitude, unit.longitude))
+                firsts.add(unit)
+        progress = Progress(len(units), len(units) - len(pending))
+        logger.info(
+            "Backfill of %d units, %d already done"
+            % (len(units), progress.done)
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(
+                executor.map(
+                    lambda unit: self._run_unit(
+                        unit, unit in firsts, progress
+                    ),
+                    pending,
+                )
+            )
+        left = [unit for unit, ok in zip(pending, results) if not ok]
+        if self._quota_used.is_set():
+            logger.warning(
+                "Backfill stopped as the quota of the source is used, %d "
+                "units left for the next run" % len(left)
+            )
+        return left
+
+    def _run_unit(self, unit, first, progress):
+        attempt = 0
+        while True:
+            if self._quota_used.is_set():
+                return False
+            try:
+                rows = self._process(unit, first)
+            except Exception as e:
+                if is_quota_exceeded(e):
+                    # retrying does not help until the quota is reset
+                    self._quota_used.set()
+                    return False
+                if attempt >= self.retries:
+                    logger.error(
+                        "Backfill unit (%s, %s) %s - %s failed: %s"
+                        % (
+                            unit.latitude,
+                            unit.longitude,
+                            unit.date_from.date(),
+                            unit.date_to.date(),
+                            e,
+                        )
+                    )
+                    self.checkpoint.failed(unit, e, attempt + 1)
+                    progress.update(unit, ok=False)
+                    return False
+                delay = min(self.backoff * 2**attempt, MAX_BACKOFF)
+                logger.warning(
+                    "Backfill unit (%s, %s) %s - %s failed: %s, retrying in "
+                    "%s seconds"
+                    % (
+                        unit.latitude,
+                        unit.longitude,
+                        unit.date_from.date(),
+                        unit.date_to.date(),
+                        e,
+                        delay,
+                    )
+                )
+                self._sleep(delay)
+                attempt += 1
+                continue
+            self.checkpoint.done(unit, rows, attempt + 1)
+            progress.update(unit)
+            return True
+
+    def _process(self, unit, first):
+        timezone = pytz.timezone(unit.timezone)
+        data = self.source.get_data(
+            unit.latitude,
+            unit.longitude,
+            timezone,
+            unit.date_from,
+            unit.date_to,
+            self.hbase_table,
+            self.max_workers,
+        )
+        if len(data) == 0:
+            return 0
+        if self.hbase_table is not None:
+            self.source.save(data, self.hbase_table)
+        if self.writer is not None:
+            if not first:
+                # the previous unit of the station ended, as get_data does,
+                # at this one's first instant and wrote it
+                start = _local_dt_to_ts(unit.date_from)
+                data = data[data["ts"] > start].reset_index(drop=True)
+            self.writer.write(unit, data)
+        return len(data)
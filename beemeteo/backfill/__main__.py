@@ -0,0 +1,162 @@
+import json
+import logging
+
+import click
+
+from beemeteo import export
+from beemeteo import registry
+from beemeteo.backfill import DEFAULT_BACKOFF
+from beemeteo.backfill import DEFAULT_RETRIES
+from beemeteo.backfill import Backfill
+from beemeteo.backfill import Checkpoint
+from beemeteo.backfill import work_units
+from beemeteo.sources import DEFAULT_CHUNK_DAYS
+from beemeteo.stations.stations import Stations
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+@click.option("--name", type=str, help="Raw data source name")
+@click.option(
+    "--filename", type=click.File("rb"), help="Configuration filename"
+)
+@click.option("--latitude", type=float, help="Station's latitude")
+@click.option("--longitude", type=float, help="Station's longitude")
+@click.option(
+    "--stations",
+    type=click.File("rb"),
+    help="Stations file, with latitude, longitude and optionally timezone",
+)
+@click.option("--timezone", type=str, help="Station's timezone")
+@click.option(
+    "--date-from", type=click.DateTime(formats=["%Y-%m-%d"]), help="Start date"
+)
+@click.option(
+    "--date-to", type=click.DateTime(formats=["%Y-%m-%d"]), help="End date"
+)
+@click.option(
+    "--hbase-table", type=str, help="Source HBase table name for raw data"
+)
+@click.option(
+    "--checkpoint",
+    type=click.Path(dir_okay=False, writable=True),
+    default="backfill.sqlite",
+    help="SQLite file recording the work units done",
+)
+@click.option(
+    "--chunk-days",
+    type=int,
+    default=DEFAULT_CHUNK_DAYS,
+    help="Days of a station in each work unit",
+)
+@click.option(
+    "--retries",
+    type=int,
+    default=DEFAULT_RETRIES,
+    help="Attempts of a failed work unit before leaving it for the next run",
+)
+@click.option(
+    "--backoff",
+    type=float,
+    default=DEFAULT_BACKOFF,
+    help="Seconds before the first retry of a work unit, doubled after each "
+    "attempt",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Number of work units to process at the same time",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    default=1,
+    help="Number of requests of a work unit to make at the same time",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(export.FORMATS),
+    default="parquet",
+    help="Format of the partitioned dataset",
+)
+@click.option(
+    "--output",
+    type=click.Path(file_okay=False, writable=True),
+    help="Root directory of a partitioned dataset to write the data to",
+)
+def main(
+    name,
+    filename,
+    latitude,
+    longitude,
+    stations,
+    timezone,
+    date_from,
+    date_to,
+    hbase_table,
+    checkpoint,
+    chunk_days,
+    retries,
+    backoff,
+    workers,
+    max_workers,
+    output_format,
+    output,
+):
+    """
+    Gets raw data from source for many stations and a long range, resuming
+    where a previous run stopped
+    """
+
+    if hbase_table is None and output is None:
+        raise click.UsageError("Either --hbase-table or --output is needed")
+
+    try:
+        source_class = registry.get(name)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    source = source_class(json.load(filename))
+    try:
+        stations = Stations.from_options(
+            stations, latitude, longitude, timezone
+        )
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    writer = None
+    if output is not None:
+        writer = export.writer(
+            output_format,
+            output,
+            partitioned=True,
+            source=name,
+            schema=source.columns(),
+        )
+
+    store = Checkpoint(checkpoint)
+    try:
+        failed = Backfill(
+            source,
+            store,
+            hbase_table,
+            writer,
+            retries=retries,
+            backoff=backoff,
+            workers=workers,
+            max_workers=max_workers,
+        ).run(work_units(name, stations, date_from, date_to, chunk_days))
+    finally:
+        store.close()
+    if failed:
+        raise click.ClickException(
+            "%d work unit(s) failed, run the same command again to retry "
+            "them" % len(failed)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+from beemeteo.files import atomic_write
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_SIZE = 256 * 1024**2
+# seconds after which the size of a ParquetCache is read again from disk,
+# to account for the files other processes wrote
+RESCAN_INTERVAL = 60
+
+
+class ParquetCache:
+    """
+    Local cache of daily source data, with one Parquet file per source,
+    station and day. Files are read memory-mapped and, when the cache grows
+    over max_size bytes, the least recently used ones are removed.
+    Several processes can share the directory: days any of them wrote are
+    read by the others, and the size is read again from disk before
+    evicting. Requires pyarrow.
+    """
+
+    def __init__(self, path, max_size=None, rescan_interval=RESCAN_INTERVAL):
+        """
+        :param path: directory holding the cache
+        :param max_size: maximum size of the cache in bytes, unlimited when
+            None
+        :param rescan_interval: seconds after which the size is read again
+            from disk when writing
+        """
+        self.path = path
+        self.max_size = max_size
+        self.rescan_interval = rescan_interval
+        self.size = 0
+        self._files = None
+        self._used = None
+        self._scanned = None
+        self._lock = threading.Lock()
+
+    def _file(self, source, latitude, longitude, day):
+        return os.path.join(
+            self.path,
+            source,
+            "%s_%s" % (latitude, longitude),
+            "%s.parquet" % day.strftime("%Y-%m-%d"),
+        )
+
+    def _index(self):
+        """
+        Files of the cache and their size, from the least to the most
+        recently used one. Built from the directory the first time it is
+        needed, and again after _rescan.
+        """
+        if self._files is None:
+            # files used in the same tick of the clock keep the order this
+            # process used them in
+            order = dict((path, i) for i, path in enumerate(self._used or []))
+            files = []
+            for root, _, names in os.walk(self.path):
+                for name in names:
+                    if name.endswith(".parquet"):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except FileNotFoundError:
+                            continue
+                        files.append(
+                            (
+                                (stat.st_mtime, order.get(path, -1)),
+                                path,
+                                stat.st_size,
+                            )
+                        )
+            self._files = collections.OrderedDict(
+                (path, size) for _, path, size in sorted(files)
+            )
+            self.size = sum(self._files.values())
+            self._scanned = time.monotonic()
+        return self._files
+
+    def _rescan(self):
+        """
+        Forgets the index, so that the next use reads the directory again
+        """
+        self._used = self._files
+        self._files = None
+
+    def get(self, source, latitude, longitude, day):
+        """
+        Reads a day of data
+
+        :param source: source name
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param day: day in the station's timezone
+        :return: dataframe, or None when the day is not cached
+        """
+        import pyarrow.parquet as pq
+
+        path = self._file(source, latitude, longitude, day)
+        with self._lock:
+            files = self._index()
+            if path not in files:
+                # written by another process since the directory was read
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    return None
+                files[path] = size
+                self.size += size
+            files.move_to_end(path)
+        try:
+            data = pq.read_table(path, memory_map=True).to_pandas()
+            # keeps the order of use across processes sharing the directory
+            os.utime(path)
+        except (IOError, OSError) as e:
+            logger.error("Could not read %s: %s" % (path, e))
+            with self._lock:
+                self.size -= files.pop(path, 0)
+            return None
+        return data
+
+    def put(self, source, latitude, longitude, day, data):
+        """
+        Writes a day of data, evicting the least recently used days when
+        the cache is full
+
+        :param source: source name
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param day: day in the station's timezone
+        :param data: dataframe
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = self._file(source, latitude, longitude, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_write(path) as tmp:
+            pq.write_table(
+                pa.Table.from_pandas(data, preserve_index=False), tmp
+            )
+        with self._lock:
+            if (
+                self.max_size is not None
+                and self._scanned is not None
+                and time.monotonic() - self._scanned >= self.rescan_interval
+            ):
+                self._rescan()
+            files = self._index()
+            self.size -= files.pop(path, 0)
+            files[path] = os.path.getsize(path)
+            self.size += files[path]
+            self._evict()
+
+    def _evict(self):
+        if self.max_size is None or self.size <= self.max_size:
+            return
+        # other processes sharing the directory may have added or removed
+        # files, and used them since
+        self._rescan()
+        files = self._index()
+        while self.size > self.max_size and len(files) > 1:
+            path, size = files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class MemoryCache:
+    """
+    In-process LRU cache of daily source data bounded by the memory used by
+    its frames. Days that can still change expire after their ttl.
+    """
+
+    def __init__(self, max_size=None):
+        """
+        :param max_size: maximum memory used by the cached frames in bytes
+        """
+        self.max_size = max_size or DEFAULT_MEMORY_SIZE
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, source, latitude, longitude, day):
+        """
+        Gets a day of data
+
+        :param source: source name
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param day: day in the station's timezone
+        :return: dataframe, or None when the day is not cached or expired
+        """
+        key = (source, latitude, longitude, day)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[1] is not None:
+                if time.monotonic() >= item[1]:
+                    self._remove(key)
+                    self.expired += 1
+                    item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, source, latitude, longitude, day, data, ttl=None):
+        """
+        Keeps a day of data, evicting the least recently used days when the
+        cache is full
+
+        :param source: source name
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param day: day in the station's timezone
+        :param data: dataframe
+        :param ttl: seconds the data is valid, forever when None
+        """
+        key = (source, latitude, longitude, day)
+        size = int(data.memory_usage(index=True, deep=True).sum())
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._remove(key)
+            if size > self.max_size:
+                return
+            self._items[key] = (data, expires, size)
+            self.size += size
+            while self.size > self.max_size:
+                self._remove(next(iter(self._items)))
+                self.evicted += 1
+
+    def _remove(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self.size -= item[2]
+
+    def stats(self):
+        """
+        :return: dict with the cache's counters
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "days": len(self._items),
+                "size": self.size,
+            }
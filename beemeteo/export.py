@@ -0,0 +1,310 @@
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from beemeteo.files import atomic_write
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMATS = ["csv", "parquet", "feather"]
+
+
+def station_name(station):
+    """
+    :param station: anything with latitude and longitude attributes
+    :return: name of the station in file names and partitions
+    """
+    return "{latitude}_{longitude}".format(
+        latitude=station.latitude, longitude=station.longitude
+    )
+
+
+def _arrow_type(dtype):
+    """
+    :param dtype: numpy dtype of a column
+    :return: Arrow type of the column, nullable so that integers can be
+        missing in some chunks
+    """
+    import pyarrow as pa
+
+    dtype = np.dtype(dtype)
+    if dtype == object:
+        return pa.string()
+    return pa.from_numpy_dtype(dtype)
+
+
+class _Sink:
+    """
+    One file, or stdout, written a chunk at a time. The file has the columns
+    of the first chunk and those declared by the schema, and a later chunk
+    with any other column is an error rather than losing it. For the
+    columnar formats, types are those of the schema or, for the columns it
+    does not declare, of the first chunk. Parquet and feather need pyarrow.
+    """
+
+    def __init__(self, path, format, schema=None):
+        """
+        :param path: file name, stdout when None
+        :param format: one of FORMATS
+        :param schema: dict of the columns the chunks can have to their
+            numpy dtypes, see Source.columns
+        """
+        self.path = path
+        self.format = format
+        self.schema = schema or {}
+        self.columns = None
+        self._file = None
+        self._writer = None
+        self._schema = None
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        with self._lock:
+            if self._file is None:
+                self.columns = list(data.columns) + [
+                    column
+                    for column in self.schema
+                    if column not in data.columns
+                ]
+                self._file = (
+                    sys.stdout.buffer
+                    if self.path is None
+                    else open(self.path, "wb")
+                )
+                header = True
+            else:
+                header = False
+                unknown = [c for c in data.columns if c not in self.columns]
+                if unknown:
+                    raise ValueError(
+                        "Column(s) %s are not in %s, add them to the "
+                        "source's schema"
+                        % (", ".join(unknown), self.path or "stdout")
+                    )
+            data = data.reindex(columns=self.columns)
+            if self.format == "csv":
+                self._file.write(
+                    data.to_csv(header=header, index=False).encode("utf-8")
+                )
+                self._file.flush()
+            else:
+                self._write_table(data)
+
+    def _write_table(self, data):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            inferred = pa.Table.from_pandas(data, preserve_index=False).schema
+            self._schema = pa.schema(
+                [
+                    (
+                        field.name,
+                        (
+                            _arrow_type(self.schema[field.name])
+                            if field.name in self.schema
+                            else field.type
+                        ),
+                    )
+                    for field in inferred
+                ]
+            )
+            if self.format == "parquet":
+                self._writer = pq.ParquetWriter(self._file, self._schema)
+            else:
+                # feather v2 is the Arrow IPC file format
+                self._writer = pa.ipc.new_file(self._file, self._schema)
+        self._writer.write_table(
+            pa.Table.from_pandas(
+                data, schema=self._schema, preserve_index=False
+            )
+        )
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+            if self._file is not None:
+                self._file.flush()
+                if self.path is not None:
+                    self._file.close()
+
+
+def _write_file(data, path, format, schema=None):
+    """
+    Writes a whole frame to a new file, atomically so that readers of the
+    dataset never see a partially written one
+    """
+    with atomic_write(path) as tmp:
+        sink = _Sink(tmp, format, schema)
+        try:
+            sink.write(data)
+        finally:
+            sink.close()
+
+
+class FileWriter:
+    """
+    Writes the data of every station to a single file, or stdout
+    """
+
+    per_station = False
+
+    def __init__(self, output=None, format="csv", schema=None):
+        """
+        :param output: file name, stdout when None
+        :param format: one of FORMATS
+        :param schema: dict of the columns of the data to their dtypes
+        """
+        self._sink = _Sink(output, format, schema)
+
+    def write(self, station, data):
+        """
+        :param station: station the data belongs to, unused
+        :param data: chunk of data
+        """
+        self._sink.write(data)
+
+    def close(self):
+        self._sink.close()
+
+
+class StationWriter:
+    """
+    Writes the data of each station to its own file in a directory
+    """
+
+    per_station = True
+
+    def __init__(self, output_dir, format="csv", schema=None):
+        """
+        :param output_dir: directory, created when missing
+        :param format: one of FORMATS
+        :param schema: dict of the columns of the data to their dtypes
+        """
+        self.output_dir = output_dir
+        self.format = format
+        self.schema = schema
+        self._sinks = {}
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write(self, station, data):
+        """
+        :param station: station the data belongs to
+        :param data: chunk of data
+        """
+        path = os.path.join(
+            self.output_dir,
+            "%s.%s" % (station_name(station), self.format),
+        )
+        with self._lock:
+            if path not in self._sinks:
+                self._sinks[path] = _Sink(path, self.format, self.schema)
+            sink = self._sinks[path]
+        sink.write(data)
+
+    def close(self):
+        for sink in self._sinks.values():
+            sink.close()
+
+
+class PartitionedWriter:
+    """
+    Writes a dataset partitioned by source, station, year and month of ts,
+    with hive style directories such as
+    source=darksky/station=41.29_2.19/year=2021/month=9, as read by Spark
+    and pyarrow. Every chunk adds new part files to its partitions and the
+    existing ones are never rewritten. Part files are named after the ts
+    range they hold, so exporting the same range again replaces its own
+    parts instead of duplicating rows.
+    """
+
+    per_station = True
+
+    def __init__(self, path, source, format="parquet", schema=None):
+        """
+        :param path: root directory of the dataset
+        :param source: source name
+        :param format: one of FORMATS
+        :param schema: dict of the columns of the data to their dtypes, so
+            that every part file has the same columns and types
+        """
+        self.path = path
+        self.source = source
+        self.format = format
+        self.schema = schema
+
+    def write(self, station, data):
+        """
+        :param station: station the data belongs to
+        :param data: chunk of data with a ts column
+        """
+        if len(data) == 0:
+            return
+        times = pd.to_datetime(data["ts"], unit="s")
+        for (year, month), partition in data.groupby(
+            [times.dt.year.rename("year"), times.dt.month.rename("month")],
+            sort=True,
+        ):
+            directory = os.path.join(
+                self.path,
+                "source=%s" % self.source,
+                "station=%s" % station_name(station),
+                "year=%d" % year,
+                "month=%d" % month,
+            )
+            os.makedirs(directory, exist_ok=True)
+            _write_file(
+                partition.reset_index(drop=True),
+                os.path.join(
+                    directory,
+                    "part-%d-%d.%s"
+                    % (
+                        partition["ts"].min(),
+                        partition["ts"].max(),
+                        self.format,
+                    ),
+                ),
+                self.format,
+                self.schema,
+            )
+
+    def close(self):
+        pass
+
+
+def writer(
+    format="csv",
+    output=None,
+    output_dir=None,
+    partitioned=False,
+    source=None,
+    schema=None,
+):
+    """
+    :param format: one of FORMATS
+    :param output: file to write to, stdout when None, or root directory of
+        the dataset when partitioned
+    :param output_dir: directory to write one file per station to
+    :param partitioned: whether to write a partitioned dataset
+    :param source: source name, for partitioned datasets
+    :param schema: dict of the columns of the data to their dtypes, see
+        Source.columns
+    :return: writer of station data
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown format %s" % format)
+    if partitioned:
+        if output is None:
+            raise ValueError("Partitioned datasets need an output directory")
+        return PartitionedWriter(output, source, format, schema)
+    if output_dir is not None:
+        return StationWriter(output_dir, format, schema)
+    return FileWriter(output, format, schema)
@@ -0,0 +1,26 @@
+import contextlib
+import os
+import uuid
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    """
+    Path of a temporary file next to path, which replaces it once the block
+    exits without errors, so that readers never see a partially written
+    file. The temporary file is hidden, and removed when the block fails.
+
+    :param path: file to write
+    :return: context manager yielding the temporary file's path
+    """
+    tmp = os.path.join(
+        os.path.dirname(path),
+        ".%s.%s.tmp" % (os.path.basename(path), uuid.uuid4().hex),
+    )
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
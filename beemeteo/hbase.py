@@ -1,37 +1,122 @@
+import contextlib
 import logging
+import threading
 import time
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
-import happybase
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CHUNK_SIZE = 50000
+
+_pools = {}
+_tables = set()
+_handles = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
 
 class HBase:
-    def __init__(self, host, port, db):
+    def __init__(self, host, port, db, pool_size=None, health_check=False):
         self.host = host
         self.port = port
         self.db = db
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.health_check = health_check
+
+    @property
+    def pool(self):
+        """
+        Connection pool shared by every HBase instance of the process
+        pointing to the same server and namespace. Its size is set by the
+        first instance that uses it.
+        """
+        # imported here, as thrift takes long to load and many runs never
+        # connect to HBase
+        import happybase
+
+        key = (self.host, self.port, self.db)
+        with _lock:
+            if key not in _pools:
+                _pools[key] = happybase.ConnectionPool(
+                    self.pool_size,
+                    host=self.host,
+                    port=self.port,
+                    table_prefix=self.db,
+                    table_prefix_separator=":",
+                )
+            return _pools[key]
 
     @property
     def connection(self):
+        """
+        A new connection of its own, which the caller has to close
+        """
+        import happybase
+
         _connection = happybase.Connection(
-            self.host, self.port, table_prefix=self.db, table_prefix_separator=":"
+            self.host,
+            self.port,
+            table_prefix=self.db,
+            table_prefix_separator=":",
         )
         _connection.open()
         return _connection
 
     def get_table(self, table_name, cf=None):
+        """
+        Gets a table from a connection of its own, creating it the first
+        time it is used in the process. Use pooled_table to share
+        connections.
+        """
+        _connection = self.connection
+        self._create_table(_connection, table_name, cf)
+        return _connection.table(table_name)
+
+    @contextlib.contextmanager
+    def pooled_connection(self):
+        with self.pool.connection() as _connection:
+            if self.health_check:
+                try:
+                    _connection.tables()
+                except Exception as e:
+                    logger.info("Reopening unhealthy connection: %s" % e)
+                    _connection.close()
+                    _connection.open()
+            yield _connection
+
+    @contextlib.contextmanager
+    def pooled_table(self, table_name, cf=None):
+        """
+        Gets a table from a pooled connection, creating it the first time
+        it is used in the process
+        """
+        with self.pooled_connection() as _connection:
+            self._create_table(_connection, table_name, cf)
+            handles = _handles.setdefault(_connection, {})
+            if table_name not in handles:
+                handles[table_name] = _connection.table(table_name)
+            yield handles[table_name]
+
+    def _create_table(self, _connection, table_name, cf=None):
+        key = (self.host, self.port, self.db, table_name)
+        if key in _tables:
+            return
         try:
             if not cf:
                 cf = {"cf": {}}
-            self.connection.create_table(table_name, cf)
+            _connection.create_table(table_name, cf)
+            _tables.add(key)
         except Exception as e:
             if str(e.__class__) == "<class 'Hbase_thrift.AlreadyExists'>":
-                pass
+                _tables.add(key)
             else:
                 logger.error(e)
-        return self.connection.table(table_name)
 
     @staticmethod
     def save(
@@ -39,9 +124,11 @@ class HBase:
         documents,
         cf_mapping,
         row_fields=None,
-        version=int(time.time()),
+        version=None,
         batch_size=1000,
     ):
+        if version is None:
+            version = int(time.time())
         batch = table.batch(timestamp=version, batch_size=batch_size)
         row_auto = 0
         for d in documents:
@@ -49,7 +136,9 @@ class HBase:
                 row = row_auto
                 row_auto += 1
             else:
-                row = "~".join([str(d.pop(f)) if f in d else "" for f in row_fields])
+                row = "~".join(
+                    [str(d.pop(f)) if f in d else "" for f in row_fields]
+                )
             values = {}
             for cf, fields in cf_mapping:
                 if fields == "all":
@@ -61,3 +150,75 @@ class HBase:
                             values["{cf}:{c}".format(cf=cf, c=c)] = str(d[c])
                 batch.put(str(row), values)
         batch.send()
+
+    def save_frame(
+        self,
+        table_name,
+        data,
+        cf,
+        row_fields=None,
+        version=None,
+        batch_size=1000,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        workers=1,
+    ):
+        """
+        Saves a dataframe, encoding row keys and values one column at a time.
+        The frame is written in chunks, each one through its own batch, by
+        up to `workers` pooled connections in parallel.
+
+        :param table_name: HBase table
+        :param data: dataframe to save
+        :param cf: column family for every column not in the row key
+        :param row_fields: columns joined with "~" to build the row key, the
+        row position is used when not given
+        :param version: cells' timestamp, the current time when not given
+        :param batch_size: mutations sent to HBase at once
+        :param chunk_size: rows encoded at once
+        :param workers: chunks written in parallel, at most the pool size
+        :return: number of rows saved
+        """
+        if version is None:
+            version = int(time.time())
+        row_fields = row_fields or []
+        columns = [c for c in data.columns if c not in row_fields]
+        qualifiers = ["{cf}:{c}".format(cf=cf, c=c) for c in columns]
+
+        def write(offset):
+            chunk = data.iloc[offset:][:chunk_size]
+            keys = self._encode_keys(chunk, row_fields, offset)
+            values = [chunk[c].astype(str).tolist() for c in columns]
+            with self.pooled_table(table_name, {cf: {}}) as table:
+                batch = table.batch(timestamp=version, batch_size=batch_size)
+                for key, *cells in zip(keys, *values):
+                    batch.put(key, dict(zip(qualifiers, cells)))
+                batch.send()
+            return len(chunk)
+
+        start = time.perf_counter()
+        offsets = range(0, len(data), chunk_size)
+        workers = max(1, min(workers, self.pool_size, len(offsets)))
+        if workers == 1:
+            rows = sum(write(offset) for offset in offsets)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                rows = sum(executor.map(write, offsets))
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "Saved %d rows to %s in %.2fs (%.0f rows/s)"
+            % (rows, table_name, elapsed, rows / elapsed if elapsed else 0)
+        )
+        return rows
+
+    @staticmethod
+    def _encode_keys(data, row_fields, offset=0):
+        """
+        Builds the row keys of a dataframe, as HBase.save would for each of
+        its records
+        """
+        if not row_fields:
+            return np.arange(offset, offset + len(data)).astype(str).tolist()
+        keys = data[row_fields[0]].astype(str)
+        for field in row_fields[1:]:
+            keys = keys + "~" + data[field].astype(str)
+        return keys.tolist()
@@ -0,0 +1,392 @@
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+import numpy as np
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# seconds to establish a connection and between bytes of a response
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 120
+DEFAULT_RETRIES = 2
+# seconds of the first backoff, doubled after each round of attempts
+DEFAULT_BACKOFF = 1
+MAX_BACKOFF = 60
+DEFAULT_POOL_SIZE = 10
+# consecutive failures opening the circuit of a host, and seconds it stays
+# open before a request probes the host again
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET = 60
+# latencies of each host kept for the percentiles
+LATENCY_SAMPLES = 1000
+
+
+class CircuitOpen(IOError):
+    """
+    Raised when every server of a request is skipped by its circuit breaker
+    """
+
+
+def _host(url):
+    return urlsplit(str(url)).netloc or str(url)
+
+
+def _retryable(status):
+    return status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after consecutive failures, until
+    reset_timeout seconds have passed and a probe request succeeds
+    """
+
+    def __init__(
+        self,
+        failures=DEFAULT_BREAKER_FAILURES,
+        reset_timeout=DEFAULT_BREAKER_RESET,
+        clock=time.monotonic,
+    ):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.consecutive = 0
+        self.opened = None
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return "closed"
+        if self._clock() - self.opened >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """
+        :return: whether a request can be sent to the host. Only one probe
+            is let through when half-open.
+        """
+        with self._lock:
+            state = self.state
+            if state == "half-open":
+                # the next probe waits for another reset_timeout
+                self.opened = self._clock()
+            return state != "open"
+
+    def success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened = None
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.consecutive >= self.failures:
+                self.opened = self._clock()
+
+
+class LatencyStats:
+    """
+    Requests, errors and latencies of a host
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.samples = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.samples.append(seconds)
+
+    def summary(self):
+        """
+        :return: dict with the requests, errors and latency percentiles in
+            milliseconds of the last LATENCY_SAMPLES requests
+        """
+        with self._lock:
+            samples = np.array(self.samples) * 1000
+            summary = {"requests": self.requests, "errors": self.errors}
+        if len(samples):
+            summary.update(
+                {
+                    "mean": float(samples.mean()),
+                    "p50": float(np.percentile(samples, 50)),
+                    "p95": float(np.percentile(samples, 95)),
+                    "max": float(samples.max()),
+                }
+            )
+        return summary
+
+
+class Transport:
+    """
+    HTTP layer shared by the requests of a source: keep-alive connections
+    pooled per host, connect and read timeouts, retries with jittered
+    exponential backoff and failover from a server to its mirrors, skipping
+    the hosts whose circuit breaker is open. Responses with a client error
+    are returned for the source to interpret, server errors, 429 and
+    connection errors are retried.
+    """
+
+    def __init__(
+        self,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+        pool_size=DEFAULT_POOL_SIZE,
+        breaker_failures=DEFAULT_BREAKER_FAILURES,
+        breaker_reset=DEFAULT_BREAKER_RESET,
+        metrics=None,
+        source=None,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        """
+        :param connect_timeout: seconds to establish a connection
+        :param read_timeout: seconds to wait for each read of a response
+        :param retries: rounds of attempts over every server after the
+            first one
+        :param backoff: seconds before the first retry
+        :param pool_size: connections kept alive for each host
+        :param breaker_failures: consecutive failures opening the circuit of
+            a host
+        :param breaker_reset: seconds the circuit of a host stays open
+        :param metrics: beemeteo.metrics.Metrics to record the latency and
+            bytes downloaded of each host in
+        :param source: source name, to label the metrics with
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.metrics = metrics
+        self.source = source
+        self._clock = clock
+        self._sleep = sleep
+        self._sessions = {}
+        self._breakers = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, metrics=None, source=None):
+        """
+        :param config: dict with the optional connect-timeout, read-timeout,
+            retries, backoff, pool-size, breaker-failures and breaker-reset
+            keys
+        """
+        return cls(
+            connect_timeout=config.get(
+                "connect-timeout", DEFAULT_CONNECT_TIMEOUT
+            ),
+            read_timeout=config.get("read-timeout", DEFAULT_READ_TIMEOUT),
+            retries=config.get("retries", DEFAULT_RETRIES),
+            backoff=config.get("backoff", DEFAULT_BACKOFF),
+            pool_size=config.get("pool-size", DEFAULT_POOL_SIZE),
+            breaker_failures=config.get(
+                "breaker-failures", DEFAULT_BREAKER_FAILURES
+            ),
+            breaker_reset=config.get("breaker-reset", DEFAULT_BREAKER_RESET),
+            metrics=metrics,
+            source=source,
+        )
+
+    def _host_state(self, host):
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(
+                    self.breaker_failures, self.breaker_reset, self._clock
+                )
+                self._stats[host] = LatencyStats()
+            return self._breakers[host], self._stats[host]
+
+    def session(self, host):
+        """
+        :return: requests session of a host, keeping its connections alive
+        """
+        import requests
+
+        from requests.adapters import HTTPAdapter
+
+        with self._lock:
+            if host not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    def _delay(self, attempt):
+        """
+        Full jitter backoff, so that clients failing together do not retry
+        together
+        """
+        return random.uniform(0, min(self.backoff * 2**attempt, MAX_BACKOFF))
+
+    def _attempts(self, urls):
+        """
+        Servers to try, in order and round after round, with the breaker
+        and stats of their host, sleeping between rounds
+        """
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                self._sleep(self._delay(attempt - 1))
+            for url in urls:
+                yield (url,) + self._host_state(_host(url))
+
+    def _record(self, url, stats, start, size=None):
+        seconds = self._clock() - start
+        stats.record(seconds, error=size is None)
+        if self.metrics is not None:
+            labels = {"source": self.source, "host": _host(url)}
+            self.metrics.observe("http_request_seconds", seconds, **labels)
+            if size is None:
+                self.metrics.inc("http_errors", **labels)
+            elif size:
+                self.metrics.inc("http_bytes", size, **labels)
+
+    def _failed(self, url, error, breaker, stats, start):
+        self._record(url, stats, start)
+        breaker.failure()
+        logger.warning("Request to %s failed: %s" % (_host(url), error))
+
+    def get(self, urls, params=None):
+        """
+        :param urls: url, or list of the urls of a server and its mirrors
+            in order of preference
+        :param params: query parameters, as requests takes them
+        :return: requests response, with a status below 500 other than 429
+        :raises Exception: the error of the last attempt when all failed,
+            CircuitOpen when every server was skipped
+        """
+        import requests
+
+        error = None
+        for url, breaker, stats in self._attempts(urls):
+            if not breaker.allow():
+                error = error or CircuitOpen(
+                    "Circuit open for %s" % _host(url)
+                )
+                continue
+            start = self._clock()
+            try:
+                response = self.session(_host(url)).get(
+                    url, params=params, timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                error = e
+                self._failed(url, e, breaker, stats, start)
+                continue
+            if _retryable(response.status_code):
+                error = IOError(
+                    "HTTP %s from %s" % (response.status_code, url)
+                )
+                self._failed(url, error, breaker, stats, start)
+                continue
+            self._record(url, stats, start, len(response.content))
+            breaker.success()
+            return response
+        raise error
+
+    async def aget(self, session, urls, binary=False):
+        """
+        Same as get, without blocking the event loop
+
+        :param session: aiohttp client session
+        :param urls: url, or list of the urls of a server and its mirrors
+        :param binary: whether to read the body as bytes rather than text
+        :return: status and body of the response
+        """
+        import aiohttp
+
+        timeout = aiohttp.ClientTimeout(
+            sock_connect=self.timeout[0], sock_read=self.timeout[1]
+        )
+        error = None
+        urls = [urls] if not isinstance(urls, (list, tuple)) else urls
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                await asyncio.sleep(self._delay(attempt - 1))
+            for url in urls:
+                breaker, stats = self._host_state(_host(url))
+                if not breaker.allow():
+                    error = error or CircuitOpen(
+                        "Circuit open for %s" % _host(url)
+                    )
+                    continue
+                start = self._clock()
+                try:
+                    async with session.get(url, timeout=timeout) as response:
+                        status = response.status
+                        body = await (
+                            response.read() if binary else response.text()
+                        )
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                    self._failed(url, e, breaker, stats, start)
+                    continue
+                if _retryable(status):
+                    error = IOError("HTTP %s from %s" % (status, url))
+                    self._failed(url, error, breaker, stats, start)
+                    continue
+                self._record(
+                    url,
+                    stats,
+                    start,
+                    len(body if binary else body.encode("utf-8")),
+                )
+                breaker.success()
+                return status, body
+        raise error
+
+    def stats(self):
+        """
+        :return: dict of host to its latency summary and breaker state
+        """
+        with self._lock:
+            hosts = dict(self._stats)
+        return {
+            host: dict(stats.summary(), breaker=self._breakers[host].state)
+            for host, stats in hosts.items()
+        }
+
+    def log_stats(self):
+        for host, stats in sorted(self.stats().items()):
+            logger.info(
+                "HTTP %s: %d requests, %d errors, p50 %.0f ms, p95 %.0f ms, "
+                "circuit %s"
+                % (
+                    host,
+                    stats["requests"],
+                    stats["errors"],
+                    stats.get("p50", 0),
+                    stats.get("p95", 0),
+                    stats["breaker"],
+                )
+            )
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
@@ -0,0 +1,261 @@
+import bisect
+import contextlib
+import json
+import logging
+import threading
+import time
+
+from beemeteo.files import atomic_write
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the buckets of the timing histograms
+BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+PREFIX = "beemeteo_"
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _labels(labels, **extra):
+    items = list(labels) + sorted(extra.items())
+    if not items:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in items
+    )
+
+
+class Histogram:
+    """
+    Observations counted in fixed buckets, with their count, sum and maximum
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimates a quantile by interpolating within its bucket, as
+        Prometheus' histogram_quantile does
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """
+    Registry of the counters and timing histograms of the sources, keyed by
+    name and labels, such as the source and the stage of get_data
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """
+        Adds to a counter
+        """
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Records an observation in a histogram
+        """
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Records the seconds a block takes, whether it raises or not
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        with self._lock:
+            return self._histograms.get(_key(name, labels))
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def snapshot(self):
+        """
+        :return: dict with the counters and the summary of the histograms,
+            as lists of {"name", "labels", ...}
+        """
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, histogram.summary())
+                for key, histogram in self._histograms.items()
+            )
+        return {
+            "counters": [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in counters
+            ],
+            "histograms": [
+                dict({"name": name, "labels": dict(labels)}, **summary)
+                for (name, labels), summary in histograms
+            ],
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        """
+        :return: metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.count, h.sum))
+                for key, h in self._histograms.items()
+            )
+        typed = set()
+        for (name, labels), value in counters:
+            metric = PREFIX + name + "_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append("# TYPE %s counter" % metric)
+            lines.append("%s%s %s" % (metric, _labels(labels), value))
+        for (name, labels), (counts, count, total) in histograms:
+            metric = PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append("# TYPE %s histogram" % metric)
+            cumulative = 0
+            for bound, bucket in zip(list(BUCKETS) + ["+Inf"], counts):
+                cumulative += bucket
+                lines.append(
+                    "%s_bucket%s %d"
+                    % (metric, _labels(labels, le=bound), cumulative)
+                )
+            lines.append("%s_sum%s %s" % (metric, _labels(labels), total))
+            lines.append("%s_count%s %d" % (metric, _labels(labels), count))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _write(path, text):
+        # collectors reading the file never see it partially written
+        with atomic_write(path) as tmp:
+            with open(tmp, "w") as f:
+                f.write(text)
+
+    def write_json(self, path):
+        self._write(path, self.to_json())
+
+    def write_prometheus(self, path):
+        """
+        Writes a textfile for the node exporter's textfile collector
+        """
+        self._write(path, self.to_prometheus())
+
+    def summary(self):
+        """
+        :return: human readable table of the stages and counters
+        """
+        snapshot = self.snapshot()
+        lines = [
+            "%-40s %8s %10s %10s %10s %10s"
+            % ("timer", "count", "total s", "mean ms", "p95 ms", "max ms")
+        ]
+        for histogram in snapshot["histograms"]:
+            lines.append(
+                "%-40s %8d %10.3f %10.1f %10.1f %10.1f"
+                % (
+                    histogram["name"]
+                    + _labels(sorted(histogram["labels"].items())),
+                    histogram["count"],
+                    histogram["sum"],
+                    histogram["mean"] * 1000,
+                    histogram["p95"] * 1000,
+                    histogram["max"] * 1000,
+                )
+            )
+        lines.append("")
+        lines.append("%-51s %10s" % ("counter", "value"))
+        for counter in snapshot["counters"]:
+            lines.append(
+                "%-51s %10s"
+                % (
+                    counter["name"]
+                    + _labels(sorted(counter["labels"].items())),
+                    counter["value"],
+                )
+            )
+        return "\n".join(lines)
+
+
+# metrics of every source, unless given their own
+REGISTRY = Metrics()
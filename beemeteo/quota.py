@@ -0,0 +1,326 @@
+import asyncio
+import datetime
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """
+    Raised when the daily quota of a credential, or of all of them, is used.
+    Unlike other errors, retrying the same day does not help.
+    """
+
+
+def is_quota_exceeded(error):
+    """
+    :param error: exception raised by get_data, or by a source request
+    :return: whether it was raised because the quota was used
+    """
+    errors = getattr(error, "errors", None)
+    if errors:
+        return all(isinstance(e, QuotaExceeded) for e in errors.values())
+    return isinstance(error, QuotaExceeded)
+
+
+def _utc_today():
+    return datetime.datetime.utcnow().date().isoformat()
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing bursts of burst requests and rate requests per
+    second on average. Tokens are reserved ahead, so that concurrent callers
+    wait their turn instead of all retrying at once.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        """
+        :param rate: requests per second
+        :param burst: requests that can be made at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def delay(self):
+        """
+        :return: seconds until a token is available
+        """
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def take(self):
+        """
+        Reserves a token
+
+        :return: seconds to wait before using it
+        """
+        self._refill()
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+
+class _Usage:
+    """
+    Daily usage of each credential in SQLite, shared by the processes using
+    the same file. Kept in memory, for the process only, without a path.
+    """
+
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path or ":memory:",
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        with self._lock:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "scope TEXT NOT NULL, "
+                "credential TEXT NOT NULL, "
+                "day TEXT NOT NULL, "
+                "used INTEGER NOT NULL DEFAULT 0, "
+                "exhausted INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (scope, credential, day))"
+            )
+
+    def get(self, scope, day):
+        """
+        :return: dict of credential to (used, exhausted)
+        """
+        with self._lock:
+            return {
+                credential: (used, bool(exhausted))
+                for credential, used, exhausted in self._connection.execute(
+                    "SELECT credential, used, exhausted FROM usage "
+                    "WHERE scope = ? AND day = ?",
+                    (scope, day),
+                )
+            }
+
+    def increment(self, scope, credential, day, limit):
+        """
+        Counts a request, unless the credential is exhausted or at its limit
+
+        :return: whether the request was counted
+        """
+        with self._lock:
+            connection = self._connection
+            # other processes see either none or both statements
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "INSERT OR IGNORE INTO usage (scope, credential, day) "
+                    "VALUES (?, ?, ?)",
+                    (scope, credential, day),
+                )
+                counted = connection.execute(
+                    "UPDATE usage SET used = used + 1 WHERE scope = ? AND "
+                    "credential = ? AND day = ? AND exhausted = 0 AND "
+                    "(? IS NULL OR used < ?)",
+                    (scope, credential, day, limit, limit),
+                ).rowcount
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+            return counted == 1
+
+    def exhaust(self, scope, credential, day):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO usage (scope, credential, day, exhausted) "
+                "VALUES (?, ?, ?, 1) ON CONFLICT (scope, credential, day) "
+                "DO UPDATE SET exhausted = 1",
+                (scope, credential, day),
+            )
+
+
+class QuotaScheduler:
+    """
+    Spreads the requests to a source across its credentials, such as CAMS
+    registered mails or API keys. Each credential has a token bucket
+    limiting its rate and a daily request limit, whose usage is persisted so
+    that every process and run sharing the file respects it. Credentials
+    the source reports as exhausted are not used again until the next UTC
+    day.
+    """
+
+    def __init__(
+        self,
+        scope,
+        credentials,
+        daily_limit=None,
+        rate=None,
+        burst=1,
+        path=None,
+        clock=time.monotonic,
+        today=_utc_today,
+    ):
+        """
+        :param scope: name of the quota, usually the source's
+        :param credentials: list of credentials
+        :param daily_limit: requests per credential and day, unlimited when
+            None
+        :param rate: requests per second and credential, unlimited when None
+        :param burst: requests of a credential that can be made at once
+        :param path: SQLite file with the daily usage, in memory when None
+        """
+        if not credentials:
+            raise ValueError("%s needs at least one credential" % scope)
+        self.scope = scope
+        self.credentials = list(credentials)
+        self.daily_limit = daily_limit
+        self._buckets = {
+            credential: TokenBucket(rate, burst, clock)
+            for credential in self.credentials
+            if rate is not None
+        }
+        self._usage = _Usage(path)
+        self._today = today
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, scope, credentials, config):
+        """
+        :param config: dict with the optional daily-limit, rate, burst and
+            path keys
+        """
+        return cls(
+            scope,
+            credentials,
+            daily_limit=config.get("daily-limit"),
+            rate=config.get("rate"),
+            burst=config.get("burst", 1),
+            path=config.get("path"),
+        )
+
+    def _available(self, usage):
+        return [
+            credential
+            for credential in self.credentials
+            if not usage.get(credential, (0, False))[1]
+            and (
+                self.daily_limit is None
+                or usage.get(credential, (0, False))[0] < self.daily_limit
+            )
+        ]
+
+    def reserve(self):
+        """
+        Chooses the credential for a request, the one available soonest and
+        with the most quota left
+
+        :return: credential and seconds to wait before using it
+        :raises QuotaExceeded: when every credential is exhausted
+        """
+        with self._lock:
+            day = self._today()
+            while True:
+                usage = self._usage.get(self.scope, day)
+                available = self._available(usage)
+                if not available:
+                    raise QuotaExceeded(
+                        "Daily quota of every %s credential used" % self.scope
+                    )
+                credential = min(
+                    available,
+                    key=lambda c: (
+                        self._buckets[c].delay() if self._buckets else 0.0,
+                        usage.get(c, (0, False))[0],
+                    ),
+                )
+                # another process may have used its last request meanwhile
+                if self._usage.increment(
+                    self.scope, credential, day, self.daily_limit
+                ):
+                    break
+            delay = self._buckets[credential].take() if self._buckets else 0.0
+        return credential, delay
+
+    def acquire(self):
+        """
+        Waits for a credential to make a request with
+
+        :return: credential
+        :raises QuotaExceeded: when every credential is exhausted
+        """
+        credential, delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return credential
+
+    async def aacquire(self):
+        """
+        Waits for a credential without blocking the event loop, reserving
+        it in the executor as the usage file can be locked by others
+        """
+        credential, delay = await asyncio.get_running_loop().run_in_executor(
+            None, self.reserve
+        )
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return credential
+
+    def exhausted(self, credential):
+        """
+        Stops using a credential until the next day, as the source reported
+        its quota used
+        """
+        logger.info(
+            "[%s] daily quota reached for %s" % (self.scope, credential)
+        )
+        self._usage.exhaust(self.scope, credential, self._today())
+
+    def remaining(self):
+        """
+        :return: dict of credential to the requests left today, None when
+            unlimited
+        """
+        usage = self._usage.get(self.scope, self._today())
+        remaining = {}
+        for credential in self.credentials:
+            used, exhausted = usage.get(credential, (0, False))
+            if exhausted:
+                remaining[credential] = 0
+            elif self.daily_limit is None:
+                remaining[credential] = None
+            else:
+                remaining[credential] = max(0, self.daily_limit - used)
+        return remaining
+
+    def plan(self, requests):
+        """
+        Fits a number of requests in the quota
+
+        :param requests: requests to make
+        :return: dict with the requests that fit in what is left of today's
+            quota and the days needed to make all of them, today included
+        """
+        remaining = list(self.remaining().values())
+        if any(r is None for r in remaining):
+            return {"requests": requests, "today": requests, "days": 1}
+        left = sum(remaining)
+        today = min(requests, left)
+        days = 1
+        if requests > left:
+            daily = self.daily_limit * len(self.credentials)
+            days += int(math.ceil((requests - left) / float(daily)))
+        return {"requests": requests, "today": today, "days": days}
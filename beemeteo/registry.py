@@ -0,0 +1,104 @@
+import importlib
+import logging
+import threading
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# entry points group other packages add their sources to, as
+# name = "module:class"
+ENTRY_POINTS = "beemeteo.sources"
+# sources shipped with the package, as "module:class"
+BUILTIN = {
+    "cams": "beemeteo.sources.cams:CAMS",
+    "darksky": "beemeteo.sources.darksky:DarkSky",
+    "meteogalicia": "beemeteo.sources.meteogalicia:MeteoGalicia",
+}
+
+_sources = dict(BUILTIN)
+_loaded = {}
+_discovered = False
+_lock = threading.Lock()
+
+
+def _entry_points():
+    """
+    :return: dict of name to "module:class" of the installed plugins
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        return {}
+    found = entry_points()
+    if hasattr(found, "select"):
+        found = found.select(group=ENTRY_POINTS)
+    else:
+        found = found.get(ENTRY_POINTS, [])
+    return {entry_point.name: entry_point.value for entry_point in found}
+
+
+def _discover():
+    """
+    Adds the sources of the installed plugins, once per process. Sources
+    registered by the package or by register() take precedence.
+    """
+    global _discovered
+    with _lock:
+        if _discovered:
+            return
+        _discovered = True
+        for name, target in _entry_points().items():
+            if name in _sources:
+                logger.warning(
+                    "Source %s of %s ignored, %s is already registered"
+                    % (name, target, _sources[name])
+                )
+                continue
+            _sources[name] = target
+
+
+def register(name, source):
+    """
+    :param name: name the source is selected by
+    :param source: Source subclass, or "module:class" to import it lazily
+    """
+    with _lock:
+        _sources[name] = source
+        _loaded.pop(name, None)
+
+
+def names():
+    """
+    :return: names of every known source, sorted
+    """
+    _discover()
+    return sorted(_sources)
+
+
+def get(name):
+    """
+    Imports a source the first time it is asked for
+
+    :param name: source name
+    :return: Source subclass
+    :raises ValueError: for unknown names
+    """
+    if name not in _sources:
+        # plugins are only looked up for names the package does not know
+        _discover()
+    with _lock:
+        if name in _loaded:
+            return _loaded[name]
+        if name not in _sources:
+            raise ValueError(
+                "Unknown source %s, choose one of %s"
+                % (name, ", ".join(sorted(_sources)))
+            )
+        source = _sources[name]
+    if isinstance(source, str):
+        module, _, attribute = source.partition(":")
+        source = getattr(importlib.import_module(module), attribute)
+    with _lock:
+        _loaded[name] = source
+    return source
@@ -1,12 +1,41 @@
+import asyncio
 import datetime
+import logging
 
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 import pytz
 
+from beemeteo.cache import MemoryCache
+from beemeteo.cache import ParquetCache
+from beemeteo.hbase import DEFAULT_CHUNK_SIZE
 from beemeteo.hbase import HBase
+from beemeteo.http import Transport
+from beemeteo.metrics import REGISTRY
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class FetchError(Exception):
+    """
+    Raised when some days could not be retrieved from a source
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(FetchError, self).__init__(
+            "Could not retrieve %d day(s): %s"
+            % (
+                len(errors),
+                ", ".join(str(day.date()) for day in sorted(errors)),
+            )
+        )
 
 
 def _to_tz(ts, timezone):
@@ -28,22 +57,225 @@ def _local_dt_to_ts(dt):
     return int((dt - datetime.datetime(1970, 1, 1)) / timedelta(seconds=1))
 
 
+def _day_bounds(day, timezone, local_ts=True):
+    """
+    Timestamps delimiting a station's local day, as [start, end)
+
+    :param local_ts: whether timestamps count seconds in the station's local
+        time, as _dt_to_ts does, or actual UTC seconds
+    """
+    if local_ts:
+        start = _local_dt_to_ts(day)
+        return start, start + 24 * 3600
+    start = _to_tz(day, timezone)
+    end = _to_tz(day + timedelta(days=1), timezone)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def _expected_ts(bounds, ts_from, ts_to):
+    """
+    Hourly timestamps of a day within the requested range
+    """
+    start = max(bounds[0], ts_from)
+    start += -start % 3600
+    return np.arange(start, min(bounds[1], ts_to + 1), 3600)
+
+
+def _is_complete(data, expected):
+    if len(expected) == 0:
+        return True
+    if len(data) == 0:
+        return False
+    return bool(np.isin(expected, data["ts"].values).all())
+
+
+# Days get_data reads and fetches at once when streaming
+DEFAULT_CHUNK_DAYS = 31
+
+
+def _concat(frames):
+    frames = [frame for frame in frames if frame is not None]
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames) if frames else pd.DataFrame({})
+
+
+# text of missing values in rows written by older versions
+_MISSING = [b"", b"None", b"nan"]
+
+
+def _decode_column(values, dtype=None):
+    """
+    Decodes the values of an HBase column
+
+    :param values: bytes, b"nan" for missing cells
+    :param dtype: numpy dtype, numeric when possible if None
+    :return: array
+    """
+    raw = np.array(values)
+    if dtype is None or np.issubdtype(np.dtype(dtype), np.number):
+        try:
+            decoded = raw.astype(np.float64)
+        except ValueError:
+            try:
+                decoded = np.where(np.isin(raw, _MISSING), b"nan", raw).astype(
+                    np.float64
+                )
+            except ValueError:
+                if dtype is not None:
+                    raise
+                return _decode_column(values, object)
+        if dtype is None or (
+            np.issubdtype(np.dtype(dtype), np.integer)
+            and np.isnan(decoded).any()
+        ):
+            return decoded
+        return decoded.astype(dtype)
+    return np.array(
+        [None if v in _MISSING else v.decode("utf-8") for v in values],
+        dtype=object,
+    )
+
+
+def _split_range(date_from, date_to, chunk_days=None):
+    """
+    Splits a range of days into chunks of chunk_days days. Chunks share
+    their limits, as date_to is included.
+
+    :param date_from: start date
+    :param date_to: end date
+    :param chunk_days: days in each chunk, the whole range when None
+    :return: list of (day_from, day_to), in order
+    """
+    chunks = []
+    day_from = date_from
+    while True:
+        day_to = date_to
+        if chunk_days is not None:
+            day_to = min(day_from + timedelta(days=chunk_days), date_to)
+        chunks.append((day_from, day_to))
+        if day_to >= date_to:
+            return chunks
+        day_from = day_to
+
+
+def _row_key(latitude, longitude, ts):
+    return "%s~%s~%d" % (latitude, longitude, ts)
+
+
 class Source:
     def __init__(self, config):
         self.config = config
+        self._hbase = None
+        self._cache = None
+        self._memory_cache = None
+        # stage timings and counters, shared by every source by default
+        self.metrics = REGISTRY
+        # keep-alive connections, timeouts and retries of the requests
+        self.http = Transport.from_config(
+            self.config.get("http", {}),
+            metrics=self.metrics,
+            source=self.__class__.__name__,
+        )
 
     @property
     def hbase(self):
-        return (
-            HBase(
+        if "hbase" not in self.config:
+            return None
+        if self._hbase is None:
+            self._hbase = HBase(
                 self.config["hbase"]["host"],
                 self.config["hbase"]["port"],
                 self.config["hbase"]["db"],
+                pool_size=self.config["hbase"].get("pool-size"),
+                health_check=self.config["hbase"].get(
+                    "pool-health-check", False
+                ),
             )
-            if "hbase" in self.config
-            else None
+        return self._hbase
+
+    @property
+    def cache(self):
+        if "cache" not in self.config:
+            return None
+        if self._cache is None:
+            self._cache = ParquetCache(
+                self.config["cache"]["path"],
+                max_size=self.config["cache"].get("max-size"),
+            )
+        return self._cache
+
+    @property
+    def memory_cache(self):
+        if "memory-cache" not in self.config:
+            return None
+        if self._memory_cache is None:
+            self._memory_cache = MemoryCache(
+                max_size=self.config["memory-cache"].get("max-size"),
+            )
+        return self._memory_cache
+
+    def columns(self):
+        """
+        Columns of get_data's results, for writers that need them before
+        the first chunk. Measures not listed in the schema may still show
+        up.
+
+        :return: dict of column to numpy dtype
+        """
+        columns = {
+            "latitude": "float64",
+            "longitude": "float64",
+            "ts": "int64",
+        }
+        for column in sorted(self.schema):
+            columns[column] = self.schema[column]
+        return columns
+
+    def _timer(self, stage):
+        """
+        Records the time spent in a stage of get_data
+        """
+        return self.metrics.timer(
+            "stage_seconds", source=self.__class__.__name__, stage=stage
         )
 
+    def _count(self, name, value, **labels):
+        if value:
+            self.metrics.inc(
+                name, value, source=self.__class__.__name__, **labels
+            )
+
+    def _count_days(self, cached, before, daily, expected, errors):
+        """
+        Counts the days of a request by where their data came from
+
+        :param before: whether each day was complete before fetching
+        """
+        origins = {"cache": 0, "hbase": 0, "fetch": 0, "missing": 0}
+        for i, complete in enumerate(before):
+            if len(expected[i]) == 0:
+                # a day of the range that none of the requested hours falls in
+                continue
+            if complete:
+                origins["cache" if cached[i] is not None else "hbase"] += 1
+            elif _is_complete(daily[i], expected[i]):
+                origins["fetch"] += 1
+            else:
+                origins["missing"] += 1
+        for origin, count in origins.items():
+            self._count("days", count, origin=origin)
+        self._count("days", len(errors), origin="failed")
+
+    # Number of consecutive days a source can retrieve with one request
+    max_days_per_request = 1
+    # Maximum number of requests made to a source at the same time
+    max_concurrency = 4
+    # Whether ts are seconds in the station's local time (see _dt_to_ts)
+    local_ts = True
+    # Types of the measures, float64 (str when not numeric) if not listed
+    schema = {}
+
     @abstractmethod
     def _get_data_day(self, latitude, longitude, timezone, day):
         """
@@ -57,6 +289,25 @@ class Source:
         """
         pass
 
+    def _get_data_range(self, latitude, longitude, timezone, day_from, day_to):
+        """
+        Gets forecast data from source for consecutive days. Sources able to
+        retrieve several days with a single request override this method and
+        max_days_per_request.
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day_from: first day to retrieve data from
+        :param day_to: last day to retrieve data from
+        :return: all raw data for the given days
+        """
+        frames = [
+            self._get_data_day(latitude, longitude, timezone, day)
+            for day in pd.date_range(day_from, day_to, freq="d")
+        ]
+        return _concat(frames)
+
     def get_data(
         self,
         latitude,
@@ -65,6 +316,7 @@ class Source:
         date_from,
         date_to,
         hbase_table=None,
+        max_workers=None,
     ):
         """
         Gets forecast data from source
@@ -75,90 +327,700 @@ class Source:
         :param date_from: start date
         :param date_to: end date
         :param hbase_table: HBase table for source
+        :param max_workers: number of requests to make at the same time,
+            capped by the source's max_concurrency
+        :raises FetchError: when some days could not be retrieved
+        """
+        frames = list(
+            self.iter_data(
+                latitude,
+                longitude,
+                timezone,
+                date_from,
+                date_to,
+                hbase_table,
+                max_workers,
+                chunk_days=None,
+            )
+        )
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+
+    def iter_data(
+        self,
+        latitude,
+        longitude,
+        timezone,
+        date_from,
+        date_to,
+        hbase_table=None,
+        max_workers=None,
+        chunk_days=DEFAULT_CHUNK_DAYS,
+    ):
+        """
+        Gets forecast data from source a chunk of days at a time. Each chunk
+        is read from HBase and fetched only once the previous one has been
+        consumed, so memory does not grow with the range.
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param date_from: start date
+        :param date_to: end date
+        :param hbase_table: HBase table for source
+        :param max_workers: number of requests to make at the same time,
+            capped by the source's max_concurrency
+        :param chunk_days: days in each chunk, the whole range when None
+        :return: generator of dataframes sorted by ts, none of them
+            repeating the ts of the previous ones
+        :raises FetchError: when some days of a chunk could not be retrieved
+        """
+        carry = {}
+        last_ts = None
+        for day_from, day_to in _split_range(date_from, date_to, chunk_days):
+            data, carry = self._get_chunk(
+                latitude,
+                longitude,
+                timezone,
+                day_from,
+                day_to,
+                hbase_table,
+                max_workers,
+                carry,
+            )
+            if last_ts is not None:
+                data = data[data["ts"] > last_ts].reset_index(drop=True)
+            if len(data) > 0:
+                last_ts = data["ts"].iat[-1]
+            yield data
+
+    def _get_chunk(
+        self,
+        latitude,
+        longitude,
+        timezone,
+        date_from,
+        date_to,
+        hbase_table,
+        max_workers,
+        carry,
+    ):
+        """
+        Gets forecast data from source for a range of days
+
+        :param carry: daily frames of the previous chunk, by day
+        :return: station's data and the daily frames of its last days,
+            which the next chunk also covers
+        """
+        days, bounds, ts_from, ts_to = self._days(timezone, date_from, date_to)
+        expected = [_expected_ts(b, ts_from, ts_to) for b in bounds]
+        cached, daily = self._stored(
+            latitude, longitude, days, bounds, expected, hbase_table
+        )
+        for i, day in enumerate(days):
+            if day in carry and not _is_complete(daily[i], expected[i]):
+                daily[i] = cached[i] = carry[day]
+        before = [_is_complete(d, e) for d, e in zip(daily, expected)]
+        errors = {}
+        for (first, last), fetched in self._fetch(
+            latitude, longitude, timezone, days, daily, expected, max_workers
+        ):
+            with self._timer("merge"):
+                self._update(
+                    days, bounds, daily, expected, first, last, fetched, errors
+                )
+        self._count_days(cached, before, daily, expected, errors)
+        self._save_to_cache(latitude, longitude, days, cached, daily)
+        if errors:
+            raise FetchError(errors)
+        with self._timer("assemble"):
+            data = self._assemble(daily, latitude, longitude, ts_from, ts_to)
+        return data, dict(zip(days[-2:], daily[-2:]))
+
+    async def aget_data(
+        self,
+        latitude,
+        longitude,
+        timezone,
+        date_from,
+        date_to,
+        hbase_table=None,
+        session=None,
+        semaphore=None,
+    ):
+        """
+        Gets forecast data from source without blocking the event loop.
+        Requires aiohttp.
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param date_from: start date
+        :param date_to: end date
+        :param hbase_table: HBase table for source
+        :param session: aiohttp client session, a new one when None
+        :param semaphore: asyncio semaphore bounding the requests in flight,
+            which can be shared by several calls. Bounded by the source's
+            max_concurrency when None.
+        :raises FetchError: when some days could not be retrieved
+        """
+        if session is None:
+            import aiohttp
+
+            async with aiohttp.ClientSession() as session:
+                return await self.aget_data(
+                    latitude,
+                    longitude,
+                    timezone,
+                    date_from,
+                    date_to,
+                    hbase_table,
+                    session,
+                    semaphore,
+                )
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        days, bounds, ts_from, ts_to = self._days(timezone, date_from, date_to)
+        expected = [_expected_ts(b, ts_from, ts_to) for b in bounds]
+        cached, daily = await asyncio.get_running_loop().run_in_executor(
+            None,
+            self._stored,
+            latitude,
+            longitude,
+            days,
+            bounds,
+            expected,
+            hbase_table,
+        )
+        before = [_is_complete(d, e) for d, e in zip(daily, expected)]
+        ranges = self._plan(daily, expected)
+        results = await asyncio.gather(
+            *[
+                self._atry_get_data_range(
+                    session,
+                    semaphore,
+                    latitude,
+                    longitude,
+                    timezone,
+                    days[first],
+                    days[last],
+                )
+                for first, last in ranges
+            ]
+        )
+        errors = {}
+        for (first, last), fetched in zip(ranges, results):
+            with self._timer("merge"):
+                self._update(
+                    days, bounds, daily, expected, first, last, fetched, errors
+                )
+        self._count_days(cached, before, daily, expected, errors)
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            self._save_to_cache,
+            latitude,
+            longitude,
+            days,
+            cached,
+            daily,
+        )
+        if errors:
+            raise FetchError(errors)
+        with self._timer("assemble"):
+            return self._assemble(daily, latitude, longitude, ts_from, ts_to)
+
+    async def _aget_data_day(
+        self, session, latitude, longitude, timezone, day
+    ):
+        """
+        Gets one day of forecast data from source without blocking the event
+        loop. Runs _get_data_day in the default executor unless the source
+        provides a native implementation.
+
+        :param session: aiohttp client session
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day: day to retrieve data from
+        :return: all raw data for a given day
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._get_data_day, latitude, longitude, timezone, day
+        )
+
+    async def _aget_data_range(
+        self, session, latitude, longitude, timezone, day_from, day_to
+    ):
+        """
+        Gets forecast data from source for consecutive days without blocking
+        the event loop
+
+        :param session: aiohttp client session
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day_from: first day to retrieve data from
+        :param day_to: last day to retrieve data from
+        :return: all raw data for the given days
+        """
+        frames = [
+            await self._aget_data_day(
+                session, latitude, longitude, timezone, day
+            )
+            for day in pd.date_range(day_from, day_to, freq="d")
+        ]
+        return _concat(frames)
+
+    async def _atry_get_data_range(
+        self,
+        session,
+        semaphore,
+        latitude,
+        longitude,
+        timezone,
+        day_from,
+        day_to,
+    ):
+        async with semaphore:
+            try:
+                with self._timer("fetch"):
+                    data = await self._aget_data_range(
+                        session,
+                        latitude,
+                        longitude,
+                        timezone,
+                        day_from,
+                        day_to,
+                    )
+                self._count("rows", len(data), operation="fetch")
+                return data
+            except Exception as e:
+                logger.error(
+                    "Could not retrieve %s from %s to %s: %s"
+                    % (
+                        self.__class__.__name__,
+                        day_from.date(),
+                        day_to.date(),
+                        e,
+                    )
+                )
+                return e
+
+    def _update(
+        self, days, bounds, daily, expected, first, last, fetched, errors
+    ):
+        """
+        Fills the incomplete days with the data fetched for a range, or
+        records the error that prevented fetching it
+        """
+        if isinstance(fetched, Exception):
+            for i in range(first, last + 1):
+                errors[days[i].to_pydatetime()] = fetched
+            return
+        fetched = self._apply_schema(fetched)
+        for i, day_data in self._split_days(fetched, bounds).items():
+            if _is_complete(daily[i], expected[i]):
+                continue
+            daily[i] = (
+                pd.concat([daily[i], day_data])
+                .drop_duplicates(subset=["ts"], keep="first")
+                .sort_values(by=["ts"])
+                .reset_index(drop=True)
+                if len(daily[i]) > 0
+                else day_data
+            )
+
+    @staticmethod
+    def _assemble(daily, latitude, longitude, ts_from, ts_to):
+        """
+        Builds the requested range out of daily frames in a single pass
+
+        :param daily: frames of consecutive days, sorted by ts
+        :return: station's data, sorted by ts
+        """
+        frames = []
+        for daily_data in daily:
+            if len(daily_data) == 0:
+                continue
+            # days are consecutive, so none of the following ones is needed
+            if daily_data["ts"].iat[0] > ts_to:
+                break
+            frames.append(daily_data)
+        key_cols = ["latitude", "longitude", "ts"]
+        if not frames:
+            return pd.DataFrame(columns=key_cols)
+        data = pd.concat(frames, ignore_index=True, copy=False)
+        data = data[(data["ts"] >= ts_from) & (data["ts"] <= ts_to)]
+        data = data.drop_duplicates(subset=["ts"], keep="first")
+        data = data.assign(latitude=latitude, longitude=longitude)
+
+        return data[
+            key_cols + sorted(data.columns[~data.columns.isin(key_cols)])
+        ].reset_index(drop=True)
+
+    def plan(
+        self,
+        latitude,
+        longitude,
+        timezone,
+        date_from,
+        date_to,
+        hbase_table=None,
+    ):
+        """
+        Works out the requests get_data would make to the source, given the
+        data already stored
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param date_from: start date
+        :param date_to: end date
+        :param hbase_table: HBase table for source
+        :return: list of (first day, last day) tuples, one for each request
+        """
+        days, bounds, ts_from, ts_to = self._days(timezone, date_from, date_to)
+        expected = [_expected_ts(b, ts_from, ts_to) for b in bounds]
+        _, daily = self._stored(
+            latitude, longitude, days, bounds, expected, hbase_table
+        )
+        return [
+            (days[first].to_pydatetime(), days[last].to_pydatetime())
+            for first, last in self._plan(daily, expected)
+        ]
+
+    def _days(self, timezone, date_from, date_to):
+        """
+        Days to go through to cover a date range in the station's timezone
+
+        :return: days, their [start, end) timestamps and the range limits
         """
-        data = None
         days = pd.date_range(
             date_from - datetime.timedelta(days=1), date_to, freq="d"
         )
-        ts_from = _local_dt_to_ts(date_from)
-        ts_to = _local_dt_to_ts(date_to)
-        for day in days:
-            ts = _local_dt_to_ts(day.to_pydatetime())
+        bounds = np.array(
+            [
+                _day_bounds(day.to_pydatetime(), timezone, self.local_ts)
+                for day in days
+            ],
+            dtype=np.int64,
+        )
+        return (
+            days,
+            bounds,
+            _local_dt_to_ts(date_from),
+            _local_dt_to_ts(date_to),
+        )
+
+    def _fetch(
+        self, latitude, longitude, timezone, days, daily, expected, max_workers
+    ):
+        """
+        Requests the planned ranges to the source
+
+        :return: generator of ((first, last), data) in plan order, where data
+            is the exception raised when the request failed
+        """
+        ranges = self._plan(daily, expected)
+        workers = min(max_workers or 1, self.max_concurrency, len(ranges))
+        if workers <= 1:
+            for first, last in ranges:
+                # a previous request may already have brought these days, e.g.
+                # forecasts covering the following days. The caller updates
+                # daily before resuming this generator.
+                if all(
+                    _is_complete(daily[i], expected[i])
+                    for i in range(first, last + 1)
+                ):
+                    continue
+                yield (first, last), self._try_get_data_range(
+                    latitude, longitude, timezone, days[first], days[last]
+                )
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._try_get_data_range,
+                    latitude,
+                    longitude,
+                    timezone,
+                    days[first],
+                    days[last],
+                )
+                for first, last in ranges
+            ]
+            for (first, last), future in zip(ranges, futures):
+                yield (first, last), future.result()
+
+    def _try_get_data_range(
+        self, latitude, longitude, timezone, day_from, day_to
+    ):
+        try:
+            with self._timer("fetch"):
+                data = self._get_data_range(
+                    latitude, longitude, timezone, day_from, day_to
+                )
+            self._count("rows", len(data), operation="fetch")
+            return data
+        except Exception as e:
+            logger.error(
+                "Could not retrieve %s from %s to %s: %s"
+                % (self.__class__.__name__, day_from.date(), day_to.date(), e)
+            )
+            return e
+
+    def _plan(self, daily, expected):
+        """
+        Merges consecutive incomplete days into ranges, split into chunks of
+        at most max_days_per_request days
+
+        :param daily: daily frames already available
+        :param expected: timestamps expected for each day
+        :return: list of (first, last) day indexes
+        """
+        ranges = []
+        for i, (day_data, day_expected) in enumerate(zip(daily, expected)):
+            if _is_complete(day_data, day_expected):
+                continue
             if (
-                data is not None
-                and len(data.query("ts >= {}".format(ts_to))) > 0
+                ranges
+                and ranges[-1][1] == i - 1
+                and (
+                    self.max_days_per_request is None
+                    or i - ranges[-1][0] < self.max_days_per_request
+                )
             ):
-                continue
-            daily_data = self._get_from_hbase(
-                latitude, longitude, ts, hbase_table
+                ranges[-1][1] = i
+            else:
+                ranges.append([i, i])
+        return [tuple(r) for r in ranges]
+
+    @staticmethod
+    def _split_days(data, bounds):
+        """
+        Splits data into one frame per day
+
+        :param data: raw data with a ts column
+        :param bounds: array of [start, end) timestamps for each day
+        :return: dict of daily frames by index of the day in bounds, only
+            for the days with data
+        """
+        if len(data) == 0:
+            return {}
+        data = data.sort_values(by=["ts"], kind="mergesort")
+        ts = data["ts"].values
+        starts, ends = bounds[:, 0], bounds[:, 1]
+        # only the days overlapping the data
+        first = ends.searchsorted(ts[0], side="right")
+        last = starts.searchsorted(ts[-1], side="right")
+        lo = ts.searchsorted(starts[first:last])
+        hi = ts.searchsorted(ends[first:last])
+        return {
+            first + i: data.iloc[start:end]
+            for i, (start, end) in enumerate(zip(lo, hi))
+            if end > start
+        }
+
+    def _daily(self, data, bounds):
+        """
+        Splits data into one frame per day
+
+        :return: list of daily frames, aligned with bounds
+        """
+        empty = pd.DataFrame({})
+        split = self._split_days(data, bounds)
+        return [split.get(i, empty) for i in range(len(bounds))]
+
+    def _stored(
+        self, latitude, longitude, days, bounds, expected, hbase_table
+    ):
+        """
+        Gets the data already available for each day, first from the caches
+        and then, for the days they do not complete, from HBase
+
+        :return: days read from the cache (None when missing) and the daily
+            frames
+        """
+        with self._timer("cache"):
+            cached = self._get_from_cache(latitude, longitude, days)
+        missing = [
+            i
+            for i, data in enumerate(cached)
+            if data is None or not _is_complete(data, expected[i])
+        ]
+        if not missing:
+            return cached, cached[:]
+        with self._timer("hbase"):
+            stored = self._get_from_hbase(
+                latitude,
+                longitude,
+                bounds[missing[0]][0],
+                bounds[missing[-1]][1] - 1,
+                hbase_table,
             )
-            if len(daily_data) < 24:
-                daily_data = self._get_data_day(
-                    latitude, longitude, timezone, day
+        self._count("rows", len(stored), operation="hbase")
+        daily = self._daily(stored, bounds)
+        for i, data in enumerate(cached):
+            if data is not None and (
+                len(daily[i]) == 0 or _is_complete(data, expected[i])
+            ):
+                daily[i] = data
+        return cached, daily
+
+    def _get_from_cache(self, latitude, longitude, days):
+        """
+        Gets the days kept in memory or, failing that, in the local cache
+
+        :return: list of daily frames aligned with days, None for the days
+            not cached
+        """
+        source = self.__class__.__name__
+        cached = [None] * len(days)
+        for i, day in enumerate(days):
+            if self.memory_cache is not None:
+                cached[i] = self.memory_cache.get(
+                    source, latitude, longitude, day
                 )
-            data = (
-                pd.merge(data, daily_data, how="outer")
-                if data is not None
-                else daily_data
-            )
-        data["latitude"] = latitude
-        data["longitude"] = longitude
-        data = data.query(
-            "ts >= {} and ts <= {}".format(ts_from, ts_to)
-        ).sort_values(by=["ts"])
+            if cached[i] is None and self.cache is not None:
+                cached[i] = self.cache.get(source, latitude, longitude, day)
+                if cached[i] is not None and self.memory_cache is not None:
+                    self.memory_cache.put(
+                        source, latitude, longitude, day, cached[i]
+                    )
+        return cached
 
-        key_cols = ["latitude", "longitude", "ts"]
-        data = data.set_index(key_cols)[
-            sorted(data.columns[~data.columns.isin(key_cols)])
-        ].reset_index()
+    def _save_to_cache(self, latitude, longitude, days, cached, daily):
+        """
+        Keeps the days that were not read from the caches. Those that can
+        still change are only kept in memory, until their ttl expires.
+        """
+        if self.cache is None and self.memory_cache is None:
+            return
+        source = self.__class__.__name__
+        for day, before, data in zip(days, cached, daily):
+            if len(data) == 0 or data is before:
+                continue
+            ttl = self.ttl(day)
+            if self.memory_cache is not None:
+                self.memory_cache.put(
+                    source, latitude, longitude, day, data, ttl
+                )
+            if self.cache is not None and ttl is None:
+                self.cache.put(source, latitude, longitude, day, data)
+
+    def ttl(self, day):
+        """
+        Seconds the data of a day is valid, None when it can no longer
+        change
 
-        return data
+        :param day: day in the station's timezone
+        """
+        return None
 
-    def _get_from_hbase(self, latitude, longitude, ts, hbase_table):
+    def _get_from_hbase(
+        self, latitude, longitude, ts_from, ts_to, hbase_table
+    ):
         """
-        Gets all raw data from HBase for a given day
+        Gets all raw data from HBase for a given time range with a single
+        scan bounded to the station's rows
 
         :param latitude: station's latitude
         :param longitude: station's longitude
-        :param ts: a given timestamp
+        :param ts_from: first timestamp to retrieve
+        :param ts_to: last timestamp to retrieve
         :param hbase_table: HBase table for source
         :return:
         """
         if hbase_table is not None:
-            table = self.hbase.get_table(hbase_table, {"info": {}})
-            measures = []
-            for row_key, data in table.scan(
-                columns=["info"],
-                row_start="%s~%s~%d" % (latitude, longitude, ts),
-            ):
-                new_data = data.copy()
-                for key, n_key in zip(
-                    data.keys(),
-                    [
-                        key.decode("utf-8").replace("info:", "")
-                        for key in data.keys()
-                    ],
+            config = self.config["hbase"]
+            keys = []
+            rows = []
+            with self.hbase.pooled_table(hbase_table, {"info": {}}) as table:
+                for row_key, data in table.scan(
+                    columns=["info"],
+                    # timestamps have the same number of digits, so the
+                    # lexicographic order of row keys is also chronological
+                    row_start=_row_key(latitude, longitude, ts_from),
+                    row_stop=_row_key(latitude, longitude, ts_to + 1),
+                    batch_size=config.get("scan-batch-size", 1000),
+                    scan_batching=config.get("scan-batching"),
                 ):
-                    new_data[n_key] = new_data.pop(key).decode("utf-8")
-                new_data["latitude"] = latitude
-                new_data["longitude"] = longitude
-                new_data["ts"] = int(row_key.decode("UTF-8").split("~")[2])
-                measures.append(new_data)
-            return pd.DataFrame(measures)
+                    keys.append(row_key)
+                    rows.append(data)
+            return self._decode(latitude, longitude, keys, rows)
         return pd.DataFrame({})
 
+    def _decode(self, latitude, longitude, keys, rows):
+        """
+        Builds a typed frame out of HBase rows, one column at a time
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param keys: row keys
+        :param rows: dicts of qualifier to value, aligned with keys
+        :return: dataframe
+        """
+        if not keys:
+            return pd.DataFrame({})
+        prefix = len(_row_key(latitude, longitude, 0)) - 1
+        data = {
+            "latitude": np.full(len(keys), latitude),
+            "longitude": np.full(len(keys), longitude),
+            "ts": np.array([key[prefix:] for key in keys]).astype(np.int64),
+        }
+        qualifiers = set()
+        for row in rows:
+            qualifiers.update(row)
+        for qualifier in sorted(qualifiers):
+            column = qualifier.decode("utf-8").split(":", 1)[1]
+            data[column] = _decode_column(
+                [row.get(qualifier, b"nan") for row in rows],
+                self.schema.get(column),
+            )
+        return pd.DataFrame(data)
+
+    def _apply_schema(self, data):
+        """
+        Casts fetched data to the source's schema, so that it has the same
+        types as data read from HBase
+        """
+        if len(data) == 0:
+            return data
+        types = {"ts": np.int64}
+        for column in data.columns:
+            dtype = self.schema.get(column)
+            if dtype is None:
+                if column in ("latitude", "longitude") or not (
+                    pd.api.types.is_numeric_dtype(data[column])
+                ):
+                    continue
+                dtype = np.float64
+            elif np.issubdtype(np.dtype(dtype), np.integer) and (
+                data[column].isna().any()
+            ):
+                dtype = np.float64
+            types.setdefault(column, dtype)
+        return data.astype(types)
+
     def save(self, data, hbase_table):
         """
         Save source raw data to HBase
 
         :param data: source raw data
         :param hbase_table: HBase table for source
-        :return:
+        :return: number of rows saved
         """
-        table = self.hbase.get_table(hbase_table, {"info": {}})
-        self.hbase.save(
-            table,
-            data.to_dict("records"),
-            [("info", "all")],
-            row_fields=["latitude", "longitude", "ts"],
-        )
+        config = self.config["hbase"]
+        with self._timer("save"):
+            rows = self.hbase.save_frame(
+                hbase_table,
+                data,
+                "info",
+                row_fields=["latitude", "longitude", "ts"],
+                chunk_size=config.get("save-chunk-size", DEFAULT_CHUNK_SIZE),
+                workers=config.get("save-workers", 1),
+            )
+        self._count("rows", rows, operation="save")
+        return rows
@@ -1,11 +1,13 @@
 import datetime
 import io
 import logging
+import re
 
 import pandas as pd
 import pytz
-import requests
 
+from beemeteo.quota import QuotaExceeded
+from beemeteo.quota import QuotaScheduler
 from beemeteo.sources import Source
 from beemeteo.sources import _dt_to_ts
 from beemeteo.sources import _to_tz
@@ -18,15 +20,50 @@ logger = logging.getLogger(__name__)
 VERSION = "1.0.0"
 SODA_SERVER_SERVICE = "http://www.soda-is.com/service/wps"
 SODA_SERVER_MIRROR_SERVICE = "http://pro.soda-is.com/service/wps"
+# errors of the service telling that the daily quota of a mail is used
+QUOTA_ERRORS = re.compile(
+    r"maximum number of (daily )?requests|quota|limit (is )?reached",
+    re.IGNORECASE,
+)
 
 
 class CAMS(Source):
+    max_concurrency = 2
+    schema = {
+        column: "float64"
+        for column in [
+            "TOA",
+            "Clear sky GHI",
+            "Clear sky BHI",
+            "Clear sky DHI",
+            "Clear sky BNI",
+            "GHI",
+            "BHI",
+            "DHI",
+            "BNI",
+            "Reliability",
+        ]
+    }
+
     def __init__(self, config):
         super(CAMS, self).__init__(config)
         self.cams_registered_mails = self.config["cams"][
             "cams-registered-mails"
         ]
         assert len(self.cams_registered_mails) > 0
+        self.quota = QuotaScheduler.from_config(
+            "CAMS",
+            self.cams_registered_mails,
+            self.config["cams"].get("quota", {}),
+        )
+        # SoDa serves any span with one request, bounded to keep responses
+        # small enough
+        self.max_days_per_request = self.config["cams"].get(
+            "max-days-per-request", 31
+        )
+        self.servers = self.config["cams"].get(
+            "servers", [SODA_SERVER_SERVICE, SODA_SERVER_MIRROR_SERVICE]
+        )
 
     def _get_data_day(self, latitude, longitude, timezone, day):
         """
@@ -39,42 +76,139 @@ class CAMS(Source):
         :param day: day to retrieve data from
         :return: all raw data for a given day
         """
-        date_begin = _to_tz(day, timezone)
-        date_end = _to_tz(
-            day + relativedelta(days=1) - relativedelta(seconds=1), timezone
-        )
-        for mail in self.cams_registered_mails:
-            data = self._request(
-                mail, latitude, longitude, date_begin, date_end
-            )
-            if data is not None:
-                logger.info(
-                    "[CAMS] %s retrieved info for %s" % (mail, date_begin)
-                )
-                data["ts"] = _dt_to_ts(
-                    pd.to_datetime(data["time"]).dt.tz_convert(timezone),
-                    timezone,
+        return self._get_data_range(latitude, longitude, timezone, day, day)
+
+    def _get_data_range(self, latitude, longitude, timezone, day_from, day_to):
+        """
+        Gets solar radiation information for a location on consecutive days
+        with a single request
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day_from: first day to retrieve data from
+        :param day_to: last day to retrieve data from
+        :return: all raw data for the given days
+        """
+        date_begin, date_end = self._dates(timezone, day_from, day_to)
+        while True:
+            mail = self.quota.acquire()
+            try:
+                data = self._request(
+                    mail, latitude, longitude, date_begin, date_end
                 )
-                data.drop(["time"], axis=1, inplace=True)
-                return data
-            else:
-                logger.info(
-                    "[CAMS] maximum number of daily requests reached for %s"
-                    % mail
+            except QuotaExceeded:
+                self.quota.exhausted(mail)
+                continue
+            logger.info(
+                "[CAMS] %s retrieved info from %s to %s"
+                % (mail, date_begin, date_end)
+            )
+            return self._to_ts(data, timezone)
+
+    async def _aget_data_day(
+        self, session, latitude, longitude, timezone, day
+    ):
+        return await self._aget_data_range(
+            session, latitude, longitude, timezone, day, day
+        )
+
+    async def _aget_data_range(
+        self, session, latitude, longitude, timezone, day_from, day_to
+    ):
+        """
+        Gets solar radiation information for a location on consecutive days
+        with a single request, without blocking the event loop
+
+        :param session: aiohttp client session
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day_from: first day to retrieve data from
+        :param day_to: last day to retrieve data from
+        :return: all raw data for the given days
+        """
+        date_begin, date_end = self._dates(timezone, day_from, day_to)
+        while True:
+            mail = await self.quota.aacquire()
+            try:
+                data = await self._arequest(
+                    session, mail, latitude, longitude, date_begin, date_end
                 )
-                self.cams_registered_mails.remove(mail)
+            except QuotaExceeded:
+                self.quota.exhausted(mail)
+                continue
+            logger.info(
+                "[CAMS] %s retrieved info from %s to %s"
+                % (mail, date_begin, date_end)
+            )
+            return self._to_ts(data, timezone)
 
-    def _request_server(
-        self,
-        server,
+    async def _arequest(
+        self, session, username, latitude, longitude, date_begin, date_end
+    ):
+        import yarl
+
+        params = self._params(
+            username, latitude, longitude, date_begin, date_end
+        )
+        # parameters are already encoded as the service expects them
+        status, text = await self.http.aget(
+            session,
+            [
+                yarl.URL("%s?%s" % (service, params), encoded=True)
+                for service in self.servers
+            ],
+        )
+        self._check(status, text)
+        with self._timer("parse"):
+            return self._parse(text)
+
+    @staticmethod
+    def _check(status, text):
+        """
+        Tells a used quota, which is not worth retrying with the same mail,
+        apart from other errors, which other servers or later attempts may
+        not hit
+
+        :raises QuotaExceeded: when the quota of the mail is used
+        :raises IOError: for any other error
+        """
+        if status == 200:
+            return
+        if QUOTA_ERRORS.search(text):
+            raise QuotaExceeded(text.strip()[:200])
+        raise IOError("HTTP %s: %s" % (status, text.strip()[:200]))
+
+    @staticmethod
+    def _dates(timezone, day_from, day_to):
+        return (
+            _to_tz(day_from, timezone),
+            _to_tz(
+                day_to + relativedelta(days=1) - relativedelta(seconds=1),
+                timezone,
+            ),
+        )
+
+    @staticmethod
+    def _to_ts(data, timezone):
+        data["ts"] = _dt_to_ts(
+            pd.to_datetime(data["time"]).dt.tz_convert(timezone),
+            timezone,
+        )
+        data.drop(["time"], axis=1, inplace=True)
+        return data
+
+    @staticmethod
+    def _params(
         username,
         latitude,
         longitude,
         date_begin,
         date_end,
-        altitude,
-        time_ref,
-        summarization,
+        altitude=-999,
+        time_ref="UT",
+        summarization="PT01H",
     ):
         payload = {
             "Service": "WPS",
@@ -97,12 +231,7 @@ class CAMS(Source):
             ),
             "RawDataOutput": "irradiation",
         }
-
-        params = "&".join("%s=%s" % (k, v) for k, v in payload.items())
-        response = requests.get(server, params=params)
-        if response.status_code != 200:
-            raise Exception
-        return self._parse_request(response)
+        return "&".join("%s=%s" % (k, v) for k, v in payload.items())
 
     def _request(
         self,
@@ -115,31 +244,45 @@ class CAMS(Source):
         time_ref="UT",
         summarization="PT01H",
     ):
-        for service in [SODA_SERVER_SERVICE, SODA_SERVER_MIRROR_SERVICE]:
-            try:
-                response = self._request_server(
-                    service,
-                    username,
-                    latitude,
-                    longitude,
-                    date_begin,
-                    date_end,
-                    altitude,
-                    time_ref,
-                    summarization,
-                )
-                return response
-            except Exception:
-                pass
+        """
+        Requests the service, failing over from a server to the next ones
 
-    @staticmethod
-    def _parse_request(response):
+        :raises QuotaExceeded: when the quota of the mail is used
+        :raises Exception: the error of the last server, when none of them
+            answered
+        """
+        params = self._params(
+            username,
+            latitude,
+            longitude,
+            date_begin,
+            date_end,
+            altitude,
+            time_ref,
+            summarization,
+        )
+        response = self.http.get(self.servers, params=params)
+        self._check(response.status_code, response.text)
+        with self._timer("parse"):
+            return self._parse_request(response)
+
+    @classmethod
+    def _parse_request(cls, response):
         """Parse the request output into a pandas DataFrame.
         :param response: api response
         :return: dataframe
         """
 
-        data = io.StringIO(response.text.split("#")[-1])
+        return cls._parse(response.text)
+
+    @staticmethod
+    def _parse(text):
+        """Parse the service output into a pandas DataFrame.
+        :param text: api response body
+        :return: dataframe
+        """
+
+        data = io.StringIO(text.split("#")[-1])
         df = pd.read_csv(data, delimiter=";")
         time_column_name = " Observation period"
         df[time_column_name] = pd.to_datetime(
@@ -1,13 +1,71 @@
-import forecastio
+import datetime
+import json
+
 import pandas as pd
 
+from beemeteo.quota import QuotaExceeded
+from beemeteo.quota import QuotaScheduler
+from beemeteo.sources import FetchError
 from beemeteo.sources import Source
 
 
+DARKSKY_SERVER = "https://api.darksky.net/forecast"
+# error of the 403 responses to keys over their daily quota
+DAILY_LIMIT_ERROR = "daily usage limit exceeded"
+# Seconds a day that is not over yet is kept in memory
+FORECAST_TTL = 3600
+
+
 class DarkSky(Source):
+    max_concurrency = 8
+    local_ts = False
+    # every field of DarkSky's hourly data points, some of which are only
+    # there on some days
+    schema = dict(
+        {
+            column: "float64"
+            for column in [
+                "apparentTemperature",
+                "cloudCover",
+                "dewPoint",
+                "humidity",
+                "ozone",
+                "precipAccumulation",
+                "precipIntensity",
+                "precipIntensityError",
+                "precipProbability",
+                "pressure",
+                "temperature",
+                "visibility",
+                "windGust",
+                "windSpeed",
+            ]
+        },
+        icon="object",
+        precipType="object",
+        summary="object",
+        uvIndex="int64",
+        windBearing="int64",
+    )
+
     def __init__(self, config):
         super(DarkSky, self).__init__(config)
-        self.api_key = self.config["darksky"]["api-key"]
+        config = self.config["darksky"]
+        # several keys share the requests, each with its own daily quota
+        self.api_keys = config.get("api-keys") or [config["api-key"]]
+        self.api_key = self.api_keys[0]
+        self.server = config.get("url", DARKSKY_SERVER)
+        self.quota = QuotaScheduler.from_config(
+            "DarkSky", self.api_keys, config.get("quota", {})
+        )
+
+    def ttl(self, day):
+        """
+        Days that are not over yet are forecasts, which keep changing. The
+        day is local, so a day of margin covers the station's offset.
+        """
+        end = day + datetime.timedelta(days=2)
+        return FORECAST_TTL if end > datetime.datetime.utcnow() else None
 
     def _get_data_day(self, latitude, longitude, timezone, day):
         """
@@ -19,20 +77,93 @@ class DarkSky(Source):
         :param day: day to retrieve data from
         :return: all raw data for a given day
         """
-        hourly = []
-        for item in (
-            forecastio.load_forecast(
-                self.api_key,
-                latitude,
-                longitude,
-                time=timezone.localize(day),
-                units="si",
+        import forecastio.models
+
+        while True:
+            api_key = self.quota.acquire()
+            response = self.http.get(
+                self._url(latitude, longitude, timezone, day, api_key)
+            )
+            try:
+                self._check(day, response.status_code, response.text)
+            except QuotaExceeded:
+                self.quota.exhausted(api_key)
+                continue
+            response.raise_for_status()
+            break
+        with self._timer("parse"):
+            # the same model forecastio.manual builds
+            forecast = forecastio.models.Forecast(
+                response.json(), response, response.headers
             )
-            .hourly()
-            .data
-        ):
-            d = item.d
-            hourly.append(d)
+            hourly = []
+            for item in forecast.hourly().data:
+                d = item.d
+                hourly.append(d)
+            return self._parse(hourly)
+
+    async def _aget_data_day(
+        self, session, latitude, longitude, timezone, day
+    ):
+        """
+        Gets 24 hours of forecast data from darksky without blocking the
+        event loop
+
+        :param session: aiohttp client session
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day: day to retrieve data from
+        :return: all raw data for a given day
+        """
+        while True:
+            api_key = await self.quota.aacquire()
+            url = self._url(latitude, longitude, timezone, day, api_key)
+            status, text = await self.http.aget(session, url)
+            try:
+                self._check(day, status, text)
+            except QuotaExceeded:
+                self.quota.exhausted(api_key)
+                continue
+            if status >= 400:
+                raise IOError("HTTP %s from %s" % (status, self.server))
+            with self._timer("parse"):
+                return self._parse(json.loads(text)["hourly"]["data"])
+
+    def _check(self, day, status, text):
+        """
+        DarkSky answers 403 both when the daily usage limit of a key is
+        exceeded and when the key is refused, e.g. because it is not valid
+
+        :param day: requested day
+        :param status: HTTP status of the response
+        :param text: body of the response
+        :raises QuotaExceeded: when the daily usage limit of the key is
+            exceeded
+        :raises FetchError: when the key is refused for any other reason
+        """
+        if status != 403:
+            return
+        if DAILY_LIMIT_ERROR in text.lower():
+            raise QuotaExceeded("Daily usage limit exceeded")
+        raise FetchError(
+            {day: IOError("HTTP 403 from %s: %s" % (self.server, text))}
+        )
+
+    def _url(self, latitude, longitude, timezone, day, api_key=None):
+        """
+        Time Machine request URL, as built by forecastio.load_forecast
+        """
+        return "%s/%s/%s,%s,%s?units=si&lang=en" % (
+            self.server,
+            api_key or self.api_key,
+            latitude,
+            longitude,
+            timezone.localize(day).replace(microsecond=0).isoformat(),
+        )
+
+    @staticmethod
+    def _parse(hourly):
         data = pd.DataFrame(hourly)
         data["ts"] = data["time"]
         data.drop(["time"], axis=1, inplace=True)
@@ -1,22 +1,82 @@
+import asyncio
+import collections
+import copy
 import datetime
 import logging
+import threading
 
+from concurrent.futures import Future
 from io import StringIO
 
+import numpy as np
 import pandas as pd
-import requests
+import pytz
 
 from beemeteo.sources import Source
+from beemeteo.sources import _concat
 from beemeteo.sources import _dt_to_ts
+from beemeteo.sources import _split_range
+from beemeteo.sources.meteogalicia.grid import Grid
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+THREDDS_SERVER = "http://mandeo.meteogalicia.es/thredds/ncss/grid/"
+RESOLUTIONS = [(4, 2), (12, 2), (12, 1), (36, 2), (36, 1)]
+# Seconds a day served by the operational forecasts is kept in memory
+OPERATIONAL_TTL = 6 * 3600
+# Degrees added around the stations of a region
+REGION_MARGIN = 0.1
+# Regional downloads kept in memory, enough for a week of runs
+REGION_CACHE_SIZE = 8
+
+
+class OutsideDomain(Exception):
+    """
+    Raised when the THREDDS server has no data for a request, as its
+    location or region is outside the domain of the resolution asked for
+    """
+
+
+def _run_day(day):
+    """
+    Forecast runs start at 00 UTC and span several days, so the run issued
+    the day before is the one covering every hour of a local day
+    """
+    return day - datetime.timedelta(days=1)
+
+
+def _to_timezone(timezone):
+    return pytz.timezone(timezone) if isinstance(timezone, str) else timezone
+
+
+def _is_operational(run):
+    """
+    Whether a run is still served by the operational forecasts, which keep
+    the last 14 days, rather than by the WRF_HIST archive
+    """
+    return (datetime.datetime.utcnow() - run).days <= 14
+
 
 class MeteoGalicia(Source):
+    schema = {"GHI": "float64"}
+
     def __init__(self, config):
         super(MeteoGalicia, self).__init__(config)
+        self.server = self.config.get("meteogalicia", {}).get(
+            "url", THREDDS_SERVER
+        )
+        # {"bbox": [west, south, east, north], "method": "nearest"}, to
+        # download whole regions instead of single points
+        self.region = self.config.get("meteogalicia", {}).get("region")
+        # (latitude, longitude) -> (resolution, grid latitude, longitude)
+        self._cells = {}
+        # downloads in progress, shared by every request of the same cell
+        self._downloads = {}
+        # regional grids by resolution and run, or the error getting them
+        self._grids = collections.OrderedDict()
+        self._lock = threading.Lock()
 
     def _get_data_day(self, latitude, longitude, timezone, day):
         """
@@ -28,119 +88,529 @@ class MeteoGalicia(Source):
         :param day: day to retrieve data from
         :return: all raw data for a given day
         """
-        run = 0
-        for resolution in [(4, 2), (12, 2), (12, 1), (36, 2), (36, 1)]:
+        if self.region is not None:
+            return self._get_region_day(latitude, longitude, timezone, day)
+        for resolution in self._resolutions(latitude, longitude):
+            key, url = self._request(
+                latitude, longitude, _run_day(day), resolution
+            )
             try:
-                # Last 14 days of operational forecasts
-                # http://mandeo.meteogalicia.es/
-                # thredds/
-                # ncss/
-                # grid/
-                # wrf_2d_04km/
-                # fmrc/
-                # files/
-                # 20180423/
-                # wrf_arw_det_history_d02_20180423_0000.nc4?
-                # var=swflx&
-                # point=true&
-                # accept=csv&
-                # longitude=0.62&
-                # latitude=41.62&
-                # temporal=all
-                if (datetime.datetime.utcnow() - day).days <= 14:
-                    url_mg = (
-                        "http://mandeo.meteogalicia.es/"
-                        "thredds/"
-                        "ncss/"
-                        "grid/"
-                        "wrf_2d_%02ikm/"
-                        "fmrc/"
-                        "files/"
-                        "%s/"
-                        "wrf_arw_det_history_d0%s_%s_%02i00.nc4?"
-                        "var=swflx&"
-                        "point=true&"
-                        "accept=csv&"
-                        "longitude=%s&"
-                        "latitude=%s&"
-                        "temporal=all"
-                        % (
-                            resolution[0],
-                            datetime.datetime.strftime(day, "%Y%m%d"),
-                            resolution[1],
-                            datetime.datetime.strftime(day, "%Y%m%d"),
-                            run,
-                            longitude,
-                            latitude,
-                        )
-                    )
-                else:
-                    # Historical forecasts. Only run 00 is available
-                    # http://mandeo.meteogalicia.es/
-                    # thredds/
-                    # ncss/
-                    # grid/
-                    # modelos/
-                    # WRF_HIST/
-                    # d02/
-                    # 2018/
-                    # 01/
-                    # wrf_arw_det_history_d02_20180122_0000.nc4?
-                    # var=swflx&
-                    # point=true&
-                    # accept=csv&
-                    # longitude=41.62&
-                    # latitude=0.62&
-                    # temporal=all
-                    url_mg = (
-                        "http://mandeo.meteogalicia.es/"
-                        "thredds/"
-                        "ncss/"
-                        "grid/"
-                        "modelos/"
-                        "WRF_HIST/"
-                        "d0%s"
-                        "/%s"
-                        "/%s"
-                        "/wrf_arw_det_history_d0%s_%s_0000.nc4?"
-                        "var=swflx&"
-                        "point=true&"
-                        "accept=csv&"
-                        "longitude=%s&"
-                        "latitude=%s&"
-                        "temporal=all"
-                        % (
-                            resolution[1],
-                            datetime.datetime.strftime(day, "%Y"),
-                            datetime.datetime.strftime(day, "%m"),
-                            resolution[1],
-                            datetime.datetime.strftime(day, "%Y%m%d"),
-                            longitude,
-                            latitude,
-                        )
-                    )
-                r = requests.get(url_mg)
-                solar_data = pd.read_csv(StringIO(r.text), sep=",")
-                if len(solar_data) == 0:
-                    raise Exception(
-                        "Location out of the bounding box, "
-                        "trying with another resolution..."
-                        "(Actual: " + str(resolution) + "km)"
-                    )
-                else:
-                    solar_data = solar_data.rename(
-                        columns={"date": "time", 'swflx[unit="W m-2"]': "GHI"}
-                    )
-                    solar_data["ts"] = _dt_to_ts(
-                        pd.to_datetime(solar_data["time"]).dt.tz_convert(
-                            timezone
-                        ),
-                        timezone,
-                    )
-                    solar_data = solar_data[["ts", "GHI"]]
-                    solar_data = solar_data.reset_index(drop=True)
+                text = self._shared(key, lambda: self._download(url).text)
+                with self._timer("parse"):
+                    data = self._parse(text, timezone, resolution)
+            except Exception as e:
+                logger.error(e)
+                continue
+            self._learn(latitude, longitude, resolution, text)
+            return data
+        return pd.DataFrame({})
+
+    async def _aget_data_day(
+        self, session, latitude, longitude, timezone, day
+    ):
+        """
+        Gets solar radiation information for a location on a given day
+        without blocking the event loop
 
-                    return solar_data
+        :param session: aiohttp client session
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param timezone: station's timezone
+        :param day: day to retrieve data from
+        :return: all raw data for a given day
+        """
+        if self.region is not None:
+            return await self._aget_region_day(
+                session, latitude, longitude, timezone, day
+            )
+        for resolution in self._resolutions(latitude, longitude):
+            key, url = self._request(
+                latitude, longitude, _run_day(day), resolution
+            )
+
+            async def download():
+                return await self._adownload(session, url)
+
+            try:
+                text = await self._ashared(key, download)
+                with self._timer("parse"):
+                    data = self._parse(text, timezone, resolution)
             except Exception as e:
                 logger.error(e)
+                continue
+            self._learn(latitude, longitude, resolution, text)
+            return data
         return pd.DataFrame({})
+
+    def _download(self, url):
+        """
+        :return: response of the THREDDS server
+        :raises OutsideDomain: for client errors, such as a point out of
+            the domain
+        """
+        response = self.http.get(url)
+        if 400 <= response.status_code < 500:
+            raise OutsideDomain(
+                "HTTP %s from %s" % (response.status_code, url)
+            )
+        response.raise_for_status()
+        return response
+
+    async def _adownload(self, session, url, binary=False):
+        """
+        :return: body of the response of the THREDDS server
+        """
+        status, body = await self.http.aget(session, url, binary)
+        if 400 <= status < 500:
+            raise OutsideDomain("HTTP %s from %s" % (status, url))
+        if status >= 400:
+            raise IOError("HTTP %s from %s" % (status, url))
+        return body
+
+    def _get_region_day(self, latitude, longitude, timezone, day):
+        """
+        Gets solar radiation information for a location on a given day out
+        of the forecast of the whole region
+        """
+        for resolution in self._resolutions(latitude, longitude):
+            key, url = self._region_request(_run_day(day), resolution)
+            try:
+                grid = self._grid(key, url)
+                with self._timer("query"):
+                    data = self._lookup(grid, latitude, longitude, timezone)
+            except Exception as e:
+                logger.error(e)
+                continue
+            self._cells.setdefault(
+                (latitude, longitude), (resolution, latitude, longitude)
+            )
+            return data
+        return pd.DataFrame({})
+
+    async def _aget_region_day(
+        self, session, latitude, longitude, timezone, day
+    ):
+        """
+        Gets solar radiation information for a location on a given day out
+        of the forecast of the whole region, without blocking the event loop
+        """
+        for resolution in self._resolutions(latitude, longitude):
+            key, url = self._region_request(_run_day(day), resolution)
+            try:
+                grid = await self._agrid(session, key, url)
+                with self._timer("query"):
+                    data = self._lookup(grid, latitude, longitude, timezone)
+            except Exception as e:
+                logger.error(e)
+                continue
+            self._cells.setdefault(
+                (latitude, longitude), (resolution, latitude, longitude)
+            )
+            return data
+        return pd.DataFrame({})
+
+    def get_region_data(
+        self,
+        stations,
+        date_from,
+        date_to,
+        hbase_table=None,
+        chunk_days=7,
+    ):
+        """
+        Gets forecast data for many stations, downloading the forecast of a
+        region covering all of them once per run. Unless a region is
+        configured, the stations' bounding box is downloaded.
+
+        :param stations: dataframe with latitude, longitude and timezone
+            columns
+        :param date_from: start date
+        :param date_to: end date
+        :param hbase_table: HBase table for source
+        :param chunk_days: days retrieved for every station before moving
+            to the next ones, so that the runs they need are still in memory
+        :return: data of every station, one after another
+        """
+        source = self
+        if self.region is None:
+            source = self._with_region(
+                {
+                    "bbox": [
+                        stations["longitude"].min() - REGION_MARGIN,
+                        stations["latitude"].min() - REGION_MARGIN,
+                        stations["longitude"].max() + REGION_MARGIN,
+                        stations["latitude"].max() + REGION_MARGIN,
+                    ]
+                }
+            )
+        stations = stations.reset_index(drop=True)
+        frames = [[] for _ in range(len(stations))]
+        for day_from, day_to in _split_range(date_from, date_to, chunk_days):
+            for station in stations.itertuples():
+                frames[station.Index].append(
+                    source.get_data(
+                        station.latitude,
+                        station.longitude,
+                        _to_timezone(station.timezone),
+                        day_from,
+                        day_to,
+                        hbase_table,
+                    )
+                )
+        return _concat(
+            [
+                _concat(station_frames).drop_duplicates(
+                    subset=["ts"], ignore_index=True
+                )
+                for station_frames in frames
+            ]
+        ).reset_index(drop=True)
+
+    def _with_region(self, region):
+        """
+        Copy of the source downloading a region, sharing the source's
+        downloads, grids and caches while leaving its own region alone
+
+        :param region: {"bbox": [west, south, east, north]}
+        :return: MeteoGalicia
+        """
+        # created before copying, so that the copy shares them
+        for name in ("hbase", "cache", "memory_cache"):
+            getattr(self, name)
+        source = copy.copy(self)
+        source.region = region
+        return source
+
+    def _region_request(self, run, resolution):
+        """
+        Download of the region's forecast for a run and resolution
+
+        :return: download key and url
+        """
+        west, south, east, north = self.region["bbox"]
+        url = self._url(0, 0, run, resolution).split("?")[0]
+        return (
+            (resolution, run, west, south, east, north),
+            "%s?"
+            "var=swflx&"
+            "north=%s&"
+            "south=%s&"
+            "east=%s&"
+            "west=%s&"
+            "horizStride=1&"
+            "addLatLon=true&"
+            "accept=netcdf&"
+            "temporal=all" % (url, north, south, east, west),
+        )
+
+    def _cached_grid(self, key):
+        with self._lock:
+            if key in self._grids:
+                self._grids.move_to_end(key)
+                return self._grids[key]
+        return None
+
+    def _cache_grid(self, key, grid):
+        with self._lock:
+            self._grids[key] = grid
+            while len(self._grids) > REGION_CACHE_SIZE:
+                self._grids.popitem(last=False)
+
+    def _read_grid(self, content):
+        """
+        :raises OutsideDomain: when the response is not a grid, as the
+            server answers with a message for regions outside the domain
+        """
+        with self._timer("parse"):
+            try:
+                return Grid.from_netcdf(content)
+            except ImportError:
+                raise
+            except Exception as e:
+                raise OutsideDomain("Could not read the region's grid: %s" % e)
+
+    def _grid(self, key, url):
+        """
+        Regional grid of a run and resolution, downloaded once. Regions
+        outside a domain are remembered too, so that their stations do not
+        try it again, while other errors, such as timeouts, are not.
+        """
+        grid = self._cached_grid(key)
+        if grid is None:
+            try:
+                grid = self._shared(
+                    key, lambda: self._read_grid(self._download(url).content)
+                )
+            except OutsideDomain as e:
+                grid = e
+            self._cache_grid(key, grid)
+        if isinstance(grid, Exception):
+            raise grid
+        return grid
+
+    async def _agrid(self, session, key, url):
+        """
+        Regional grid of a run and resolution, downloaded once without
+        blocking the event loop
+        """
+
+        async def download():
+            return self._read_grid(
+                await self._adownload(session, url, binary=True)
+            )
+
+        grid = self._cached_grid(key)
+        if grid is None:
+            try:
+                grid = await self._ashared(key, download)
+            except OutsideDomain as e:
+                grid = e
+            self._cache_grid(key, grid)
+        if isinstance(grid, Exception):
+            raise grid
+        return grid
+
+    def _lookup(self, grid, latitude, longitude, timezone):
+        """
+        Series of a location in a regional grid, with the same columns as
+        the point service's
+
+        :return: dataframe
+        """
+        values = grid.lookup(
+            [latitude], [longitude], self.region.get("method", "nearest")
+        )[:, 0]
+        if np.isnan(values).all():
+            raise Exception(
+                "Location (%s, %s) out of the region's grid, trying with "
+                "another resolution..." % (latitude, longitude)
+            )
+        return pd.DataFrame(
+            {
+                "ts": _dt_to_ts(
+                    pd.Series(grid.times).dt.tz_convert(timezone), timezone
+                ),
+                "GHI": values,
+            }
+        )
+
+    def _resolutions(self, latitude, longitude):
+        """
+        Resolutions to try for a location, starting with the one known to
+        cover it
+        """
+        cell = self._cells.get((latitude, longitude))
+        if cell is None:
+            return RESOLUTIONS
+        return [cell[0]] + [r for r in RESOLUTIONS if r != cell[0]]
+
+    def _request(self, latitude, longitude, run, resolution):
+        """
+        Download needed for a location, run and resolution. Locations in
+        the same grid cell are asked for the cell's point, so that they
+        share the download.
+
+        :return: download key and url
+        """
+        cell = self._cells.get((latitude, longitude))
+        if cell is not None and cell[0] == resolution:
+            latitude, longitude = cell[1], cell[2]
+        return (
+            (resolution, latitude, longitude, run),
+            self._url(latitude, longitude, run, resolution),
+        )
+
+    def _learn(self, latitude, longitude, resolution, text):
+        """
+        Remembers the resolution and grid cell that cover a location
+        """
+        if (latitude, longitude) not in self._cells:
+            self._cells[(latitude, longitude)] = (resolution,) + (
+                self._grid_point(text) or (latitude, longitude)
+            )
+
+    def _shared(self, key, fetch):
+        """
+        Calls fetch, or waits for the call of the same key already in
+        progress and shares its result
+        """
+        with self._lock:
+            future = self._downloads.get(key)
+            owner = future is None
+            if owner:
+                future = self._downloads[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            future.set_result(fetch())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._downloads[key]
+        return future.result()
+
+    async def _ashared(self, key, fetch):
+        """
+        Awaits fetch(), or the call of the same key already in progress on
+        the event loop and shares its result
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            task = self._downloads.get((loop, key))
+            if task is None:
+                task = self._downloads[(loop, key)] = loop.create_task(fetch())
+                task.add_done_callback(
+                    lambda _: self._downloads.pop((loop, key), None)
+                )
+        # one caller being cancelled does not cancel the others' download
+        return await asyncio.shield(task)
+
+    def ttl(self, day):
+        """
+        Days of the operational forecasts can change with newer runs, while
+        those of the archive are final
+        """
+        return OPERATIONAL_TTL if _is_operational(_run_day(day)) else None
+
+    def _url(self, latitude, longitude, day, resolution, run=0):
+        """
+        NetCDF Subset Service URL with the solar radiation forecast of a
+        location for a given day and WRF domain
+
+        :param latitude: station's latitude
+        :param longitude: station's longitude
+        :param day: day to retrieve data from
+        :param resolution: tuple of grid resolution (km) and domain
+        :param run: operational forecast run
+        :return: url
+        """
+        # Last 14 days of operational forecasts
+        # http://mandeo.meteogalicia.es/
+        # thredds/
+        # ncss/
+        # grid/
+        # wrf_2d_04km/
+        # fmrc/
+        # files/
+        # 20180423/
+        # wrf_arw_det_history_d02_20180423_0000.nc4?
+        # var=swflx&
+        # point=true&
+        # accept=csv&
+        # longitude=0.62&
+        # latitude=41.62&
+        # temporal=all
+        if _is_operational(day):
+            return (
+                "%s"
+                "wrf_2d_%02ikm/"
+                "fmrc/"
+                "files/"
+                "%s/"
+                "wrf_arw_det_history_d0%s_%s_%02i00.nc4?"
+                "var=swflx&"
+                "point=true&"
+                "accept=csv&"
+                "longitude=%s&"
+                "latitude=%s&"
+                "temporal=all"
+                % (
+                    self.server,
+                    resolution[0],
+                    datetime.datetime.strftime(day, "%Y%m%d"),
+                    resolution[1],
+                    datetime.datetime.strftime(day, "%Y%m%d"),
+                    run,
+                    longitude,
+                    latitude,
+                )
+            )
+        # Historical forecasts. Only run 00 is available
+        # http://mandeo.meteogalicia.es/
+        # thredds/
+        # ncss/
+        # grid/
+        # modelos/
+        # WRF_HIST/
+        # d02/
+        # 2018/
+        # 01/
+        # wrf_arw_det_history_d02_20180122_0000.nc4?
+        # var=swflx&
+        # point=true&
+        # accept=csv&
+        # longitude=41.62&
+        # latitude=0.62&
+        # temporal=all
+        return (
+            "%s"
+            "modelos/"
+            "WRF_HIST/"
+            "d0%s"
+            "/%s"
+            "/%s"
+            "/wrf_arw_det_history_d0%s_%s_0000.nc4?"
+            "var=swflx&"
+            "point=true&"
+            "accept=csv&"
+            "longitude=%s&"
+            "latitude=%s&"
+            "temporal=all"
+            % (
+                self.server,
+                resolution[1],
+                datetime.datetime.strftime(day, "%Y"),
+                datetime.datetime.strftime(day, "%m"),
+                resolution[1],
+                datetime.datetime.strftime(day, "%Y%m%d"),
+                longitude,
+                latitude,
+            )
+        )
+
+    @staticmethod
+    def _grid_point(text):
+        """
+        Coordinates of the grid point the NetCDF Subset Service answered
+        with, None when the response does not include them
+        """
+        head = pd.read_csv(StringIO(text), sep=",", nrows=1)
+        columns = [
+            [c for c in head.columns if c.startswith(prefix)]
+            for prefix in ("lat", "lon")
+        ]
+        if len(head) == 0 or not all(columns):
+            return None
+        return (
+            float(head[columns[0][0]].iat[0]),
+            float(head[columns[1][0]].iat[0]),
+        )
+
+    @staticmethod
+    def _parse(text, timezone, resolution):
+        """
+        Parses the NetCDF Subset Service CSV output
+
+        :param text: service response
+        :param timezone: station's timezone
+        :param resolution: grid resolution requested
+        :return: dataframe
+        """
+        solar_data = pd.read_csv(StringIO(text), sep=",")
+        if len(solar_data) == 0:
+            raise Exception(
+                "Location out of the bounding box, "
+                "trying with another resolution..."
+                "(Actual: " + str(resolution) + "km)"
+            )
+        solar_data = solar_data.rename(
+            columns={"date": "time", 'swflx[unit="W m-2"]': "GHI"}
+        )
+        solar_data["ts"] = _dt_to_ts(
+            pd.to_datetime(solar_data["time"]).dt.tz_convert(timezone),
+            timezone,
+        )
+        solar_data = solar_data[["ts", "GHI"]]
+        solar_data = solar_data.reset_index(drop=True)
+        return solar_data
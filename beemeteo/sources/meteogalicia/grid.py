@@ -0,0 +1,203 @@
+import io
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+
+from beemeteo.stations.index import StationIndex
+from beemeteo.stations.index import haversine
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METHODS = ["nearest", "bilinear"]
+
+
+def _values(variable):
+    """
+    Values of a NetCDF variable as floats, with missing values as NaN
+    """
+    values = np.array(variable[:], dtype=float)
+    for attribute in ("_FillValue", "missing_value"):
+        if hasattr(variable, attribute):
+            values[values == float(getattr(variable, attribute))] = np.nan
+    values = values * float(getattr(variable, "scale_factor", 1.0))
+    return values + float(getattr(variable, "add_offset", 0.0))
+
+
+def _times(variable):
+    """
+    UTC times of a CF time variable, such as "hours since 2021-01-01T00:00Z"
+    """
+    units = variable.units
+    units = units.decode("utf-8") if isinstance(units, bytes) else units
+    match = re.match(r"\s*(\w+)\s+since\s+(.+)", units)
+    if match is None:
+        raise ValueError("Unknown time units: %s" % units)
+    origin = pd.Timestamp(match.group(2).strip())
+    origin = (
+        origin.tz_localize("UTC")
+        if origin.tzinfo is None
+        else origin.tz_convert("UTC")
+    )
+    return origin + pd.to_timedelta(
+        np.array(variable[:], dtype=float), unit=match.group(1)
+    )
+
+
+class Grid:
+    """
+    Forecast field of a region, as returned by the NetCDF Subset Service,
+    from which the series of many points are looked up at once
+    """
+
+    def __init__(self, times, latitude, longitude, values):
+        """
+        :param times: UTC times, one for each step
+        :param latitude: latitudes, 1d for rectilinear grids and 2d (y, x)
+            otherwise
+        :param longitude: longitudes, with the same shape as latitude
+        :param values: array of shape (time, y, x)
+        """
+        self.times = pd.DatetimeIndex(times)
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self._index = None
+
+    @property
+    def rectilinear(self):
+        return (
+            self.latitude.ndim == 1
+            and len(self.latitude) > 1
+            and len(self.longitude) > 1
+        )
+
+    @classmethod
+    def from_netcdf(cls, content, variable="swflx"):
+        """
+        Reads a NetCDF-3 file. Requires scipy.
+
+        :param content: file contents
+        :param variable: forecast variable
+        :return: Grid
+        """
+        from scipy.io import netcdf_file
+
+        with netcdf_file(io.BytesIO(content), "r", mmap=False) as f:
+            names = f.variables
+            latitude = _values(
+                names["lat"] if "lat" in names else names["latitude"]
+            )
+            longitude = _values(
+                names["lon"] if "lon" in names else names["longitude"]
+            )
+            times = _times(names["time"])
+            values = _values(names[variable])
+        if values.ndim == 4:
+            # a single vertical level
+            values = values[:, 0]
+        return cls(times, latitude, longitude, values)
+
+    def lookup(self, latitudes, longitudes, method="nearest"):
+        """
+        Series of many points at once
+
+        :param latitudes: array of latitudes
+        :param longitudes: array of longitudes
+        :param method: "nearest" grid point, or "bilinear" interpolation on
+            rectilinear grids
+        :return: array of shape (time, points), NaN for points outside the
+            grid
+        """
+        if method not in METHODS:
+            raise ValueError("Unknown lookup method %s" % method)
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))
+        if method == "bilinear":
+            if self.rectilinear:
+                return self._bilinear(latitudes, longitudes)
+            logger.warning(
+                "Bilinear lookups need a rectilinear grid of 2 points or "
+                "more in each direction, using the nearest grid point"
+            )
+        return self._nearest(latitudes, longitudes)
+
+    def _points(self):
+        if self.latitude.ndim == 1:
+            return np.meshgrid(self.latitude, self.longitude, indexing="ij")
+        return self.latitude, self.longitude
+
+    def _spacing(self):
+        """
+        Largest distance between neighbouring grid points, in kilometers
+        """
+        latitude, longitude = self._points()
+        spacing = [0.0]
+        if latitude.shape[0] > 1:
+            spacing.append(
+                haversine(
+                    latitude[0, 0],
+                    longitude[0, 0],
+                    latitude[1, 0],
+                    longitude[1, 0],
+                )
+            )
+        if latitude.shape[1] > 1:
+            spacing.append(
+                haversine(
+                    latitude[0, 0],
+                    longitude[0, 0],
+                    latitude[0, 1],
+                    longitude[0, 1],
+                )
+            )
+        return max(spacing)
+
+    def _nearest(self, latitudes, longitudes):
+        latitude, longitude = self._points()
+        if self._index is None:
+            self._index = StationIndex(
+                pd.DataFrame(
+                    {
+                        "latitude": latitude.ravel(),
+                        "longitude": longitude.ravel(),
+                    }
+                )
+            )
+        distances, positions = self._index.query(latitudes, longitudes)
+        values = self.values.reshape(len(self.times), -1)[:, positions[:, 0]]
+        # farther than a grid step from every grid point, so not in the grid
+        values[:, distances[:, 0] > self._spacing()] = np.nan
+        return values
+
+    def _bilinear(self, latitudes, longitudes):
+        rows, row_weights = self._axis(self.latitude, latitudes)
+        columns, column_weights = self._axis(self.longitude, longitudes)
+        values = np.zeros((len(self.times), len(latitudes)))
+        for dy, wy in ((0, 1 - row_weights), (1, row_weights)):
+            for dx, wx in ((0, 1 - column_weights), (1, column_weights)):
+                values += self.values[:, rows + dy, columns + dx] * (wy * wx)
+        outside = (row_weights < 0) | (column_weights < 0)
+        values[:, outside] = np.nan
+        return values
+
+    @staticmethod
+    def _axis(axis, points):
+        """
+        Cell of each point along an axis and its weight within the cell,
+        negative for points outside the axis
+        """
+        descending = axis[0] > axis[-1]
+        if descending:
+            axis = axis[::-1]
+        cells = np.clip(np.searchsorted(axis, points) - 1, 0, len(axis) - 2)
+        weights = (points - axis[cells]) / (axis[cells + 1] - axis[cells])
+        inside = (points >= axis[0]) & (points <= axis[-1])
+        weights = np.where(inside, weights, -1.0)
+        if descending:
+            cells = len(axis) - 2 - cells
+            weights = np.where(inside, 1 - weights, -1.0)
+        return cells, weights
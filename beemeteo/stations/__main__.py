@@ -1,7 +1,11 @@
 import logging
 
 import click
+import pandas as pd
 
+from beemeteo.stations.assignment import DEFAULT_CHUNK_SIZE
+from beemeteo.stations.assignment import assign
+from beemeteo.stations.assignment import country_postal_codes
 from beemeteo.stations.postal_code import PostalCode
 from beemeteo.stations.stations import Stations
 
@@ -14,14 +18,73 @@ logger = logging.getLogger(__name__)
 @click.option("--stations", type=click.File("rb"))
 @click.option("--postal-code", type=str, help="Postal code")
 @click.option("--country", type=str, default="ES", help="Country")
-def main(stations, postal_code, country):
+@click.option(
+    "--postal-codes",
+    type=click.File("rb"),
+    help="Tab separated file of country and postal code rows, to assign a "
+    "station to each of them",
+)
+@click.option(
+    "--whole-country",
+    is_flag=True,
+    help="Assign a station to every postal code of the country",
+)
+@click.option(
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="CSV file with the assigned stations, stdout by default",
+)
+@click.option(
+    "--chunk-size",
+    type=int,
+    default=DEFAULT_CHUNK_SIZE,
+    help="Postal codes assigned at once",
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="Processes assigning postal codes in parallel",
+)
+def main(
+    stations,
+    postal_code,
+    country,
+    postal_codes,
+    whole_country,
+    output,
+    chunk_size,
+    workers,
+):
     """
-    Gets the closest station for a given postal code.
+    Gets the closest station for a given postal code, or for many of them.
     """
+    stations = Stations.load(stations)
+    if postal_codes is not None or whole_country:
+        if postal_codes is not None:
+            postal_codes = pd.read_table(
+                postal_codes,
+                names=["country", "postalCode"],
+                dtype=str,
+            )
+        else:
+            postal_codes = country_postal_codes(country)
+        rows = 0
+        for assigned in assign(postal_codes, stations, chunk_size, workers):
+            assigned.to_csv(output, header=rows == 0, index=False)
+            rows += len(assigned)
+            logger.info("Assigned stations to %d postal codes" % rows)
+        return
+    if postal_code is None:
+        raise click.UsageError(
+            "One of --postal-code, --postal-codes or --whole-country is "
+            "required"
+        )
 
     (latitude, longitude, distance) = PostalCode(
         country, postal_code
-    ).find_closest(Stations.load(stations))
+    ).find_closest(stations)
     logger.info(
         "Closest station ({latitude}, {longitude}) is {distance} "
         "kilometers from postal code {postal_code})".format(
@@ -0,0 +1,103 @@
+import collections
+import logging
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from beemeteo.stations.index import StationIndex
+from beemeteo.stations.postal_code import PostalCode
+from beemeteo.stations.postal_code import load
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 100000
+# chunks submitted to the worker processes for each of them
+WINDOW_PER_WORKER = 2
+
+# index of the worker processes, built once by _init
+_index = None
+
+
+def _init(stations):
+    global _index
+    _index = StationIndex(stations)
+
+
+def _assign(chunk, index=None):
+    """
+    Closest station to each postal code of a chunk
+
+    :param chunk: dataframe with country and postalCode columns
+    :param index: StationIndex, the one of the worker process when None
+    :return: dataframe with the coordinates of each postal code, and those
+        of its closest station and the distance to it. They are NaN for
+        unknown postal codes.
+    """
+    if index is None:
+        index = _index
+    resolved = PostalCode.resolve_many(
+        chunk["country"].to_numpy(), chunk["postalCode"].to_numpy()
+    )
+    known = resolved["latitude"].notna().to_numpy()
+    distances = np.full(len(resolved), np.nan)
+    latitudes = np.full(len(resolved), np.nan)
+    longitudes = np.full(len(resolved), np.nan)
+    if known.any():
+        found, positions = index.query(
+            resolved["latitude"][known].to_numpy(),
+            resolved["longitude"][known].to_numpy(),
+        )
+        distances[known] = found[:, 0]
+        latitudes[known] = index.latitude[positions[:, 0]]
+        longitudes[known] = index.longitude[positions[:, 0]]
+    return resolved.assign(
+        station_latitude=latitudes,
+        station_longitude=longitudes,
+        distance=distances,
+    )
+
+
+def country_postal_codes(country):
+    """
+    :return: dataframe with every postal code of a country
+    """
+    data = load()[0]
+    return data.loc[data["country"] == country, ["country", "postalCode"]]
+
+
+def assign(postal_codes, stations, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """
+    Finds the closest station to each postal code, a chunk at a time so that
+    memory stays bounded however many postal codes there are
+
+    :param postal_codes: dataframe with country and postalCode columns
+    :param stations: dataframe with latitude and longitude columns
+    :param chunk_size: postal codes resolved at once
+    :param workers: processes sharing the chunks
+    :return: generator of dataframes, one for each chunk and in order
+    """
+    postal_codes = postal_codes.reset_index(drop=True)
+    chunks = (
+        postal_codes.iloc[start:][:chunk_size]
+        for start in range(0, len(postal_codes), chunk_size)
+    )
+    if workers <= 1:
+        index = StationIndex(stations)
+        for chunk in chunks:
+            yield _assign(chunk, index)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init, initargs=(stations,)
+    ) as executor:
+        # a bounded window of chunks, so that those waiting to be consumed
+        # do not pile up in memory
+        pending = collections.deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_assign, chunk))
+            if len(pending) >= WINDOW_PER_WORKER * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
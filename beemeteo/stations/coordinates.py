@@ -1,5 +1,7 @@
 import numpy as np
 
+from beemeteo.stations.index import haversine
+
 
 class Coordinates:
     def __init__(self, latitude, longitude):
@@ -14,28 +16,21 @@ class Coordinates:
 
     def find_closest(self, stations):
         """
-        Calculate the great circle distance between two points
-        on the earth (specified in decimal degrees)
+        Calculate the great circle distance to every station, and sort them
+        from the closest to the farthest one
 
-        All args must be of equal length.
+        :param stations: dataframe with latitude and longitude columns
+        :return: list of (latitude, longitude, distance) tuples
         """
-        lon1 = np.radians(self.longitude)
-        lat1 = np.radians(self.latitude)
-        lon2 = np.radians(stations.longitude)
-        lat2 = np.radians(stations.latitude)
-
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-
-        a = (
-            np.sin(dlat / 2.0) ** 2
-            + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+        km = np.asarray(
+            haversine(
+                self.latitude,
+                self.longitude,
+                stations.latitude,
+                stations.longitude,
+            )
         )
-
-        c = 2 * np.arcsin(np.sqrt(a))
-        km = 6367 * c
-        index = range(km.shape[0])
         return [
-            (stations.latitude[i], stations.longitude[i], k)
-            for i, k in sorted(zip(index, km), key=lambda x: x[1])
+            (stations.latitude[i], stations.longitude[i], km[i])
+            for i in np.argsort(km, kind="stable")
         ]
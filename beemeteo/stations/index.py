@@ -0,0 +1,225 @@
+import numpy as np
+
+
+# scipy.spatial, when installed, is imported by the first index built, as
+# it takes longer to load than the rest of the package
+_UNLOADED = object()
+cKDTree = _UNLOADED
+
+EARTH_RADIUS = 6367
+# Distances computed at once when scipy is not available
+CHUNK_SIZE = 2**22
+# Relative margin on tree distances, so that rounding never leaves out a
+# station within the radius
+_MARGIN = 1e-9
+
+
+def _kdtree():
+    """
+    :return: scipy's cKDTree, None when scipy is not installed
+    """
+    global cKDTree
+    if cKDTree is _UNLOADED:
+        try:
+            from scipy.spatial import cKDTree as tree
+        except ImportError:
+            tree = None
+        cKDTree = tree
+    return cKDTree
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    """
+    Calculate the great circle distance in kilometers between points on the
+    earth (specified in decimal degrees), broadcasting the arguments
+    """
+    lon1 = np.radians(longitude1)
+    lat1 = np.radians(latitude1)
+    lon2 = np.radians(longitude2)
+    lat2 = np.radians(latitude2)
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = (
+        np.sin(dlat / 2.0) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2.0) ** 2
+    )
+
+    c = 2 * np.arcsin(np.sqrt(a))
+    return EARTH_RADIUS * c
+
+
+def _to_unit_sphere(latitude, longitude):
+    """
+    Cartesian coordinates on the unit sphere, where the euclidean distance
+    grows with the great circle distance
+    """
+    lat = np.radians(latitude)
+    lon = np.radians(longitude)
+    return np.column_stack(
+        [np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)]
+    )
+
+
+def _chord(km):
+    """
+    Euclidean distance on the unit sphere of a great circle distance
+    """
+    return 2 * np.sin(np.minimum(np.asarray(km) / EARTH_RADIUS, np.pi) / 2)
+
+
+class StationIndex:
+    """
+    Spatial index over a table of stations, answering nearest and within
+    radius queries for one or many points at once. It uses a KD-tree on the
+    unit sphere when scipy is installed, and chunked numpy otherwise.
+    Distances are always those of the haversine formula.
+    """
+
+    def __init__(self, stations):
+        """
+        :param stations: dataframe with latitude and longitude columns
+        """
+        self.stations = stations.reset_index(drop=True)
+        self.latitude = self.stations["latitude"].to_numpy(dtype=float)
+        self.longitude = self.stations["longitude"].to_numpy(dtype=float)
+        self._tree = None
+        tree = _kdtree()
+        if tree is not None and len(self.stations) > 0:
+            self._tree = tree(_to_unit_sphere(self.latitude, self.longitude))
+
+    def __len__(self):
+        return len(self.stations)
+
+    def query(self, latitude, longitude, k=1):
+        """
+        Finds the k closest stations
+
+        :param latitude: latitude or array of latitudes
+        :param longitude: longitude or array of longitudes
+        :param k: number of stations to find
+        :return: distances in kilometers and positions of the stations in
+            the table, sorted by distance. Arrays of shape (k,) for a single
+            point, (points, k) otherwise.
+        """
+        latitude, longitude, single = self._points(latitude, longitude)
+        k = min(k, len(self))
+        if k == 0:
+            empty = np.empty((len(latitude), 0))
+            distances, positions = empty, empty.astype(int)
+        elif self._tree is not None:
+            _, positions = self._tree.query(
+                _to_unit_sphere(latitude, longitude), k=k
+            )
+            distances, positions = self._sort(
+                latitude, longitude, positions.reshape(len(latitude), k)
+            )
+        else:
+            distances, positions = self._brute_query(latitude, longitude, k)
+        if single:
+            return distances[0], positions[0]
+        return distances, positions
+
+    def query_radius(self, latitude, longitude, radius):
+        """
+        Finds the stations within a distance
+
+        :param latitude: latitude or array of latitudes
+        :param longitude: longitude or array of longitudes
+        :param radius: distance in kilometers
+        :return: distances in kilometers and positions of the stations in
+            the table, sorted by distance. A tuple of arrays for a single
+            point, a list of them otherwise.
+        """
+        latitude, longitude, single = self._points(latitude, longitude)
+        if self._tree is not None:
+            candidates = self._tree.query_ball_point(
+                _to_unit_sphere(latitude, longitude),
+                _chord(radius) * (1 + _MARGIN),
+            )
+        else:
+            candidates = self._brute_candidates(latitude, longitude, radius)
+        results = []
+        for lat, lon, positions in zip(latitude, longitude, candidates):
+            distances, positions = self._sort(
+                lat, lon, np.asarray(positions, dtype=int)
+            )
+            within = distances <= radius
+            results.append((distances[within], positions[within]))
+        return results[0] if single else results
+
+    def closest(self, latitude, longitude, k=1):
+        """
+        :return: list of (latitude, longitude, distance) of the k closest
+            stations to a point
+        """
+        distances, positions = self.query(latitude, longitude, k)
+        return [
+            (self.stations["latitude"][i], self.stations["longitude"][i], d)
+            for d, i in zip(distances, positions)
+        ]
+
+    @staticmethod
+    def _points(latitude, longitude):
+        single = np.ndim(latitude) == 0
+        return (
+            np.atleast_1d(np.asarray(latitude, dtype=float)),
+            np.atleast_1d(np.asarray(longitude, dtype=float)),
+            single,
+        )
+
+    def _sort(self, latitude, longitude, positions):
+        """
+        Haversine distances to the given stations, sorted by distance and
+        then by position like a stable sort of every station would
+        """
+        latitude = np.asarray(latitude)[..., None]
+        longitude = np.asarray(longitude)[..., None]
+        if positions.ndim == 1:
+            latitude, longitude = latitude[0], longitude[0]
+        distances = haversine(
+            latitude,
+            longitude,
+            self.latitude[positions],
+            self.longitude[positions],
+        )
+        order = np.lexsort((positions, distances))
+        return (
+            np.take_along_axis(distances, order, axis=-1),
+            np.take_along_axis(positions, order, axis=-1),
+        )
+
+    def _chunks(self, latitude, longitude):
+        """
+        Haversine distances to every station, a block of points at a time
+        so that memory stays bounded
+        """
+        rows = max(1, CHUNK_SIZE // max(1, len(self)))
+        for start in range(0, len(latitude), rows):
+            stop = start + rows
+            yield haversine(
+                latitude[start:stop, None],
+                longitude[start:stop, None],
+                self.latitude[None, :],
+                self.longitude[None, :],
+            )
+
+    def _brute_query(self, latitude, longitude, k):
+        positions = []
+        for distances in self._chunks(latitude, longitude):
+            if k < len(self):
+                nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.tile(np.arange(len(self)), (len(distances), 1))
+            positions.append(nearest)
+        positions = np.concatenate(positions)
+        return self._sort(latitude, longitude, positions)
+
+    def _brute_candidates(self, latitude, longitude, radius):
+        candidates = []
+        for distances in self._chunks(latitude, longitude):
+            candidates.extend(
+                np.flatnonzero(row <= radius) for row in distances
+            )
+        return candidates
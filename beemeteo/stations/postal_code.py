@@ -1,44 +1,103 @@
+import functools
+import os
+
+import numpy as np
 import pandas as pd
 
-from beemeteo.stations.coordinates import Coordinates
+from beemeteo.stations.index import StationIndex
+
+
+DATA_FILE = os.path.join(os.path.dirname(__file__), "postalCode_geoLoc")
+
+
+@functools.lru_cache(maxsize=None)
+def load(filename=DATA_FILE):
+    """
+    Reads the postal codes dataset once per process
+
+    :param filename: dataset, the one shipped with the package by default
+    :return: dataframe and index of its positions by country and postal code
+    """
+    data = pd.read_table(
+        filename,
+        sep="\t",
+        names=[
+            "postalCode",
+            "latitude",
+            "longitude",
+            "altitude",
+            "country",
+            "UNK1",
+            "UNK2",
+            "UNK3",
+            "UNK4",
+            "UNK5",
+            "UNK6",
+        ],
+        dtype={"postalCode": str, "country": str},
+    )
+    keys = data["country"] + " " + data["postalCode"]
+    # the first row of a repeated postal code wins, as it did with a query
+    data = data[~keys.duplicated()].reset_index(drop=True)
+    return data, pd.Index(data["country"] + " " + data["postalCode"])
 
 
 class PostalCode:
     def __init__(self, country, postal_code):
         self.country = country
         self.postal_code = postal_code
-        self.data = self._get()
-        self.latitude = self.data["latitude"].values[0]
-        self.longitude = self.data["longitude"].values[0]
+        data, keys = load()
+        key = "%s %s" % (country, postal_code)
+        if key not in keys:
+            raise KeyError("Unknown postal code %s" % key)
+        self._position = keys.get_loc(key)
+        self.latitude = data["latitude"].values[self._position]
+        self.longitude = data["longitude"].values[self._position]
+
+    @property
+    def data(self):
+        return load()[0].iloc[[self._position]]
 
     def __str__(self):
         return "{country} {postal_code}".format(
             country=self.country, postal_code=self.postal_code
         )
 
-    def _get(self):
-        data = pd.read_table(
-            "beemeteo/stations/postalCode_geoLoc",
-            sep="\t",
-            names=[
-                "postalCode",
-                "latitude",
-                "longitude",
-                "altitude",
-                "country",
-                "UNK1",
-                "UNK2",
-                "UNK3",
-                "UNK4",
-                "UNK5",
-                "UNK6",
-            ],
-            dtype={"postalCode": str, "country": str},
+    @staticmethod
+    def resolve_many(country, postal_codes):
+        """
+        Gets the coordinates of many postal codes at once
+
+        :param country: country, or list of countries aligned with
+            postal_codes
+        :param postal_codes: list of postal codes
+        :return: dataframe with country, postalCode, latitude and longitude
+            columns, aligned with postal_codes. Coordinates are NaN for
+            unknown postal codes.
+        """
+        data, keys = load()
+        resolved = pd.DataFrame(
+            {
+                "country": np.broadcast_to(
+                    np.asarray(country, dtype=object), (len(postal_codes),)
+                ),
+                "postalCode": np.asarray(postal_codes, dtype=str),
+            }
         )
-        return data.query(
-            "country == @self.country & postalCode == @self.postal_code"
+        positions = keys.get_indexer(
+            resolved["country"] + " " + resolved["postalCode"]
         )
+        for column in ["latitude", "longitude"]:
+            values = data[column].to_numpy(dtype=float)[positions]
+            values[positions == -1] = np.nan
+            resolved[column] = values
+        return resolved
 
     def find_closest(self, stations):
-        building = Coordinates(self.latitude, self.longitude)
-        return building.find_closest(stations)[0]
+        """
+        :param stations: dataframe of stations or StationIndex built on it
+        :return: (latitude, longitude, distance) of the closest station
+        """
+        if not isinstance(stations, StationIndex):
+            stations = StationIndex(stations)
+        return stations.closest(self.latitude, self.longitude)[0]
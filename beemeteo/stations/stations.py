@@ -3,11 +3,54 @@ import pandas as pd
 
 class Stations:
     @staticmethod
-    def load(filename):
-        return pd.read_table(
+    def load(filename, timezone=None):
+        """
+        Loads a stations file, with latitude, longitude and optionally
+        timezone columns
+
+        :param filename: stations file
+        :param timezone: timezone of the stations without one in the file
+        :return: dataframe of stations
+        """
+        stations = pd.read_table(
             filename,
             names=[
                 "latitude",
                 "longitude",
+                "timezone",
             ],
         )
+        if timezone is not None:
+            stations["timezone"] = stations["timezone"].fillna(timezone)
+        return stations
+
+    @staticmethod
+    def from_options(filename, latitude, longitude, timezone):
+        """
+        Stations given on the command line, either as a stations file or as
+        a single station
+
+        :param filename: stations file, None for a single station
+        :param latitude: single station's latitude
+        :param longitude: single station's longitude
+        :param timezone: timezone of the stations without one in the file
+        :return: dataframe of stations
+        :raises ValueError: when some station has no timezone
+        """
+        if filename is not None:
+            stations = Stations.load(filename, timezone)
+        else:
+            stations = pd.DataFrame(
+                {
+                    "latitude": [latitude],
+                    "longitude": [longitude],
+                    "timezone": [timezone],
+                }
+            )
+        missing = stations["timezone"].isnull().sum()
+        if missing:
+            raise ValueError(
+                "%d station(s) without timezone, add it to the stations file "
+                "or pass --timezone" % missing
+            )
+        return stations
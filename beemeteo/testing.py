@@ -0,0 +1,132 @@
+"""
+In-memory stand-ins for happybase, so that code using HBase can be tested
+and benchmarked without a server
+"""
+
+import bisect
+import contextlib
+
+
+class AlreadyExists(Exception):
+    pass
+
+
+AlreadyExists.__module__ = "Hbase_thrift"
+
+
+class FakeBatch:
+    def __init__(self, table, timestamp=None, batch_size=None):
+        self.table = table
+        self.mutations = []
+
+    def put(self, row, data):
+        self.mutations.append((row, data))
+
+    def send(self):
+        for row, data in self.mutations:
+            self.table.put(row, data)
+        self.mutations = []
+
+
+class FakeTable:
+    """
+    In-memory stand-in for a happybase table, keeping rows sorted by key
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.rows = {}
+        self.scans = []
+
+    def put(self, row, data):
+        row = row.encode("utf-8") if isinstance(row, str) else row
+        if row not in self.rows:
+            bisect.insort(self.keys, row)
+            self.rows[row] = {}
+        self.rows[row].update(
+            {
+                (k.encode("utf-8") if isinstance(k, str) else k): (
+                    v.encode("utf-8") if isinstance(v, str) else v
+                )
+                for k, v in data.items()
+            }
+        )
+
+    def batch(self, timestamp=None, batch_size=None):
+        return FakeBatch(self, timestamp, batch_size)
+
+    def scan(self, row_start=None, row_stop=None, columns=None, **kwargs):
+        self.scans.append(
+            dict(row_start=row_start, row_stop=row_stop, columns=columns)
+        )
+        row_start = row_start.encode("utf-8") if row_start else b""
+        row_stop = row_stop.encode("utf-8") if row_stop else None
+        first = bisect.bisect_left(self.keys, row_start)
+        for key in self.keys[first:]:
+            if row_stop is not None and key >= row_stop:
+                return
+            yield key, dict(self.rows[key])
+
+
+class FakeConnection:
+    """
+    In-memory stand-in for happybase.Connection, sharing tables between
+    every connection
+    """
+
+    store = {}
+    opened = 0
+    created = 0
+
+    def __init__(self, host=None, port=None, autoconnect=True, **kwargs):
+        self.is_open = False
+        if autoconnect:
+            self.open()
+
+    def open(self):
+        if not self.is_open:
+            FakeConnection.opened += 1
+            self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def tables(self):
+        return list(self.store)
+
+    def create_table(self, name, families):
+        if name in self.store:
+            raise AlreadyExists()
+        FakeConnection.created += 1
+        self.store[name] = FakeTable()
+
+    def table(self, name):
+        return self.store[name]
+
+    @classmethod
+    def reset(cls):
+        cls.store = {}
+        cls.opened = 0
+        cls.created = 0
+
+
+class FakeConnectionPool:
+    """
+    Stand-in for happybase.ConnectionPool handing out FakeConnections
+    """
+
+    created = 0
+
+    def __init__(self, size, **kwargs):
+        FakeConnectionPool.created += 1
+        kwargs["autoconnect"] = False
+        self.connections = [FakeConnection(**kwargs) for _ in range(size)]
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        connection = self.connections.pop()
+        try:
+            connection.open()
+            yield connection
+        finally:
+            self.connections.append(connection)
@@ -0,0 +1,71 @@
+"""
+Checks that Source.get_data scales linearly with the length of the range.
+
+Usage: python -m benchmarks.bench_get_data
+"""
+
+import datetime
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from beemeteo.sources import Source
+from beemeteo.sources import _day_bounds
+
+
+TIMEZONE = pytz.timezone("Europe/Madrid")
+COLUMNS = ["BHI", "BNI", "DHI", "GHI", "TOA"]
+YEARS = [1, 2, 3, 4, 5]
+# time per day of the longest range relative to the shortest one
+MAX_SLOWDOWN = 2.0
+
+
+class SyntheticSource(Source):
+    """
+    Source answering instantly, so that only get_data's own work is timed
+    """
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        start, end = _day_bounds(day, timezone, self.local_ts)
+        ts = np.arange(start, end, 3600)
+        data = {c: np.random.random(len(ts)) for c in COLUMNS}
+        data["ts"] = ts
+        return pd.DataFrame(data)
+
+
+def bench(years, repeat=3):
+    source = SyntheticSource({})
+    date_from = datetime.datetime(2015, 1, 1)
+    date_to = date_from + datetime.timedelta(days=365 * years)
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = source.get_data(41.29, 2.19, TIMEZONE, date_from, date_to)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+
+def main():
+    results = []
+    for years in YEARS:
+        elapsed, rows = bench(years)
+        results.append((years, elapsed, rows))
+        print(
+            "%d year(s): %8d rows in %7.3fs (%6.1f us/row)"
+            % (years, rows, elapsed, elapsed / rows * 1e6)
+        )
+    first, last = results[0], results[-1]
+    slowdown = (last[1] / last[2]) / (first[1] / first[2])
+    print(
+        "slowdown per row from %d to %d years: %.2f"
+        % (first[0], last[0], slowdown)
+    )
+    return 0 if slowdown <= MAX_SLOWDOWN else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
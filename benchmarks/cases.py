@@ -0,0 +1,351 @@
+"""
+Benchmark cases of the hot paths: getting data from the sources and from
+HBase, saving to HBase and finding the stations closest to coordinates
+and postal codes, over realistic sizes.
+
+Each case is a context manager setting up its data, stub servers or
+in-memory tables, and yielding a function that runs the timed work once
+and returns the number of rows or items it processed.
+"""
+
+import collections
+import contextlib
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytz
+
+from beemeteo.hbase import HBase
+from beemeteo.sources import Source
+from beemeteo.sources import _day_bounds
+from beemeteo.sources.cams import CAMS
+from beemeteo.sources.darksky import DarkSky
+from beemeteo.sources.meteogalicia import MeteoGalicia
+from beemeteo.stations.coordinates import Coordinates
+from beemeteo.stations.postal_code import PostalCode
+from beemeteo.stations.postal_code import load
+from benchmarks.stubs import StubServer
+from benchmarks.stubs import _read
+from benchmarks.stubs import fake_hbase
+
+
+TIMEZONE = pytz.timezone("Europe/Madrid")
+LATITUDE = 41.29
+LONGITUDE = 2.19
+DATE_FROM = datetime.datetime(2016, 1, 1)
+# days of each range, up to five years
+DAYS = collections.OrderedDict(
+    [("1d", 1), ("1m", 31), ("1y", 365), ("5y", 5 * 365 + 1)]
+)
+STATIONS = [1, 10, 100, 1000]
+# coordinates looked up against the stations by the find_closest cases
+QUERIES = 100
+SOURCES = {"cams": CAMS, "darksky": DarkSky, "meteogalicia": MeteoGalicia}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# fresh interpreters started by each run of the start-up cases
+STARTUP_RUNS = 10
+STARTUP = collections.OrderedDict(
+    [
+        ("python", ["-c", "pass"]),
+        ("cli", ["-m", "beemeteo", "--help"]),
+    ]
+    + [
+        (
+            name,
+            [
+                "-c",
+                "import beemeteo.__main__\n"
+                "from beemeteo import registry\n"
+                "registry.get(%r)" % name,
+            ],
+        )
+        for name in sorted(SOURCES)
+    ]
+)
+
+Case = collections.namedtuple("Case", ["name", "setup", "size", "quick"])
+CASES = []
+
+
+def case(name, sizes, quick):
+    """
+    Registers a case once per size
+
+    :param name: prefix of the case names
+    :param sizes: dict of size name to the argument of the setup
+    :param quick: names of the sizes run with --quick
+    """
+
+    def register(setup):
+        setup = contextlib.contextmanager(setup)
+        for size_name, size in sizes.items():
+            CASES.append(
+                Case(
+                    "%s.%s" % (name, size_name),
+                    setup,
+                    size,
+                    size_name in quick,
+                )
+            )
+        return setup
+
+    return register
+
+
+def _date_to(days):
+    return DATE_FROM + datetime.timedelta(days=days)
+
+
+def _stations(count, seed=0):
+    """
+    Stations scattered over the Iberian peninsula
+    """
+    random = np.random.RandomState(seed)
+    return pd.DataFrame(
+        {
+            "latitude": np.round(random.uniform(36.0, 43.5, count), 4),
+            "longitude": np.round(random.uniform(-9.0, 3.0, count), 4),
+        }
+    )
+
+
+class RecordedSource(Source):
+    """
+    Source answering instantly with the recorded DarkSky day, so that only
+    get_data's own work, and HBase's, is timed
+    """
+
+    schema = {"uvIndex": "int64", "windBearing": "int64"}
+
+    def __init__(self, config):
+        super(RecordedSource, self).__init__(config)
+        self.day = pd.DataFrame(
+            json.loads(_read("darksky.json"))["hourly"]["data"]
+        ).drop(columns=["time"])
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        start, end = _day_bounds(day, timezone, self.local_ts)
+        data = self.day.iloc[: (end - start) // 3600].copy()
+        data["ts"] = np.arange(start, start + len(data) * 3600, 3600)
+        return data
+
+
+def _source_get_data(name):
+    def setup(days):
+        with StubServer() as server:
+            config = server.config(name)
+
+            def run():
+                source = SOURCES[name](config)
+                data = source.get_data(
+                    LATITUDE, LONGITUDE, TIMEZONE, DATE_FROM, _date_to(days)
+                )
+                source.http.close()
+                return len(data)
+
+            yield run
+
+    return setup
+
+
+for _name in sorted(SOURCES):
+    case("get_data.%s" % _name, DAYS, quick=["1d", "1m"])(
+        _source_get_data(_name)
+    )
+
+
+@case("get_data.hbase", DAYS, quick=["1d", "1m"])
+def get_data_hbase(days):
+    """
+    get_data of a range already in HBase, as reruns and backfills read it
+    """
+    with fake_hbase() as config:
+        source = RecordedSource(config)
+        source.save(
+            source.get_data(
+                LATITUDE, LONGITUDE, TIMEZONE, DATE_FROM, _date_to(days)
+            ),
+            "meteo_bench",
+        )
+
+        def run():
+            return len(
+                RecordedSource(config).get_data(
+                    LATITUDE,
+                    LONGITUDE,
+                    TIMEZONE,
+                    DATE_FROM,
+                    _date_to(days),
+                    "meteo_bench",
+                )
+            )
+
+        yield run
+
+
+@case("get_data.stations", dict((str(n), n) for n in STATIONS), ["1", "10"])
+def get_data_stations(count):
+    """
+    A day of many stations from DarkSky, one request each, with the source
+    and its connections shared as the command line does
+    """
+    stations = _stations(count)
+    with StubServer() as server:
+        config = server.config("darksky")
+
+        def run():
+            source = DarkSky(config)
+            rows = 0
+            for station in stations.itertuples():
+                rows += len(
+                    source.get_data(
+                        station.latitude,
+                        station.longitude,
+                        TIMEZONE,
+                        DATE_FROM,
+                        _date_to(1),
+                    )
+                )
+            source.http.close()
+            return rows
+
+        yield run
+
+
+@case("source.save", DAYS, quick=["1d", "1m"])
+def source_save(days):
+    with fake_hbase() as config:
+        source = RecordedSource(config)
+        data = source.get_data(
+            LATITUDE, LONGITUDE, TIMEZONE, DATE_FROM, _date_to(days)
+        )
+
+        def run():
+            return source.save(data, "meteo_bench")
+
+        yield run
+
+
+@case("hbase.save", DAYS, quick=["1d", "1m"])
+def hbase_save(days):
+    """
+    HBase.save of the documents of a range, copied on every run as save
+    pops their row fields
+    """
+    with fake_hbase() as config:
+        source = RecordedSource(config)
+        documents = source.get_data(
+            LATITUDE, LONGITUDE, TIMEZONE, DATE_FROM, _date_to(days)
+        ).to_dict("records")
+        hbase = source.hbase
+        with hbase.pooled_table("meteo_bench", {"info": dict()}) as table:
+
+            def run():
+                HBase.save(
+                    table,
+                    [dict(d) for d in documents],
+                    [("info", "all")],
+                    row_fields=["latitude", "longitude", "ts"],
+                )
+                return len(documents)
+
+            yield run
+
+
+@case(
+    "coordinates.find_closest",
+    dict((str(n), n) for n in STATIONS),
+    quick=["1", "10", "100", "1000"],
+)
+def coordinates_find_closest(count):
+    """
+    Stations sorted by distance for QUERIES coordinates
+    """
+    stations = _stations(count)
+    queries = _stations(QUERIES, seed=1)
+
+    def run():
+        for query in queries.itertuples():
+            Coordinates(query.latitude, query.longitude).find_closest(stations)
+        return QUERIES
+
+    yield run
+
+
+@case("postal_code.load", {"all": None}, quick=["all"])
+def postal_code_load(_):
+    """
+    Reading the postal codes shipped with the package
+    """
+
+    def run():
+        load.cache_clear()
+        return len(load()[0])
+
+    yield run
+
+
+@case(
+    "postal_code.find_closest",
+    dict((str(n), n) for n in STATIONS),
+    quick=["1", "10", "100", "1000"],
+)
+def postal_code_find_closest(count):
+    """
+    Closest of count stations to QUERIES Spanish postal codes, looked up
+    one by one
+    """
+    data = load()[0]
+    codes = data[data["country"] == "ES"]["postalCode"].sample(
+        QUERIES, random_state=0
+    )
+    stations = _stations(count)
+
+    def run():
+        for code in codes:
+            PostalCode("ES", code).find_closest(stations)
+        return QUERIES
+
+    yield run
+
+
+@case(
+    "postal_code.resolve_many",
+    dict((str(n), n) for n in [100, 1000, 10000]),
+    quick=["100", "1000", "10000"],
+)
+def postal_code_resolve_many(count):
+    data = load()[0]
+    codes = list(
+        data[data["country"] == "ES"]["postalCode"].sample(
+            count, replace=True, random_state=0
+        )
+    )
+
+    def run():
+        return len(PostalCode.resolve_many("ES", codes))
+
+    yield run
+
+
+@case("startup", STARTUP, quick=list(STARTUP))
+def startup(args):
+    """
+    Start-up of the command line and of each source in a new interpreter,
+    as every short run pays for it. startup.python is the interpreter
+    alone, for reference.
+    """
+
+    def run():
+        for _ in range(STARTUP_RUNS):
+            subprocess.check_call(
+                [sys.executable] + args, cwd=ROOT, stdout=subprocess.DEVNULL
+            )
+        return STARTUP_RUNS
+
+    yield run
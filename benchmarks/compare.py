@@ -0,0 +1,106 @@
+"""
+Compares the results of two benchmark runs, failing when a case got slower
+than the threshold.
+
+Usage: python -m benchmarks.compare BASE NEW [--threshold 1.2]
+
+BASE and NEW are result files, or commits whose results are in
+benchmarks/results.
+"""
+
+import json
+import os
+import sys
+
+import click
+
+from benchmarks.run import _git
+from benchmarks.run import results_path
+
+
+def _load(reference):
+    """
+    :param reference: result file, or commit
+    """
+    if not os.path.exists(reference):
+        sha = _git("rev-parse", "--verify", reference + "^{commit}")
+        if sha is None:
+            raise click.BadParameter(
+                "%s is neither a result file nor a commit" % reference
+            )
+        reference = results_path(sha.strip())
+        if not os.path.exists(reference):
+            raise click.BadParameter("No results in %s" % reference)
+    with open(reference) as f:
+        return json.load(f)
+
+
+def compare(base, new, threshold, min_time):
+    """
+    :param base: results of the reference run
+    :param new: results of the run to check
+    :param threshold: ratio of the best times above which a case regressed
+    :param min_time: seconds under which cases are too noisy to fail
+    :return: list of (case, base seconds, new seconds, ratio, regressed) of
+        the cases of both runs
+    """
+    rows = []
+    for name in sorted(set(base["results"]) & set(new["results"])):
+        before = base["results"][name]["best"]
+        after = new["results"][name]["best"]
+        ratio = after / before if before else float("inf")
+        regressed = ratio > threshold and after >= min_time
+        rows.append((name, before, after, ratio, regressed))
+    return rows
+
+
+@click.command()
+@click.argument("base")
+@click.argument("new")
+@click.option(
+    "--threshold",
+    type=float,
+    default=1.2,
+    help="Ratio of the best times above which a case regressed",
+)
+@click.option(
+    "--min-time",
+    type=float,
+    default=0.001,
+    help="Seconds under which cases are too noisy to fail",
+)
+def main(base, new, threshold, min_time):
+    """
+    Compares two benchmark runs
+    """
+    base, new = _load(base), _load(new)
+    click.echo(
+        "%-36s %12s %12s %8s"
+        % (
+            "case",
+            (base["commit"] or "base")[:10],
+            (new["commit"] or "new")[:10],
+            "ratio",
+        )
+    )
+    rows = compare(base, new, threshold, min_time)
+    for name, before, after, ratio, regressed in rows:
+        click.echo(
+            "%-36s %9.2f ms %9.2f ms %7.2fx%s"
+            % (
+                name,
+                before * 1000,
+                after * 1000,
+                ratio,
+                "  REGRESSION" if regressed else "",
+            )
+        )
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        raise click.ClickException(
+            "%d case(s) slower than %.2fx" % (len(regressions), threshold)
+        )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
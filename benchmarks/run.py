@@ -0,0 +1,143 @@
+"""
+Runs the benchmark suite offline and stores its results as JSON, named
+after the commit they were measured on, for benchmarks.compare.
+
+Usage: python -m benchmarks.run [--quick] [--filter get_data] [--repeat 5]
+"""
+
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import click
+import numpy as np
+
+from benchmarks.cases import CASES
+
+
+RESULTS = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(
+            ("git",) + args,
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+        ).decode("utf-8")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def commit():
+    """
+    :return: hash of the commit checked out, and whether the tree has
+        uncommitted changes
+    """
+    sha = _git("rev-parse", "HEAD")
+    if sha is None:
+        return None, False
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return sha.strip(), bool(status and status.strip())
+
+
+def results_path(sha, dirty=False):
+    return os.path.join(
+        RESULTS, "%s%s.json" % (sha or "unknown", "-dirty" if dirty else "")
+    )
+
+
+def measure(case, repeat, budget):
+    """
+    Runs a case repeat times, or fewer once budget seconds are spent
+
+    :return: dict with the seconds of every run, the best and median ones
+        and the rows processed by a run
+    """
+    with case.setup(case.size) as run:
+        times = []
+        spent = 0.0
+        while len(times) < repeat and (not times or spent < budget):
+            start = time.perf_counter()
+            rows = run()
+            times.append(time.perf_counter() - start)
+            spent += times[-1]
+    return {
+        "times": times,
+        "best": min(times),
+        "median": float(np.median(times)),
+        "rows": int(rows),
+    }
+
+
+@click.command()
+@click.option("--quick", is_flag=True, help="Only run the smallest sizes")
+@click.option(
+    "--filter",
+    "pattern",
+    type=str,
+    help="Only run the cases whose name contains it",
+)
+@click.option(
+    "--repeat", type=int, default=3, help="Runs of each case, best is kept"
+)
+@click.option(
+    "--budget",
+    type=float,
+    default=30.0,
+    help="Seconds after which a case is not repeated again",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="File to write the results to, named after the commit in "
+    "benchmarks/results by default",
+)
+def main(quick, pattern, repeat, budget, output):
+    """
+    Runs the benchmarks
+    """
+    # logging every chunk saved would be timed too
+    logging.getLogger("beemeteo").setLevel(logging.WARNING)
+    sha, dirty = commit()
+    results = {}
+    for case in CASES:
+        if quick and not case.quick:
+            continue
+        if pattern and pattern not in case.name:
+            continue
+        result = measure(case, repeat, budget)
+        results[case.name] = result
+        click.echo(
+            "%-36s %10.2f ms %10d rows %10.2f us/row"
+            % (
+                case.name,
+                result["best"] * 1000,
+                result["rows"],
+                result["best"] / max(1, result["rows"]) * 1e6,
+            )
+        )
+    document = {
+        "commit": sha,
+        "dirty": dirty,
+        "date": datetime.datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": quick,
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS, exist_ok=True)
+        output = results_path(sha, dirty)
+    with open(output, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    click.echo("Results written to %s" % output, err=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
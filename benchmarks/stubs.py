@@ -0,0 +1,256 @@
+"""
+Stand-ins for the services the sources talk to, so that benchmarks run
+offline and only time beemeteo's own work: a local HTTP server replaying
+recorded CAMS, DarkSky and MeteoGalicia responses, and in-memory HBase
+tables.
+"""
+
+import contextlib
+import datetime
+import http.server
+import json
+import os
+import threading
+import time
+
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+import beemeteo.hbase
+import pytz
+
+from beemeteo.testing import FakeConnection
+from beemeteo.testing import FakeConnectionPool
+
+
+RESPONSES = os.path.join(os.path.dirname(__file__), "responses")
+# day every recorded response starts at
+RECORDED_DAY = datetime.datetime(2021, 1, 1)
+
+
+def _read(name):
+    with open(os.path.join(RESPONSES, name)) as f:
+        return f.read()
+
+
+class Recordings:
+    """
+    Recorded responses of a day, replayed for any other day by moving
+    their times
+    """
+
+    def __init__(self):
+        cams = _read("cams.csv").splitlines()
+        # comment lines, then one "start/end;values" line per hour
+        self.cams_header = [line for line in cams if line.startswith("#")]
+        self.cams_values = [
+            line.split(";", 1)[1]
+            for line in cams
+            if line and not line.startswith("#")
+        ]
+        self.darksky = json.loads(_read("darksky.json"))
+        meteogalicia = _read("meteogalicia.csv").splitlines()
+        self.thredds_header = meteogalicia[0]
+        self.thredds_values = [
+            line.split(",", 1)[1] for line in meteogalicia[1:] if line
+        ]
+
+    def cams(self, date_begin, date_end):
+        """
+        :param date_begin: first day, as YYYY-MM-DD
+        :param date_end: last day, as YYYY-MM-DD
+        :return: CAMS radiation service CSV for every hour of the days
+        """
+        day = datetime.datetime.strptime(date_begin, "%Y-%m-%d")
+        end = datetime.datetime.strptime(date_end, "%Y-%m-%d")
+        lines = list(self.cams_header)
+        hours = len(self.cams_values)
+        while day <= end:
+            for i, values in enumerate(self.cams_values):
+                hour = day + datetime.timedelta(hours=i * 24 // hours)
+                lines.append(
+                    "%s/%s;%s"
+                    % (
+                        hour.strftime("%Y-%m-%dT%H:%M:%S.0"),
+                        (hour + datetime.timedelta(hours=1)).strftime(
+                            "%Y-%m-%dT%H:%M:%S.0"
+                        ),
+                        values,
+                    )
+                )
+            day += datetime.timedelta(days=1)
+        return "\n".join(lines) + "\n"
+
+    def darksky_day(self, time):
+        """
+        :param time: start of the day, as in a Time Machine request
+        :return: DarkSky Time Machine JSON of the day
+        """
+        start = datetime.datetime.fromisoformat(time)
+        # days changing to or from summer time have 23 or 25 hours
+        timezone = pytz.timezone(self.darksky["timezone"])
+        end = timezone.localize(
+            datetime.datetime.combine(
+                start.date() + datetime.timedelta(days=1), datetime.time()
+            )
+        )
+        hours = int((end - start).total_seconds()) // 3600
+        recorded = self.darksky["hourly"]["data"]
+        document = dict(self.darksky)
+        document["hourly"] = dict(
+            self.darksky["hourly"],
+            data=[
+                dict(
+                    recorded[min(i, len(recorded) - 1)],
+                    time=int(start.timestamp()) + 3600 * i,
+                )
+                for i in range(hours)
+            ],
+        )
+        return json.dumps(document)
+
+    def thredds(self, path):
+        """
+        :param path: NetCDF Subset Service path of a run and domain
+        :return: point CSV of the run. Only the outer domain, d01, covers
+            the stations, others answer without rows.
+        """
+        if "_d01_" not in path:
+            return self.thredds_header + "\n"
+        run = datetime.datetime.strptime(path.split("_")[-2], "%Y%m%d")
+        lines = [self.thredds_header]
+        for i, values in enumerate(self.thredds_values):
+            hour = run + datetime.timedelta(hours=i)
+            lines.append(
+                "%s,%s" % (hour.strftime("%Y-%m-%dT%H:%M:%SZ"), values)
+            )
+        return "\n".join(lines) + "\n"
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are sent apart, delayed ACKs would stall every
+    # keep-alive request
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if server.latency:
+            time.sleep(server.latency)
+        if url.path.startswith("/soda"):
+            inputs = dict(
+                item.split("=", 1)
+                for item in dict(
+                    item.split("=", 1) for item in url.query.split("&")
+                )["DataInputs"].split(";")
+            )
+            body = server.recordings.cams(
+                inputs["date_begin"], inputs["date_end"]
+            )
+        elif url.path.startswith("/darksky/"):
+            location = unquote(url.path.split("/")[3])
+            body = server.recordings.darksky_day(location.split(",")[2])
+        elif url.path.startswith("/thredds/"):
+            body = server.recordings.thredds(url.path)
+        else:
+            self.send_error(404)
+            return
+        body = body.encode("utf-8")
+        with server.lock:
+            server.requests += 1
+            server.bytes += len(body)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """
+    Local server replaying the recorded responses of the sources, at
+    /soda for CAMS, /darksky for DarkSky and /thredds/ for MeteoGalicia
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        """
+        :param latency: seconds each response is delayed, to mimic the
+            round trip to the real services
+        """
+        super(StubServer, self).__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+        self.recordings = Recordings()
+        self.requests = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def config(self, name):
+        """
+        :param name: source name
+        :return: configuration of the source pointing to this server
+        """
+        return {
+            "cams": {
+                "cams": {
+                    "cams-registered-mails": ["bench@example.com"],
+                    "servers": [self.url + "/soda"],
+                }
+            },
+            "darksky": {
+                "darksky": {"api-key": "bench", "url": self.url + "/darksky"}
+            },
+            "meteogalicia": {"meteogalicia": {"url": self.url + "/thredds/"}},
+        }[name]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+
+@contextlib.contextmanager
+def fake_hbase():
+    """
+    Replaces happybase with in-memory tables, empty on entry
+
+    :return: HBase configuration of the sources
+    """
+    import happybase
+
+    module = beemeteo.hbase
+    saved = (
+        happybase.Connection,
+        happybase.ConnectionPool,
+        module._pools,
+        module._tables,
+    )
+    FakeConnection.reset()
+    happybase.Connection = FakeConnection
+    happybase.ConnectionPool = FakeConnectionPool
+    module._pools = {}
+    module._tables = set()
+    try:
+        yield {"hbase": {"host": "localhost", "port": 9090, "db": "bench"}}
+    finally:
+        (
+            happybase.Connection,
+            happybase.ConnectionPool,
+            module._pools,
+            module._tables,
+        ) = saved
+        FakeConnection.reset()
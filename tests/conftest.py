@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from beemeteo.sources import _day_bounds
+from beemeteo.sources.meteogalicia import MeteoGalicia
+from beemeteo.testing import FakeConnection
+from beemeteo.testing import FakeConnectionPool
+from click.testing import CliRunner
+
+
+@pytest.fixture
+def hbase(monkeypatch):
+    """
+    HBase configuration backed by in-memory tables
+    """
+    FakeConnection.reset()
+    FakeConnectionPool.created = 0
+    monkeypatch.setattr("happybase.Connection", FakeConnection)
+    monkeypatch.setattr("happybase.ConnectionPool", FakeConnectionPool)
+    monkeypatch.setattr("beemeteo.hbase._pools", {})
+    monkeypatch.setattr("beemeteo.hbase._tables", set())
+    return {"hbase": {"host": "localhost", "port": 9090, "db": "test"}}
+
+
+def _get_data_day(self, latitude, longitude, timezone, day):
+    start, end = _day_bounds(day, timezone, self.local_ts)
+    ts = list(range(start, end, 3600))
+    return pd.DataFrame({"ts": ts, "GHI": [latitude] * len(ts)})
+
+
+@pytest.fixture
+def runner(monkeypatch, tmp_path):
+    """
+    CLI runner with a configuration and a stations file in tmp_path, and
+    MeteoGalicia answering every hour of a day with the station's latitude
+    """
+    monkeypatch.setattr(MeteoGalicia, "_get_data_day", _get_data_day)
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "stations.txt").write_text(
+        "41.29\t2.19\n"
+        "42.88\t-8.54\tEurope/Madrid\n"
+        "28.1\t-15.41\tAtlantic/Canary\n"
+    )
+    return CliRunner()
@@ -0,0 +1,171 @@
+import datetime
+import importlib.util
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import pytz
+import requests
+
+from beemeteo.sources import Source
+from beemeteo.sources import _day_bounds
+
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.content = (
+            text if isinstance(text, bytes) else text.encode("utf-8")
+        )
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(
+                "%s Error" % self.status_code, response=self
+            )
+
+
+def patch_get(monkeypatch, get):
+    """
+    Answers the requests of every source with get(url, **kwargs)
+    """
+    monkeypatch.setattr(
+        requests.Session,
+        "get",
+        lambda session, url, **kwargs: get(url, **kwargs),
+    )
+
+
+def soda_response(date_begin, date_end):
+    """
+    CAMS radiation service CSV for every hour between two days (UT)
+    """
+    columns = [
+        "TOA",
+        "Clear sky GHI",
+        "Clear sky BHI",
+        "Clear sky DHI",
+        "Clear sky BNI",
+        "GHI",
+        "BHI",
+        "DHI",
+        "BNI",
+        "Reliability",
+    ]
+    lines = ["# Observation period;" + ";".join(columns)]
+    start = datetime.datetime.strptime(date_begin, "%Y-%m-%d")
+    end = datetime.datetime.strptime(date_end, "%Y-%m-%d")
+    hour = start
+    while hour < end + datetime.timedelta(days=1):
+        period = "%s/%s" % (
+            hour.strftime("%Y-%m-%dT%H:%M:%S.0"),
+            (hour + datetime.timedelta(hours=1)).strftime(
+                "%Y-%m-%dT%H:%M:%S.0"
+            ),
+        )
+        values = [str(float(hour.hour * i)) for i in range(len(columns))]
+        lines.append(";".join([period] + values))
+        hour += datetime.timedelta(hours=1)
+    return "# Coding: utf-8\n#\n" + "\n".join(lines) + "\n"
+
+
+def thredds_response(url):
+    """
+    NetCDF Subset Service point CSV for a MeteoGalicia url. Only the outer
+    domain covers the stations, whose grid point is (41.3, 2.2).
+    """
+    path = url.split("?")[0]
+    lines = [
+        'date,lat[unit="degrees_north"],lon[unit="degrees_east"],'
+        'swflx[unit="W m-2"]'
+    ]
+    if "_d01_" in path:
+        day = datetime.datetime.strptime(path.split("_")[-2], "%Y%m%d")
+        for i in range(96):
+            hour = day + datetime.timedelta(hours=i)
+            lines.append(
+                "%s,41.3,2.2,%s"
+                % (hour.strftime("%Y-%m-%dT%H:%M:%SZ"), float(hour.hour))
+            )
+    return "\n".join(lines) + "\n"
+
+
+def thredds_netcdf(url, curvilinear=False):
+    """
+    NetCDF Subset Service regional NetCDF-3 for a MeteoGalicia url. Only the
+    outer domain has data, on a 0.1 degrees grid where swflx is
+    100 * latitude + 10 * longitude + hour.
+    """
+    from scipy.io import netcdf_file
+
+    path, query = url.split("?")
+    if "_d01_" not in path:
+        return b"Requested bounding box is outside the domain"
+    params = dict(item.split("=") for item in query.split("&"))
+    latitude = np.arange(
+        np.ceil(float(params["south"]) * 10),
+        np.floor(float(params["north"]) * 10) + 1,
+    )
+    longitude = np.arange(
+        np.ceil(float(params["west"]) * 10),
+        np.floor(float(params["east"]) * 10) + 1,
+    )
+    latitude, longitude = latitude / 10, longitude / 10
+    day = datetime.datetime.strptime(path.split("_")[-2], "%Y%m%d")
+    hours = np.arange(96)
+    grid_latitude, grid_longitude = np.meshgrid(
+        latitude, longitude, indexing="ij"
+    )
+    values = (
+        100 * grid_latitude + 10 * grid_longitude + (hours % 24)[:, None, None]
+    )
+
+    content = io.BytesIO()
+    f = netcdf_file(content, "w")
+    f.createDimension("time", len(hours))
+    f.createDimension("y", len(latitude))
+    f.createDimension("x", len(longitude))
+    time = f.createVariable("time", "f8", ("time",))
+    time[:] = hours
+    time.units = "hours since %s" % day.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if curvilinear:
+        latitude, longitude = grid_latitude, grid_longitude
+    lat = f.createVariable("lat", "f4", ("y", "x") if curvilinear else ("y",))
+    lat[:] = latitude
+    lon = f.createVariable("lon", "f4", ("y", "x") if curvilinear else ("x",))
+    lon[:] = longitude
+    swflx = f.createVariable("swflx", "f4", ("time", "y", "x"))
+    swflx[:] = values
+    f.flush()
+    return content.getvalue()
+
+
+TIMEZONE = pytz.timezone("Europe/Madrid")
+
+requires_pyarrow = pytest.mark.skipif(
+    importlib.util.find_spec("pyarrow") is None,
+    reason="pyarrow is not installed",
+)
+
+
+class DummySource(Source):
+    """
+    Source answering every hour of a day, recording the days requested
+    """
+
+    def __init__(self, config):
+        super(DummySource, self).__init__(config)
+        self.requested = []
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        self.requested.append(day)
+        start, end = _day_bounds(day, timezone, self.local_ts)
+        ts = list(range(start, end, 3600))
+        return pd.DataFrame({"ts": ts, "GHI": [float(t % 7) for t in ts]})
@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+import json
+
+import pandas as pd
+import pytest
+import pytz
+
+from beemeteo.sources.cams import CAMS
+from beemeteo.sources.darksky import DarkSky
+from beemeteo.sources.meteogalicia import MeteoGalicia
+
+from tests.fakes import soda_response
+from tests.fakes import thredds_response
+
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestServer  # noqa: E402
+
+
+TIMEZONE = pytz.timezone("Europe/Madrid")
+
+
+async def soda(request):
+    inputs = dict(
+        item.split("=") for item in request.query["DataInputs"].split(";")
+    )
+    return web.Response(
+        text=soda_response(inputs["date_begin"], inputs["date_end"])
+    )
+
+
+async def darksky(request):
+    time = pd.Timestamp(request.match_info["location"].split(",")[2])
+    hours = pd.date_range(time, time + pd.Timedelta(days=1), freq="h")[:-1]
+    return web.Response(
+        text=json.dumps(
+            {
+                "hourly": {
+                    "data": [
+                        {"time": int(h.timestamp()), "temperature": 10.0}
+                        for h in hours
+                    ]
+                }
+            }
+        )
+    )
+
+
+async def meteogalicia(request):
+    return web.Response(text=thredds_response(str(request.url)))
+
+
+def serve(coroutine):
+    async def run():
+        app = web.Application()
+        app.router.add_get("/soda", soda)
+        app.router.add_get("/darksky/{key}/{location}", darksky)
+        app.router.add_get(
+            "/thredds/modelos/WRF_HIST/{domain}/{year}/{month}/{file}",
+            meteogalicia,
+        )
+        async with TestServer(app) as server:
+            return await coroutine(str(server.make_url("")))
+
+    return asyncio.run(run())
+
+
+def test_aget_data_cams():
+    async def run(url):
+        source = CAMS(
+            {
+                "cams": {
+                    "cams-registered-mails": ["user@example.com"],
+                    "servers": [url + "/soda"],
+                }
+            }
+        )
+        return await source.aget_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            datetime.datetime(2021, 1, 1),
+            datetime.datetime(2021, 2, 28),
+        )
+
+    data = serve(run)
+    assert len(data) == 58 * 24 + 1
+    assert data["ts"].is_unique
+
+
+def test_aget_data_darksky():
+    async def run(url):
+        source = DarkSky(
+            {"darksky": {"api-key": "key", "url": url + "/darksky"}}
+        )
+        return await source.aget_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            datetime.datetime(2021, 1, 1),
+            datetime.datetime(2021, 1, 31),
+        )
+
+    data = serve(run)
+    assert list(data.columns) == ["latitude", "longitude", "ts", "temperature"]
+    assert len(data) == 30 * 24 + 1
+
+
+def test_aget_data_many_stations_on_one_loop():
+    stations = [(41.29 + i / 100.0, 2.19) for i in range(20)]
+
+    async def run(url):
+        source = MeteoGalicia({"meteogalicia": {"url": url + "/thredds/"}})
+        semaphore = asyncio.Semaphore(50)
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(
+                *[
+                    source.aget_data(
+                        latitude,
+                        longitude,
+                        TIMEZONE,
+                        datetime.datetime(2021, 1, 1),
+                        datetime.datetime(2021, 1, 10),
+                        session=session,
+                        semaphore=semaphore,
+                    )
+                    for latitude, longitude in stations
+                ]
+            )
+
+    results = serve(run)
+    assert [data["latitude"].iloc[0] for data in results] == [
+        latitude for latitude, _ in stations
+    ]
+    for data in results:
+        assert len(data) == 9 * 24 + 1
@@ -0,0 +1,162 @@
+import datetime
+import glob
+import os
+
+import pandas as pd
+import pytest
+import pytz
+
+from beemeteo.backfill import DONE
+from beemeteo.backfill import FAILED
+from beemeteo.backfill import Backfill
+from beemeteo.backfill import Checkpoint
+from beemeteo.backfill import Progress
+from beemeteo.backfill import work_units
+from beemeteo.export import PartitionedWriter
+from beemeteo.testing import FakeConnection
+
+from tests.fakes import DummySource
+
+
+STATIONS = pd.DataFrame(
+    {
+        "latitude": [41.29, 42.88],
+        "longitude": [2.19, -8.54],
+        "timezone": ["Europe/Madrid", "Europe/Madrid"],
+    }
+)
+DATE_FROM = datetime.datetime(2021, 1, 1)
+DATE_TO = datetime.datetime(2021, 1, 31)
+
+
+class BrokenSource(DummySource):
+    """
+    Fails a day of the first station a number of times
+    """
+
+    def __init__(self, config, failures):
+        super(BrokenSource, self).__init__(config)
+        self.failures = failures
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        if latitude == 41.29 and day.day == 13 and self.failures > 0:
+            self.failures -= 1
+            raise IOError("Connection reset by peer")
+        return super(BrokenSource, self)._get_data_day(
+            latitude, longitude, timezone, day
+        )
+
+
+def _units():
+    return work_units("dummy", STATIONS, DATE_FROM, DATE_TO, chunk_days=7)
+
+
+def test_work_units():
+    units = _units()
+    assert len(units) == 2 * 5
+    station = units[:5]
+    assert station[0].date_from == DATE_FROM
+    assert station[-1].date_to == DATE_TO
+    for previous, unit in zip(station, station[1:]):
+        assert unit.date_from == previous.date_to
+
+
+def test_backfill_retries_with_backoff(hbase, tmp_path):
+    delays = []
+    checkpoint = Checkpoint(str(tmp_path / "backfill.sqlite"))
+    source = BrokenSource(hbase, failures=2)
+    failed = Backfill(
+        source,
+        checkpoint,
+        "meteo_dummy",
+        backoff=5,
+        sleep=delays.append,
+    ).run(_units())
+    assert failed == []
+    assert delays == [5, 10]
+    assert checkpoint.summary() == {DONE: 10}
+    assert checkpoint.status(_units()[1]) == (DONE, 3)
+    assert checkpoint.status(_units()[0]) == (DONE, 1)
+    rows = FakeConnection.store["meteo_dummy"].rows
+    assert len(rows) == 2 * (30 * 24 + 1)
+
+
+def test_backfill_resumes(hbase, tmp_path):
+    path = str(tmp_path / "backfill.sqlite")
+    first = BrokenSource(hbase, failures=10)
+    failed = Backfill(
+        first,
+        Checkpoint(path),
+        "meteo_dummy",
+        retries=1,
+        sleep=lambda delay: None,
+    ).run(_units())
+    assert failed == [_units()[1]]
+    assert Checkpoint(path).summary() == {DONE: 9, FAILED: 1}
+
+    second = BrokenSource(hbase, failures=0)
+    checkpoint = Checkpoint(path)
+    assert Backfill(second, checkpoint, "meteo_dummy").run(_units()) == []
+    # only the failed unit is requested again, less the days its neighbours
+    # saved
+    assert sorted(day.day for day in second.requested) == list(range(8, 15))
+    assert checkpoint.summary() == {DONE: 10}
+    assert checkpoint.status(_units()[1]) == (DONE, 3)
+
+
+def test_backfill_writes_each_instant_once(tmp_path):
+    writer = PartitionedWriter(str(tmp_path / "dataset"), "dummy", "csv")
+    Backfill(
+        DummySource({}),
+        Checkpoint(str(tmp_path / "backfill.sqlite")),
+        writer=writer,
+    ).run(_units())
+    files = glob.glob(
+        os.path.join(str(tmp_path), "dataset", "**", "*.csv"), recursive=True
+    )
+    data = pd.concat(pd.read_csv(f) for f in files)
+    for _, station in data.groupby("latitude"):
+        assert station["ts"].is_unique
+        assert len(station) == 30 * 24 + 1
+
+
+class UTCSource(DummySource):
+    local_ts = False
+
+
+@pytest.mark.parametrize("timezone", ["Europe/Madrid", "America/New_York"])
+def test_backfill_writes_what_get_data_gets(tmp_path, timezone):
+    stations = pd.DataFrame(
+        {"latitude": [41.29], "longitude": [2.19], "timezone": [timezone]}
+    )
+    date_to = datetime.datetime(2021, 1, 5)
+    writer = PartitionedWriter(str(tmp_path / "dataset"), "utc", "csv")
+    Backfill(
+        UTCSource({}),
+        Checkpoint(str(tmp_path / "backfill.sqlite")),
+        writer=writer,
+    ).run(work_units("utc", stations, DATE_FROM, date_to, chunk_days=2))
+    files = glob.glob(
+        os.path.join(str(tmp_path), "dataset", "**", "*.csv"), recursive=True
+    )
+    written = pd.concat(pd.read_csv(f) for f in files).sort_values("ts")
+    expected = UTCSource({}).get_data(
+        41.29, 2.19, pytz.timezone(timezone), DATE_FROM, date_to
+    )
+    assert written["ts"].tolist() == expected["ts"].tolist()
+
+
+def test_backfill_needs_an_output(tmp_path):
+    with pytest.raises(ValueError):
+        Backfill(DummySource({}), Checkpoint(str(tmp_path / "b.sqlite")))
+
+
+def test_progress_eta():
+    now = [0.0]
+    progress = Progress(10, done=4, clock=lambda: now[0])
+    assert progress.eta() is None
+    now[0] = 20.0
+    progress.update(_units()[0])
+    progress.update(_units()[1])
+    assert progress.rate() == 0.1
+    assert progress.eta() == 40.0
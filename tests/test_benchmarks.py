@@ -0,0 +1,76 @@
+import datetime
+import json
+
+import pytest
+import pytz
+
+from benchmarks.cases import CASES
+from benchmarks.cases import SOURCES
+from benchmarks.compare import compare
+from benchmarks.run import main
+from benchmarks.stubs import StubServer
+from click.testing import CliRunner
+
+
+TIMEZONE = pytz.timezone("Europe/Madrid")
+
+
+@pytest.mark.parametrize("name", ["cams", "darksky", "meteogalicia"])
+@pytest.mark.parametrize(
+    "date_from",
+    # across the changes to and from summer time
+    [datetime.datetime(2016, 3, 20), datetime.datetime(2016, 10, 23)],
+)
+def test_stub_server_replays_whole_days(name, date_from):
+    with StubServer() as server:
+        data = SOURCES[name](server.config(name)).get_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            date_from,
+            date_from + datetime.timedelta(days=14),
+        )
+    assert len(data) == 14 * 24 + 1
+    assert data["ts"].is_unique
+    assert server.requests > 0
+
+
+def test_run_writes_results(tmp_path):
+    output = tmp_path / "results.json"
+    result = CliRunner().invoke(
+        main,
+        [
+            "--quick",
+            "--filter",
+            "save.1d",
+            "--repeat",
+            "2",
+            "--output",
+            str(output),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    document = json.loads(output.read_text())
+    assert sorted(document["results"]) == ["hbase.save.1d", "source.save.1d"]
+    for case in document["results"].values():
+        assert len(case["times"]) == 2
+        assert case["best"] == min(case["times"])
+        assert case["rows"] == 25
+
+
+def test_every_case_has_a_unique_name():
+    names = [case.name for case in CASES]
+    assert len(names) == len(set(names))
+
+
+def test_compare_flags_regressions():
+    base = {"results": {"a": {"best": 0.1}, "b": {"best": 0.1}, "c": {}}}
+    new = {"results": {"a": {"best": 0.13}, "b": {"best": 0.11}}}
+    rows = compare(base, new, threshold=1.2, min_time=0.001)
+    assert [(name, regressed) for name, _, _, _, regressed in rows] == [
+        ("a", True),
+        ("b", False),
+    ]
+    # too fast to tell
+    rows = compare(base, new, threshold=1.2, min_time=1)
+    assert not any(row[-1] for row in rows)
@@ -0,0 +1,159 @@
+import datetime
+import glob
+import os
+
+import pandas as pd
+
+from beemeteo.cache import MemoryCache
+from beemeteo.cache import ParquetCache
+from beemeteo.sources.meteogalicia import MeteoGalicia
+from beemeteo.testing import FakeConnection
+
+from tests.fakes import TIMEZONE
+from tests.fakes import DummySource
+from tests.fakes import requires_pyarrow
+
+
+def _day(day):
+    return pd.DataFrame(
+        {"ts": [day * 86400 + h * 3600 for h in range(24)], "GHI": 1.0}
+    )
+
+
+@requires_pyarrow
+def test_cache_round_trip(tmp_path):
+    cache = ParquetCache(str(tmp_path))
+    day = datetime.datetime(2021, 1, 1)
+    assert cache.get("CAMS", 41.29, 2.19, day) is None
+    cache.put("CAMS", 41.29, 2.19, day, _day(0))
+    pd.testing.assert_frame_equal(cache.get("CAMS", 41.29, 2.19, day), _day(0))
+    assert cache.get("CAMS", 41.3, 2.19, day) is None
+    assert (
+        ParquetCache(str(tmp_path)).get("CAMS", 41.29, 2.19, day) is not None
+    )
+
+
+@requires_pyarrow
+def test_cache_evicts_least_recently_used_days(tmp_path):
+    cache = ParquetCache(str(tmp_path))
+    days = [datetime.datetime(2021, 1, d) for d in range(1, 4)]
+    cache.put("CAMS", 41.29, 2.19, days[0], _day(0))
+    size = cache.size
+    cache.max_size = 2 * size + size // 2
+    cache.put("CAMS", 41.29, 2.19, days[1], _day(1))
+    cache.get("CAMS", 41.29, 2.19, days[0])
+    cache.put("CAMS", 41.29, 2.19, days[2], _day(2))
+    assert cache.size <= cache.max_size
+    assert cache.get("CAMS", 41.29, 2.19, days[0]) is not None
+    assert cache.get("CAMS", 41.29, 2.19, days[1]) is None
+    assert cache.get("CAMS", 41.29, 2.19, days[2]) is not None
+
+
+@requires_pyarrow
+def test_cache_shared_by_processes(tmp_path):
+    first = ParquetCache(str(tmp_path))
+    second = ParquetCache(str(tmp_path))
+    days = [datetime.datetime(2021, 1, d) for d in range(1, 5)]
+    assert first.get("CAMS", 41.29, 2.19, days[0]) is None
+    second.put("CAMS", 41.29, 2.19, days[0], _day(0))
+    assert first.get("CAMS", 41.29, 2.19, days[0]) is not None
+    size = first.size
+    first.max_size = second.max_size = 2 * size + size // 2
+    first.put("CAMS", 41.29, 2.19, days[1], _day(1))
+    second.put("CAMS", 41.29, 2.19, days[2], _day(2))
+    first.put("CAMS", 41.29, 2.19, days[3], _day(3))
+    files = glob.glob(str(tmp_path / "**" / "*.parquet"), recursive=True)
+    assert sum(os.path.getsize(f) for f in files) <= first.max_size
+    assert len(files) == 2
+    assert first.get("CAMS", 41.29, 2.19, days[3]) is not None
+
+
+@requires_pyarrow
+def test_get_data_reads_cached_days(tmp_path, hbase):
+    config = dict(hbase, cache={"path": str(tmp_path)})
+    date_from = datetime.datetime(2021, 1, 1)
+    date_to = datetime.datetime(2021, 1, 31)
+    source = DummySource(config)
+    data = source.get_data(
+        41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+    )
+    assert len(source.requested) == 31
+
+    cached = DummySource(config)
+    cached_data = cached.get_data(
+        41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+    )
+    assert cached.requested == []
+    pd.testing.assert_frame_equal(cached_data, data)
+
+
+def test_memory_cache_counts_hits_and_misses():
+    cache = MemoryCache()
+    day = datetime.datetime(2021, 1, 1)
+    assert cache.get("CAMS", 41.29, 2.19, day) is None
+    cache.put("CAMS", 41.29, 2.19, day, _day(0))
+    assert cache.get("CAMS", 41.29, 2.19, day) is not None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["days"] == 1
+
+
+def test_memory_cache_expires_days():
+    cache = MemoryCache()
+    day = datetime.datetime(2021, 1, 1)
+    cache.put("DarkSky", 41.29, 2.19, day, _day(0), ttl=0)
+    assert cache.get("DarkSky", 41.29, 2.19, day) is None
+    assert cache.expired == 1
+    assert cache.size == 0
+
+
+def test_memory_cache_keeps_within_budget():
+    size = int(_day(0).memory_usage(index=True, deep=True).sum())
+    cache = MemoryCache(max_size=2 * size)
+    days = [datetime.datetime(2021, 1, d) for d in range(1, 4)]
+    for i, day in enumerate(days[:2]):
+        cache.put("CAMS", 41.29, 2.19, day, _day(i))
+    cache.get("CAMS", 41.29, 2.19, days[0])
+    cache.put("CAMS", 41.29, 2.19, days[2], _day(2))
+    assert cache.size <= cache.max_size
+    assert cache.evicted == 1
+    assert cache.get("CAMS", 41.29, 2.19, days[1]) is None
+    assert cache.get("CAMS", 41.29, 2.19, days[0]) is not None
+
+
+def test_get_data_memoizes_days(hbase):
+    config = dict(hbase, **{"memory-cache": {}})
+    date_from = datetime.datetime(2021, 1, 1)
+    source = DummySource(config)
+    source.get_data(
+        41.29,
+        2.19,
+        TIMEZONE,
+        date_from,
+        datetime.datetime(2021, 1, 7),
+        "meteo_dummy",
+    )
+    source.requested = []
+    table = FakeConnection.store["meteo_dummy"]
+    table.scans = []
+    data = source.get_data(
+        41.29,
+        2.19,
+        TIMEZONE,
+        date_from + datetime.timedelta(days=3),
+        datetime.datetime(2021, 1, 10),
+        "meteo_dummy",
+    )
+    assert len(source.requested) == 3
+    assert len(table.scans) == 1
+    assert data["ts"].iloc[0] == 1609718400
+    assert source.memory_cache.hits == 5
+
+
+def test_operational_days_of_meteogalicia_expire():
+    source = MeteoGalicia({})
+    today = datetime.datetime.utcnow().replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    assert source.ttl(today) is not None
+    assert source.ttl(today - datetime.timedelta(days=30)) is None
@@ -6,6 +6,10 @@ import pytz
 
 from beemeteo.sources.cams import CAMS
 
+from tests.fakes import FakeResponse
+from tests.fakes import patch_get
+from tests.fakes import soda_response
+
 
 def test_cams():
     username = os.environ.get("SODA_USERNAME")
@@ -19,3 +23,41 @@ def test_cams():
     )
     expected = pd.read_csv("tests/b2back/cams.csv")
     assert data.equals(expected)
+
+
+def test_cams_requests_whole_ranges(monkeypatch):
+    requests = []
+
+    def get(server, params, **kwargs):
+        inputs = dict(
+            item.split("=")
+            for item in params.split("DataInputs=")[1].split("&")[0].split(";")
+        )
+        requests.append((inputs["date_begin"], inputs["date_end"]))
+        return FakeResponse(
+            soda_response(inputs["date_begin"], inputs["date_end"])
+        )
+
+    patch_get(monkeypatch, get)
+    source = CAMS(
+        {
+            "cams": {
+                "cams-registered-mails": ["user@example.com"],
+                "max-days-per-request": 31,
+            }
+        }
+    )
+    data = source.get_data(
+        41.29,
+        2.19,
+        pytz.timezone("Europe/Madrid"),
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 3, 31),
+    )
+    assert requests == [
+        ("2020-12-31", "2021-01-31"),
+        ("2021-01-31", "2021-03-03"),
+        ("2021-03-03", "2021-03-31"),
+    ]
+    assert len(data) == 89 * 24 + 1
+    assert data["ts"].is_unique
@@ -0,0 +1,164 @@
+import collections
+import io
+
+import pandas as pd
+import pytest
+
+from beemeteo.export import FileWriter
+from beemeteo.export import PartitionedWriter
+from beemeteo.export import StationWriter
+from beemeteo.export import writer
+
+from tests.fakes import requires_pyarrow
+
+
+Station = collections.namedtuple("Station", ["latitude", "longitude"])
+STATION = Station(41.29, 2.19)
+
+
+def _chunk(start, hours):
+    ts = [start + h * 3600 for h in range(hours)]
+    return pd.DataFrame(
+        {
+            "latitude": STATION.latitude,
+            "longitude": STATION.longitude,
+            "ts": ts,
+            "GHI": [float(t % 1000) for t in ts],
+        }
+    )
+
+
+# 2021-01-31T00:00 and 2021-02-01T00:00
+JANUARY = 1612051200
+FEBRUARY = 1612137600
+
+
+@pytest.mark.parametrize(
+    "format",
+    [
+        "csv",
+        pytest.param("parquet", marks=requires_pyarrow),
+        pytest.param("feather", marks=requires_pyarrow),
+    ],
+)
+def test_file_writer_chunks(tmp_path, format):
+    path = str(tmp_path / ("data." + format))
+    output = FileWriter(path, format)
+    output.write(STATION, _chunk(JANUARY, 24))
+    # a missing column of a later chunk is written as null
+    output.write(STATION, _chunk(FEBRUARY, 24).drop(columns=["GHI"]))
+    output.close()
+    data = getattr(pd, "read_" + format)(path)
+    assert list(data.columns) == ["latitude", "longitude", "ts", "GHI"]
+    assert len(data) == 48
+    assert data["GHI"][:24].notna().all()
+    assert data["GHI"][24:].isna().all()
+    assert data["ts"].dtype == "int64"
+
+
+def test_file_writer_new_columns(tmp_path):
+    output = FileWriter(str(tmp_path / "data.csv"))
+    output.write(STATION, _chunk(JANUARY, 24).drop(columns=["GHI"]))
+    # losing the column silently is worse than failing
+    with pytest.raises(ValueError):
+        output.write(STATION, _chunk(FEBRUARY, 24))
+    output.close()
+
+
+@pytest.mark.parametrize(
+    "format",
+    [
+        "csv",
+        pytest.param("parquet", marks=requires_pyarrow),
+        pytest.param("feather", marks=requires_pyarrow),
+    ],
+)
+def test_file_writer_schema(tmp_path, format):
+    path = str(tmp_path / ("data." + format))
+    schema = {
+        "latitude": "float64",
+        "longitude": "float64",
+        "ts": "int64",
+        "GHI": "float64",
+        "uvIndex": "int64",
+        "precipType": "object",
+    }
+    output = FileWriter(path, format, schema)
+    output.write(STATION, _chunk(JANUARY, 24).assign(uvIndex=1))
+    # columns first showing up in a later chunk, and an integer one with
+    # missing values
+    output.write(
+        STATION,
+        _chunk(FEBRUARY, 24).assign(uvIndex=float("nan"), precipType="rain"),
+    )
+    output.close()
+    data = getattr(pd, "read_" + format)(path)
+    assert list(data.columns) == list(schema)
+    assert len(data) == 48
+    assert (data["uvIndex"][:24] == 1).all()
+    assert data["uvIndex"][24:].isna().all()
+    assert data["precipType"][:24].isna().all()
+    assert (data["precipType"][24:] == "rain").all()
+
+
+def test_station_writer(tmp_path):
+    output = writer("csv", output_dir=str(tmp_path / "out"))
+    assert isinstance(output, StationWriter)
+    output.write(STATION, _chunk(JANUARY, 24))
+    output.write(Station(42.88, -8.54), _chunk(JANUARY, 24))
+    output.write(STATION, _chunk(FEBRUARY, 24))
+    output.close()
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == [
+        "41.29_2.19.csv",
+        "42.88_-8.54.csv",
+    ]
+    assert len(pd.read_csv(tmp_path / "out" / "41.29_2.19.csv")) == 48
+
+
+@requires_pyarrow
+def test_partitioned_writer(tmp_path):
+    import pyarrow.dataset as ds
+
+    output = PartitionedWriter(str(tmp_path), "darksky", "parquet")
+    output.write(STATION, _chunk(JANUARY, 48))
+    station = tmp_path / "source=darksky" / "station=41.29_2.19"
+    january = station / "year=2021" / "month=1"
+    parts = sorted(p.name for p in january.iterdir())
+    assert parts == ["part-1612051200-1612134000.parquet"]
+    before = (january / parts[0]).stat().st_mtime_ns
+
+    # later chunks add parts and leave the existing ones alone
+    output.write(STATION, _chunk(FEBRUARY + 86400, 24))
+    assert (january / parts[0]).stat().st_mtime_ns == before
+    assert len(list((station / "year=2021" / "month=2").iterdir())) == 2
+    # the same chunk again replaces its own part
+    output.write(STATION, _chunk(FEBRUARY + 86400, 24))
+    assert len(list((station / "year=2021" / "month=2").iterdir())) == 2
+
+    data = (
+        ds.dataset(str(tmp_path), format="parquet", partitioning="hive")
+        .to_table()
+        .to_pandas()
+        .sort_values("ts")
+    )
+    assert len(data) == 72
+    assert data["ts"].is_unique
+    assert set(data["source"]) == {"darksky"}
+    assert set(data["station"]) == {"41.29_2.19"}
+    assert sorted(data["month"].unique()) == [1, 2]
+
+
+def test_writer_stdout(capsysbinary):
+    output = writer("csv")
+    output.write(None, _chunk(JANUARY, 2))
+    output.write(None, _chunk(FEBRUARY, 2))
+    output.close()
+    data = pd.read_csv(io.BytesIO(capsysbinary.readouterr().out))
+    assert len(data) == 4
+
+
+def test_writer_errors():
+    with pytest.raises(ValueError):
+        writer("xlsx")
+    with pytest.raises(ValueError):
+        writer("parquet", partitioned=True)
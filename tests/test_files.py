@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from beemeteo.files import atomic_write
+
+
+def test_atomic_write_replaces_the_file(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path, "w") as f:
+        f.write("old")
+    with atomic_write(path) as tmp:
+        with open(tmp, "w") as f:
+            f.write("new")
+        with open(path) as f:
+            assert f.read() == "old"
+    with open(path) as f:
+        assert f.read() == "new"
+    assert os.listdir(str(tmp_path)) == ["data.csv"]
+
+
+def test_atomic_write_keeps_the_file_on_errors(tmp_path):
+    path = str(tmp_path / "data.csv")
+    with open(path, "w") as f:
+        f.write("old")
+    with pytest.raises(ValueError):
+        with atomic_write(path) as tmp:
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise ValueError()
+    with open(path) as f:
+        assert f.read() == "old"
+    assert os.listdir(str(tmp_path)) == ["data.csv"]
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from beemeteo.hbase import HBase
+from beemeteo.sources import Source
+from beemeteo.testing import FakeConnection
+from beemeteo.testing import FakeConnectionPool
+
+
+def test_sources_share_one_pool(hbase):
+    sources = [Source(hbase) for _ in range(3)]
+    for source in sources:
+        assert source.hbase is source.hbase
+        with source.hbase.pooled_connection():
+            pass
+    assert FakeConnectionPool.created == 1
+
+
+def test_table_is_created_once_per_process(hbase):
+    for _ in range(5):
+        with HBase("localhost", 9090, "test").pooled_table(
+            "meteo", {"info": {}}
+        ) as table:
+            table.put("row", {"info:GHI": "1.0"})
+    assert FakeConnection.created == 1
+    assert FakeConnection.opened == 1
+
+
+def test_table_handles_are_cached(hbase):
+    db = HBase("localhost", 9090, "test", pool_size=1)
+    with db.pooled_table("meteo") as first:
+        pass
+    with db.pooled_table("meteo") as second:
+        pass
+    assert first is second
+
+
+def test_get_table_opens_its_own_connection(hbase):
+    db = HBase("localhost", 9090, "test")
+    connection = db.connection
+    assert connection.is_open
+    db.get_table("meteo").put("row", {"info:GHI": "1.0"})
+    db.get_table("meteo")
+    assert FakeConnection.created == 1
+    assert FakeConnection.opened == 3
+    assert FakeConnectionPool.created == 0
+
+
+def test_health_check_reopens_broken_connections(hbase, monkeypatch):
+    def broken(self):
+        raise IOError("Broken pipe")
+
+    monkeypatch.setattr(FakeConnection, "tables", broken)
+    db = HBase("localhost", 9090, "test", pool_size=1, health_check=True)
+    with db.pooled_connection() as connection:
+        assert connection.is_open
+    assert FakeConnection.opened == 2
+
+
+def _frame(rows):
+    return pd.DataFrame(
+        {
+            "latitude": 41.29,
+            "longitude": 2.19,
+            "ts": np.arange(rows, dtype=np.int64) * 3600 + 1609459200,
+            "GHI": np.linspace(0, 1000, rows),
+            "summary": ["Clear"] * (rows - 1) + [None],
+        }
+    )
+
+
+def test_save_frame_matches_save(hbase):
+    data = _frame(10)
+    db = HBase("localhost", 9090, "test")
+    HBase.save(
+        db.get_table("legacy", {"info": {}}),
+        data.to_dict("records"),
+        [("info", "all")],
+        row_fields=["latitude", "longitude", "ts"],
+    )
+    rows = db.save_frame(
+        "bulk", data, "info", row_fields=["latitude", "longitude", "ts"]
+    )
+    assert rows == 10
+    legacy = FakeConnection.store["legacy"]
+    bulk = FakeConnection.store["bulk"]
+    assert bulk.keys == legacy.keys
+    assert bulk.rows == legacy.rows
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_save_frame_in_chunks(hbase, workers):
+    data = _frame(1000)
+    db = HBase("localhost", 9090, "test")
+    rows = db.save_frame(
+        "meteo",
+        data,
+        "info",
+        row_fields=["latitude", "longitude", "ts"],
+        chunk_size=64,
+        workers=workers,
+    )
+    assert rows == 1000
+    table = FakeConnection.store["meteo"]
+    assert len(table.keys) == 1000
+    assert table.keys[0] == b"41.29~2.19~1609459200"
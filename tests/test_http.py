@@ -0,0 +1,152 @@
+import http.server
+import threading
+import time
+
+import pytest
+import requests
+
+from beemeteo.http import CircuitBreaker
+from beemeteo.http import CircuitOpen
+from beemeteo.http import Transport
+
+from tests.fakes import FakeResponse
+from tests.fakes import patch_get
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0
+    clients = []
+
+    def do_GET(self):
+        Handler.clients.append(self.client_address)
+        time.sleep(Handler.delay)
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.delay = 0
+    Handler.clients = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_connections_are_kept_alive(server):
+    transport = Transport()
+    for _ in range(3):
+        assert transport.get(server + "/path").text == "ok"
+    # a single connection, so a single client port
+    assert len(set(Handler.clients)) == 1
+    assert (
+        transport.stats()["127.0.0.1:%s" % server.split(":")[-1]]["requests"]
+        == 3
+    )
+
+
+def test_read_timeout(server):
+    Handler.delay = 0.5
+    transport = Transport(read_timeout=0.1, retries=1, sleep=lambda s: None)
+    with pytest.raises(requests.Timeout):
+        transport.get(server)
+    host = server.split("//")[1]
+    assert transport.stats()[host]["errors"] == 2
+
+
+def test_failover_and_circuit_breaker(monkeypatch):
+    urls = []
+
+    def get(url, **kwargs):
+        urls.append(url)
+        if url.startswith("http://primary"):
+            return FakeResponse("Service Unavailable", 503)
+        return FakeResponse("ok")
+
+    patch_get(monkeypatch, get)
+    clock = Clock()
+    sleeps = []
+    transport = Transport(
+        breaker_failures=2,
+        breaker_reset=60,
+        clock=clock,
+        sleep=sleeps.append,
+    )
+    servers = ["http://primary/wps", "http://mirror/wps"]
+    for _ in range(4):
+        assert transport.get(servers).text == "ok"
+    # the primary is skipped once its circuit opens
+    assert urls == [servers[0], servers[1]] * 2 + [servers[1]] * 2
+    assert sleeps == []
+    assert transport.stats()["primary"]["breaker"] == "open"
+
+    # a probe once the circuit has been open long enough
+    clock.now = 61
+    urls[:] = []
+    transport.get(servers)
+    assert urls == servers
+
+
+def test_retries_with_jittered_backoff(monkeypatch):
+    responses = [503, 429, 200]
+
+    def get(url, **kwargs):
+        return FakeResponse("", responses.pop(0))
+
+    patch_get(monkeypatch, get)
+    sleeps = []
+    transport = Transport(retries=2, backoff=1, sleep=sleeps.append)
+    assert transport.get("http://host/").status_code == 200
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 1
+    assert 0 <= sleeps[1] <= 2
+
+
+def test_client_errors_are_returned(monkeypatch):
+    patch_get(monkeypatch, lambda url, **kwargs: FakeResponse("", 404))
+    sleeps = []
+    transport = Transport(sleep=sleeps.append)
+    assert transport.get("http://host/").status_code == 404
+    assert sleeps == []
+
+
+def test_circuit_open_everywhere(monkeypatch):
+    patch_get(monkeypatch, lambda url, **kwargs: FakeResponse("", 500))
+    transport = Transport(retries=0, breaker_failures=1, sleep=lambda s: None)
+    with pytest.raises(IOError):
+        transport.get("http://host/")
+    with pytest.raises(CircuitOpen):
+        transport.get("http://host/")
+
+
+def test_circuit_breaker_probes_once():
+    clock = Clock()
+    breaker = CircuitBreaker(failures=1, reset_timeout=10, clock=clock)
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+    clock.now = 10
+    assert breaker.allow()
+    # the probe is in flight
+    assert not breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.allow()
@@ -0,0 +1,219 @@
+import io
+
+import pandas as pd
+
+from beemeteo.__main__ import main
+from beemeteo.sources.meteogalicia import MeteoGalicia
+
+from tests.fakes import requires_pyarrow
+
+
+def test_main_stations(runner, tmp_path):
+    result = runner.invoke(
+        main,
+        [
+            "--name",
+            "meteogalicia",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--stations",
+            str(tmp_path / "stations.txt"),
+            "--timezone",
+            "Europe/Madrid",
+            "--date-from",
+            "2021-01-01",
+            "--date-to",
+            "2021-01-02",
+            "--station-workers",
+            "3",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    data = pd.read_csv(io.StringIO(result.output))
+    assert list(data["latitude"].unique()) == [41.29, 42.88, 28.1]
+    assert len(data) == 3 * 25
+
+
+def test_main_stations_output_dir(runner, tmp_path):
+    result = runner.invoke(
+        main,
+        [
+            "--name",
+            "meteogalicia",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--stations",
+            str(tmp_path / "stations.txt"),
+            "--timezone",
+            "Europe/Madrid",
+            "--date-from",
+            "2021-01-01",
+            "--date-to",
+            "2021-01-02",
+            "--output-dir",
+            str(tmp_path / "out"),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == [
+        "28.1_-15.41.csv",
+        "41.29_2.19.csv",
+        "42.88_-8.54.csv",
+    ]
+
+
+def test_main_stream(runner, tmp_path):
+    result = runner.invoke(
+        main,
+        [
+            "--name",
+            "meteogalicia",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--stations",
+            str(tmp_path / "stations.txt"),
+            "--timezone",
+            "Europe/Madrid",
+            "--date-from",
+            "2021-01-01",
+            "--date-to",
+            "2021-02-15",
+            "--stream",
+            "--chunk-days",
+            "10",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    data = pd.read_csv(io.StringIO(result.output))
+    assert list(data["latitude"].unique()) == [41.29, 42.88, 28.1]
+    for _, station in data.groupby("latitude"):
+        assert len(station) == 45 * 24 + 1
+        assert station["ts"].is_monotonic_increasing
+        assert station["ts"].is_unique
+
+
+def test_main_stream_keeps_late_columns(runner, tmp_path, monkeypatch):
+    # the runner's
+    _get_data_day = MeteoGalicia._get_data_day
+
+    def get_data_day(self, latitude, longitude, timezone, day):
+        data = _get_data_day(self, latitude, longitude, timezone, day)
+        if day.day >= 20:
+            data["precipType"] = "rain"
+        return data
+
+    monkeypatch.setattr(MeteoGalicia, "_get_data_day", get_data_day)
+    monkeypatch.setattr(
+        MeteoGalicia, "schema", dict(MeteoGalicia.schema, precipType="object")
+    )
+    result = runner.invoke(
+        main,
+        [
+            "--name",
+            "meteogalicia",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--latitude",
+            "41.29",
+            "--longitude",
+            "2.19",
+            "--timezone",
+            "Europe/Madrid",
+            "--date-from",
+            "2021-01-01",
+            "--date-to",
+            "2021-01-31",
+            "--stream",
+            "--chunk-days",
+            "10",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    data = pd.read_csv(io.StringIO(result.output))
+    assert len(data) == 30 * 24 + 1
+    assert data["precipType"].notna().sum() == 11 * 24 + 1
+
+
+@requires_pyarrow
+def test_main_partitioned(runner, tmp_path):
+    for date_from, date_to in [
+        ("2021-01-01", "2021-01-31"),
+        ("2021-01-31", "2021-02-15"),
+    ]:
+        result = runner.invoke(
+            main,
+            [
+                "--name",
+                "meteogalicia",
+                "--filename",
+                str(tmp_path / "config.json"),
+                "--stations",
+                str(tmp_path / "stations.txt"),
+                "--timezone",
+                "Europe/Madrid",
+                "--date-from",
+                date_from,
+                "--date-to",
+                date_to,
+                "--stream",
+                "--format",
+                "parquet",
+                "--output",
+                str(tmp_path / "dataset"),
+                "--partitioned",
+            ],
+        )
+        assert result.exit_code == 0, result.output
+    data = pd.read_parquet(tmp_path / "dataset")
+    assert sorted(data["station"].unique()) == [
+        "28.1_-15.41",
+        "41.29_2.19",
+        "42.88_-8.54",
+    ]
+    for _, station in data.groupby("station"):
+        # the day shared by both runs is written twice, once by each
+        assert len(station) - station["ts"].nunique() == 1
+        assert station["ts"].nunique() == 45 * 24 + 1
+
+
+def test_main_partitioned_needs_output(runner, tmp_path):
+    result = runner.invoke(
+        main,
+        [
+            "--name",
+            "meteogalicia",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--partitioned",
+        ],
+    )
+    assert result.exit_code == 2
+    assert "--partitioned needs --output" in result.output
+
+
+def test_main_stations_timezones(runner, tmp_path):
+    (tmp_path / "timezones.txt").write_text(
+        "42.88\t-8.54\tEurope/Madrid\n28.1\t-15.41\tAtlantic/Canary\n"
+    )
+    args = [
+        "--name",
+        "meteogalicia",
+        "--filename",
+        str(tmp_path / "config.json"),
+        "--date-from",
+        "2021-01-01",
+        "--date-to",
+        "2021-01-02",
+    ]
+    result = runner.invoke(
+        main, args + ["--stations", str(tmp_path / "timezones.txt")]
+    )
+    assert result.exit_code == 0, result.output
+    data = pd.read_csv(io.StringIO(result.output))
+    assert list(data["latitude"].unique()) == [42.88, 28.1]
+    assert len(data) == 2 * 25
+    result = runner.invoke(
+        main, args + ["--stations", str(tmp_path / "stations.txt")]
+    )
+    assert result.exit_code == 2
+    assert "1 station(s) without timezone" in result.output
@@ -1,9 +1,21 @@
 import datetime
+import time
 
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
+import pytest
 import pytz
+import requests
 
 from beemeteo.sources.meteogalicia import MeteoGalicia
+from beemeteo.sources.meteogalicia.grid import Grid
+
+from tests.fakes import FakeResponse
+from tests.fakes import patch_get
+from tests.fakes import thredds_netcdf
+from tests.fakes import thredds_response
 
 
 def test_meteogalicia():
@@ -17,3 +29,189 @@ def test_meteogalicia():
     )
     expected = pd.read_csv("tests/b2back/meteogalicia.csv")
     assert data.equals(expected)
+
+
+def test_run_of_the_day_before(monkeypatch):
+    urls = []
+
+    def get(url, **kwargs):
+        urls.append(url)
+        raise IOError("offline")
+
+    patch_get(monkeypatch, get)
+    MeteoGalicia({})._get_data_day(
+        41.29,
+        2.19,
+        pytz.timezone("Europe/Madrid"),
+        datetime.datetime(2021, 1, 2),
+    )
+    assert len(urls) == 5
+    assert all("_20210101_0000.nc4" in url for url in urls)
+
+
+def _fake_thredds(monkeypatch, delay=0):
+    urls = []
+
+    def get(url, **kwargs):
+        urls.append(url)
+        time.sleep(delay)
+        return FakeResponse(thredds_response(url))
+
+    patch_get(monkeypatch, get)
+    return urls
+
+
+def test_resolution_is_remembered(monkeypatch):
+    urls = _fake_thredds(monkeypatch)
+    source = MeteoGalicia({})
+    data = source.get_data(
+        41.29,
+        2.19,
+        pytz.timezone("Europe/Madrid"),
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 5),
+    )
+    assert len(data) == 4 * 24 + 1
+    # the first run finds the domain, the following ones go straight to it
+    assert len(urls) == 3 + 1
+    assert all("_d01_" in url for url in urls[3:])
+    assert all("longitude=2.2&latitude=41.3&" in url for url in urls[3:])
+
+
+def test_stations_in_a_cell_share_downloads(monkeypatch):
+    urls = _fake_thredds(monkeypatch, delay=0.1)
+    source = MeteoGalicia({})
+    timezone = pytz.timezone("Europe/Madrid")
+    day = datetime.datetime(2021, 1, 2)
+    stations = [(41.29, 2.19), (41.31, 2.21), (41.28, 2.18)]
+    for latitude, longitude in stations:
+        source._get_data_day(latitude, longitude, timezone, day)
+    del urls[:]
+    with ThreadPoolExecutor(max_workers=len(stations)) as executor:
+        results = list(
+            executor.map(
+                lambda station: source._get_data_day(
+                    station[0], station[1], timezone, day
+                ),
+                stations,
+            )
+        )
+    assert len(urls) == 1
+    for data in results:
+        pd.testing.assert_frame_equal(data, results[0])
+
+
+def _fake_thredds_regions(monkeypatch, curvilinear=False):
+    urls = []
+
+    def get(url, **kwargs):
+        urls.append(url)
+        return FakeResponse(thredds_netcdf(url, curvilinear))
+
+    patch_get(monkeypatch, get)
+    return urls
+
+
+@pytest.mark.parametrize("curvilinear", [False, True])
+def test_grid_lookups(curvilinear):
+    pytest.importorskip("scipy")
+    grid = Grid.from_netcdf(
+        thredds_netcdf(
+            "http://thredds/wrf_arw_det_history_d01_20210101_0000.nc4?"
+            "north=42&south=41&east=3&west=2",
+            curvilinear,
+        )
+    )
+    assert len(grid.times) == 96
+    assert grid.times[0] == pd.Timestamp("2021-01-01", tz="UTC")
+    nearest = grid.lookup([41.29, 41.96, 45.0], [2.19, 2.52, 2.5])
+    np.testing.assert_allclose(
+        nearest[10, :2], [4130 + 22 + 10, 4200 + 25 + 10]
+    )
+    assert np.isnan(nearest[:, 2]).all()
+    bilinear = grid.lookup([41.29, 41.96], [2.19, 2.52], method="bilinear")
+    expected = [4160.9, 4231.2] if not curvilinear else nearest[10, :2]
+    np.testing.assert_allclose(bilinear[10], expected, rtol=1e-6)
+
+
+def test_region_data(monkeypatch):
+    pytest.importorskip("scipy")
+    urls = _fake_thredds_regions(monkeypatch)
+    source = MeteoGalicia({})
+    stations = pd.DataFrame(
+        {
+            "latitude": [41.29, 41.31, 41.5],
+            "longitude": [2.19, 2.21, 2.02],
+            "timezone": "Europe/Madrid",
+        }
+    )
+    data = source.get_region_data(
+        stations,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 10),
+        chunk_days=3,
+    )
+    assert list(data.columns) == ["latitude", "longitude", "ts", "GHI"]
+    assert len(data) == 3 * (9 * 24 + 1)
+    # one download for each run, after finding the domain of the region
+    runs = {url.split("?")[0].split("_")[-2] for url in urls}
+    assert len(urls) == len(runs) + 2
+    assert all("accept=netcdf" in url for url in urls)
+    first = data[data["latitude"] == 41.29]
+    hours = pd.to_datetime(first["ts"], unit="s").dt.hour.to_numpy()
+    # local ts of Madrid in winter, and swflx at the closest grid point
+    np.testing.assert_allclose(
+        first["GHI"], 4130 + 22 + (hours - 1) % 24, rtol=1e-6
+    )
+
+
+def test_region_data_leaves_the_source_alone(monkeypatch):
+    pytest.importorskip("scipy")
+
+    def get(url, **kwargs):
+        if "accept=netcdf" in url:
+            return FakeResponse(thredds_netcdf(url))
+        return FakeResponse(thredds_response(url))
+
+    patch_get(monkeypatch, get)
+    source = MeteoGalicia({})
+    date_from = datetime.datetime(2021, 1, 1)
+    date_to = datetime.datetime(2021, 1, 2)
+    source.get_region_data(
+        pd.DataFrame(
+            {"latitude": [41.29], "longitude": [2.19], "timezone": "UTC"}
+        ),
+        date_from,
+        date_to,
+    )
+    assert source.region is None
+    # outside the region of the previous call
+    data = source.get_data(43.0, -8.0, pytz.UTC, date_from, date_to)
+    assert len(data) == 25
+
+
+def test_region_download_errors_are_not_remembered(monkeypatch):
+    pytest.importorskip("scipy")
+    failures = []
+
+    def get(url, **kwargs):
+        if "_d01_" in url and broken:
+            failures.append(url)
+            raise requests.ConnectionError("Connection reset")
+        return FakeResponse(thredds_netcdf(url))
+
+    patch_get(monkeypatch, get)
+    source = MeteoGalicia(
+        {
+            "http": {"retries": 0},
+            "meteogalicia": {"region": {"bbox": [2.0, 41.0, 2.5, 41.5]}},
+        }
+    )
+    day = datetime.datetime(2021, 1, 2)
+    broken = True
+    assert len(source._get_data_day(41.29, 2.19, pytz.UTC, day)) == 0
+    assert len(failures) == 2
+    broken = False
+    # the domains outside the region are remembered, the failures are not
+    assert len(source._get_data_day(41.29, 2.19, pytz.UTC, day)) == 96
+    assert sum(isinstance(g, Exception) for g in source._grids.values()) == 3
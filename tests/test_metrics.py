@@ -0,0 +1,159 @@
+import datetime
+import json
+
+import pytest
+
+from beemeteo.__main__ import main
+from beemeteo.http import Transport
+from beemeteo.metrics import REGISTRY
+from beemeteo.metrics import Histogram
+from beemeteo.metrics import Metrics
+
+from tests.fakes import TIMEZONE
+from tests.fakes import DummySource
+from tests.fakes import FakeResponse
+from tests.fakes import patch_get
+
+
+@pytest.fixture(autouse=True)
+def registry():
+    REGISTRY.reset()
+    yield REGISTRY
+    REGISTRY.reset()
+
+
+def test_histogram_quantiles():
+    histogram = Histogram(buckets=(1.0, 2.0, 4.0))
+    for value in [0.5] * 50 + [1.5] * 45 + [3.0] * 5:
+        histogram.observe(value)
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert summary["sum"] == pytest.approx(107.5)
+    assert summary["max"] == 3.0
+    assert summary["p50"] == pytest.approx(1.0)
+    assert summary["p95"] == pytest.approx(2.0)
+    assert Histogram().quantile(0.5) is None
+
+
+def test_prometheus_textfile(tmp_path):
+    metrics = Metrics()
+    metrics.inc("days", 3, source="DarkSky", origin="hbase")
+    metrics.inc("days", source="DarkSky", origin="fetch")
+    metrics.observe("stage_seconds", 0.002, source="DarkSky", stage="fetch")
+    metrics.write_prometheus(str(tmp_path / "beemeteo.prom"))
+    lines = (tmp_path / "beemeteo.prom").read_text().splitlines()
+    assert lines[0] == "# TYPE beemeteo_days_total counter"
+    assert 'beemeteo_days_total{origin="hbase",source="DarkSky"} 3' in lines
+    assert 'beemeteo_days_total{origin="fetch",source="DarkSky"} 1' in lines
+    assert "# TYPE beemeteo_stage_seconds histogram" in lines
+    assert (
+        'beemeteo_stage_seconds_bucket{source="DarkSky",stage="fetch",'
+        'le="0.001"} 0' in lines
+    )
+    assert (
+        'beemeteo_stage_seconds_bucket{source="DarkSky",stage="fetch",'
+        'le="+Inf"} 1' in lines
+    )
+    assert (
+        'beemeteo_stage_seconds_count{source="DarkSky",stage="fetch"} 1'
+        in lines
+    )
+    assert list(tmp_path.iterdir()) == [tmp_path / "beemeteo.prom"]
+
+
+def test_get_data_counts_days_by_origin(hbase, registry):
+    args = (
+        41.29,
+        2.19,
+        TIMEZONE,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 10),
+        "meteo_dummy",
+    )
+    source = DummySource(hbase)
+    data = source.get_data(*args)
+    source.save(data, "meteo_dummy")
+    assert registry.counter("days", source="DummySource", origin="fetch") == 10
+    # whole days are fetched, the rows past date_to are then dropped
+    assert (
+        registry.counter("rows", source="DummySource", operation="fetch")
+        == 10 * 24
+    )
+    assert registry.counter(
+        "rows", source="DummySource", operation="save"
+    ) == len(data)
+
+    DummySource(hbase).get_data(*args)
+    assert registry.counter("days", source="DummySource", origin="hbase") == 10
+    assert registry.counter("days", source="DummySource", origin="fetch") == 10
+    assert registry.counter(
+        "rows", source="DummySource", operation="hbase"
+    ) == len(data)
+    for stage in ["hbase", "fetch", "merge", "assemble", "save"]:
+        assert registry.histogram(
+            "stage_seconds", source="DummySource", stage=stage
+        ).count, stage
+    snapshot = json.loads(registry.to_json())
+    assert {"name", "labels", "count", "p95"} <= set(snapshot["histograms"][0])
+
+
+def test_transport_counts_bytes_per_host(monkeypatch, registry):
+    def get(url, **kwargs):
+        if "down" in url:
+            return FakeResponse("unavailable", 503)
+        return FakeResponse("0123456789")
+
+    patch_get(monkeypatch, get)
+    transport = Transport(
+        retries=0, metrics=registry, source="CAMS", sleep=lambda s: None
+    )
+    transport.get(["http://down.example.com/", "http://up.example.com/"])
+    assert (
+        registry.counter("http_bytes", source="CAMS", host="up.example.com")
+        == 10
+    )
+    assert (
+        registry.counter("http_errors", source="CAMS", host="down.example.com")
+        == 1
+    )
+    assert (
+        registry.histogram(
+            "http_request_seconds", source="CAMS", host="up.example.com"
+        ).count
+        == 1
+    )
+
+
+def test_main_profile(runner, tmp_path):
+    result = runner.invoke(
+        main,
+        [
+            "--name",
+            "meteogalicia",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--stations",
+            str(tmp_path / "stations.txt"),
+            "--timezone",
+            "Europe/Madrid",
+            "--date-from",
+            "2021-01-01",
+            "--date-to",
+            "2021-01-02",
+            "--profile",
+            "--metrics-json",
+            str(tmp_path / "metrics.json"),
+        ],
+    )
+    assert result.exit_code == 0, result.stderr
+    assert 'stage_seconds{source="MeteoGalicia",stage="fetch"}' in (
+        result.stderr
+    )
+    assert 'days{origin="fetch",source="MeteoGalicia"}' in result.stderr
+    metrics = json.loads((tmp_path / "metrics.json").read_text())
+    days = [
+        counter
+        for counter in metrics["counters"]
+        if counter["name"] == "days" and counter["labels"]["origin"] == "fetch"
+    ]
+    assert days[0]["value"] == 3 * 2
@@ -0,0 +1,273 @@
+import asyncio
+import datetime
+import time
+
+import pandas as pd
+import pytest
+import pytz
+
+from beemeteo.backfill import Backfill
+from beemeteo.backfill import Checkpoint
+from beemeteo.backfill import work_units
+from beemeteo.quota import QuotaExceeded
+from beemeteo.quota import QuotaScheduler
+from beemeteo.quota import TokenBucket
+from beemeteo.sources import FetchError
+from beemeteo.sources.cams import CAMS
+from beemeteo.sources.darksky import DarkSky
+
+from tests.fakes import DummySource
+from tests.fakes import FakeResponse
+from tests.fakes import patch_get
+from tests.fakes import soda_response
+
+
+TIMEZONE = pytz.timezone("Europe/Madrid")
+MAILS = ["a@example.com", "b@example.com", "c@example.com"]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket():
+    clock = Clock()
+    bucket = TokenBucket(rate=0.5, burst=2, clock=clock)
+    assert [bucket.take() for _ in range(4)] == [0.0, 0.0, 2.0, 4.0]
+    clock.now = 6.0
+    assert bucket.delay() == 0.0
+    assert bucket.take() == 0.0
+
+
+def test_scheduler_spreads_requests():
+    clock = Clock()
+    quota = QuotaScheduler("CAMS", MAILS, rate=1.0, clock=clock)
+    reserved = [quota.reserve() for _ in range(6)]
+    assert [mail for mail, _ in reserved] == MAILS * 2
+    assert [delay for _, delay in reserved] == [0.0] * 3 + [1.0] * 3
+
+
+def test_scheduler_daily_limit_is_shared(tmp_path):
+    path = str(tmp_path / "quota.sqlite")
+    day = ["2021-01-01"]
+
+    def scheduler():
+        return QuotaScheduler(
+            "CAMS", MAILS[:2], daily_limit=2, path=path, today=lambda: day[0]
+        )
+
+    first = scheduler()
+    assert first.acquire() == MAILS[0]
+    second = scheduler()
+    assert second.acquire() == MAILS[1]
+    assert second.remaining() == {MAILS[0]: 1, MAILS[1]: 1}
+    first.acquire()
+    second.acquire()
+    with pytest.raises(QuotaExceeded):
+        first.acquire()
+    # the quota is reset every day
+    day[0] = "2021-01-02"
+    assert first.remaining() == {MAILS[0]: 2, MAILS[1]: 2}
+
+
+def test_scheduler_aacquire_does_not_block_the_loop(monkeypatch):
+    quota = QuotaScheduler("CAMS", MAILS)
+    reserve = quota.reserve
+    ticks = []
+    during = []
+
+    def blocking_reserve():
+        # as when another process holds the usage file
+        time.sleep(0.2)
+        during.append(len(ticks))
+        return reserve()
+
+    monkeypatch.setattr(quota, "reserve", blocking_reserve)
+
+    async def tick():
+        while len(ticks) < 5:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        return await asyncio.gather(quota.aacquire(), tick())
+
+    credential, _ = asyncio.run(main())
+    assert credential == MAILS[0]
+    # other coroutines kept running while reserving
+    assert during == [5]
+
+
+def test_scheduler_exhausted_credentials():
+    quota = QuotaScheduler("CAMS", MAILS)
+    quota.exhausted(MAILS[0])
+    assert {quota.acquire() for _ in range(4)} == set(MAILS[1:])
+    assert quota.remaining() == {MAILS[0]: 0, MAILS[1]: None, MAILS[2]: None}
+    quota.exhausted(MAILS[1])
+    quota.exhausted(MAILS[2])
+    with pytest.raises(QuotaExceeded):
+        quota.acquire()
+
+
+def test_scheduler_plan():
+    quota = QuotaScheduler("CAMS", MAILS[:2], daily_limit=10)
+    for _ in range(5):
+        quota.acquire()
+    assert quota.plan(10) == {"requests": 10, "today": 10, "days": 1}
+    assert quota.plan(15) == {"requests": 15, "today": 15, "days": 1}
+    assert quota.plan(16) == {"requests": 16, "today": 15, "days": 2}
+    assert quota.plan(56) == {"requests": 56, "today": 15, "days": 4}
+    assert QuotaScheduler("CAMS", MAILS).plan(100)["today"] == 100
+
+
+def _soda(used, failing=()):
+    """
+    SoDa service where the mails in used have no quota left and the
+    servers in failing are down
+    """
+    requests = []
+
+    def get(server, params, **kwargs):
+        inputs = dict(
+            item.split("=")
+            for item in params.split("DataInputs=")[1].split("&")[0].split(";")
+        )
+        mail = inputs["username"].replace("%2540", "@")
+        requests.append((server, mail))
+        if server in failing:
+            return FakeResponse("Service Unavailable", 503)
+        if mail in used:
+            return FakeResponse(
+                "<ows:ExceptionText>Maximum number of daily requests "
+                "reached</ows:ExceptionText>",
+                400,
+            )
+        return FakeResponse(
+            soda_response(inputs["date_begin"], inputs["date_end"])
+        )
+
+    return get, requests
+
+
+def _cams(servers=None):
+    config = {"cams-registered-mails": list(MAILS)}
+    if servers is not None:
+        config["servers"] = servers
+    return CAMS({"cams": config, "http": {"retries": 0}})
+
+
+def test_cams_skips_used_mails_only(monkeypatch):
+    get, requests = _soda(used={MAILS[0]})
+    patch_get(monkeypatch, get)
+    source = _cams(["primary"])
+    args = (41.29, 2.19, TIMEZONE, datetime.datetime(2021, 1, 1))
+    assert len(source.get_data(*args, datetime.datetime(2021, 1, 2))) > 0
+    assert len(source.get_data(*args, datetime.datetime(2021, 1, 5))) > 0
+    # the mail after the used one is not skipped, nor is the list changed
+    assert [mail for _, mail in requests] == [MAILS[0], MAILS[1], MAILS[2]]
+    assert source.cams_registered_mails == MAILS
+    assert source.quota.remaining()[MAILS[0]] == 0
+
+
+def test_cams_transient_errors_keep_the_mail(monkeypatch):
+    get, requests = _soda(used=set(), failing={"primary", "mirror"})
+    patch_get(monkeypatch, get)
+    source = _cams(["primary", "mirror"])
+    with pytest.raises(Exception) as error:
+        source.get_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            datetime.datetime(2021, 1, 1),
+            datetime.datetime(2021, 1, 2),
+        )
+    assert all("HTTP 503" in str(e) for e in error.value.errors.values())
+    assert requests == [("primary", MAILS[0]), ("mirror", MAILS[0])]
+    assert source.quota.remaining()[MAILS[0]] is None
+
+
+def test_darksky_rotates_keys(monkeypatch):
+    urls = []
+
+    def get(url, **kwargs):
+        urls.append(url)
+        if "/used/" in url:
+            return FakeResponse("daily usage limit exceeded", 403)
+        time = pd.Timestamp(url.split(",")[2].split("?")[0])
+        return FakeResponse(
+            '{"hourly": {"data": [{"time": %d, "temperature": 1.0}]}}'
+            % time.timestamp()
+        )
+
+    patch_get(monkeypatch, get)
+    source = DarkSky({"darksky": {"api-keys": ["used", "key"]}})
+    data = source.get_data(
+        41.29,
+        2.19,
+        TIMEZONE,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 3),
+    )
+    assert len(data) > 0
+    assert sum("/used/" in url for url in urls) == 1
+    assert source.quota.remaining() == {"used": 0, "key": None}
+
+
+def test_darksky_refused_key_is_not_a_quota(monkeypatch):
+    def get(url, **kwargs):
+        return FakeResponse('{"code":403,"error":"permission denied"}', 403)
+
+    patch_get(monkeypatch, get)
+    source = DarkSky({"darksky": {"api-keys": ["wrong", "key"]}})
+    with pytest.raises(FetchError):
+        source.get_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            datetime.datetime(2021, 1, 1),
+            datetime.datetime(2021, 1, 1),
+        )
+    assert source.quota.remaining() == {"wrong": None, "key": None}
+
+
+class QuotaSource(DummySource):
+    def __init__(self, config, quota):
+        super(QuotaSource, self).__init__(config)
+        self.quota = quota
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        self.quota.acquire()
+        return super(QuotaSource, self)._get_data_day(
+            latitude, longitude, timezone, day
+        )
+
+
+def test_backfill_stops_when_the_quota_is_used(hbase, tmp_path):
+    stations = pd.DataFrame(
+        {"latitude": [41.29], "longitude": [2.19], "timezone": ["UTC"]}
+    )
+    units = work_units(
+        "dummy",
+        stations,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 31),
+        chunk_days=5,
+    )
+    quota = QuotaScheduler("dummy", ["key"], daily_limit=12)
+    checkpoint = Checkpoint(str(tmp_path / "backfill.sqlite"))
+    sleeps = []
+    left = Backfill(
+        QuotaSource(hbase, quota),
+        checkpoint,
+        "meteo_dummy",
+        sleep=sleeps.append,
+    ).run(units)
+    # each unit requests 6 days, the day before included, and the quota
+    # is not retried
+    assert len(left) == len(units) - 2
+    assert sleeps == []
+    assert checkpoint.summary() == {"done": 2, "pending": len(units) - 2}
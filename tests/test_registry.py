@@ -0,0 +1,105 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from beemeteo import registry
+from beemeteo.__main__ import main
+from beemeteo.sources.meteogalicia import MeteoGalicia
+from click.testing import CliRunner
+
+from tests.fakes import DummySource
+
+
+@pytest.fixture(autouse=True)
+def sources(monkeypatch):
+    monkeypatch.setattr(registry, "_sources", dict(registry.BUILTIN))
+    monkeypatch.setattr(registry, "_loaded", {})
+    monkeypatch.setattr(registry, "_discovered", False)
+    monkeypatch.setattr(registry, "_entry_points", lambda: {})
+
+
+def test_get_builtin_source():
+    assert registry.get("meteogalicia") is MeteoGalicia
+    assert registry.names() == ["cams", "darksky", "meteogalicia"]
+
+
+def test_get_unknown_source():
+    with pytest.raises(ValueError) as e:
+        registry.get("openweather")
+    assert "cams, darksky, meteogalicia" in str(e.value)
+
+
+def test_register():
+    registry.register("dummy", "tests.test_sources:DummySource")
+    assert registry.get("dummy") is DummySource
+    registry.register("dummy", MeteoGalicia)
+    assert registry.get("dummy") is MeteoGalicia
+
+
+def test_entry_points(monkeypatch):
+    calls = []
+
+    def entry_points():
+        calls.append(1)
+        return {
+            "dummy": "tests.test_sources:DummySource",
+            "cams": "tests.test_sources:DummySource",
+        }
+
+    monkeypatch.setattr(registry, "_entry_points", entry_points)
+    # known names do not look plugins up
+    assert registry.get("meteogalicia") is MeteoGalicia
+    assert calls == []
+    assert registry.get("dummy") is DummySource
+    # the package's sources take precedence
+    assert registry.get("cams").__name__ == "CAMS"
+    assert "dummy" in registry.names()
+    assert calls == [1]
+
+
+def test_only_the_selected_source_is_imported():
+    code = (
+        "import json, sys\n"
+        "import beemeteo.__main__\n"
+        "from beemeteo import registry\n"
+        "registry.get('meteogalicia')\n"
+        "print(json.dumps(sorted(sys.modules)))\n"
+    )
+    modules = json.loads(subprocess.check_output([sys.executable, "-c", code]))
+    assert "beemeteo.sources.meteogalicia" in modules
+    for module in [
+        "beemeteo.sources.cams",
+        "beemeteo.sources.darksky",
+        "forecastio",
+        "happybase",
+        "scipy.spatial",
+        "aiohttp",
+    ]:
+        assert module not in modules
+
+
+def test_main_unknown_source(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    result = CliRunner().invoke(
+        main,
+        [
+            "--name",
+            "openweather",
+            "--filename",
+            str(tmp_path / "config.json"),
+            "--latitude",
+            "41.29",
+            "--longitude",
+            "2.19",
+            "--timezone",
+            "Europe/Madrid",
+            "--date-from",
+            "2021-01-01",
+            "--date-to",
+            "2021-01-02",
+        ],
+    )
+    assert result.exit_code == 2
+    assert "Unknown source openweather" in result.output
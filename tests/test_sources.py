@@ -0,0 +1,199 @@
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from beemeteo.sources import FetchError
+from beemeteo.sources import _decode_column
+from beemeteo.testing import FakeConnection
+
+from tests.fakes import TIMEZONE
+from tests.fakes import DummySource
+
+
+def test_get_data_without_hbase():
+    source = DummySource({})
+    data = source.get_data(
+        41.29,
+        2.19,
+        TIMEZONE,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 2),
+    )
+    assert list(data.columns) == ["latitude", "longitude", "ts", "GHI"]
+    assert data["ts"].iloc[0] == 1609459200
+    assert data["ts"].iloc[-1] == 1609545600
+    assert data["ts"].is_monotonic_increasing
+    assert len(data) == 25
+
+
+def test_get_data_reads_stored_days_with_one_bounded_scan(hbase):
+    date_from = datetime.datetime(2021, 1, 1)
+    date_to = datetime.datetime(2021, 1, 31)
+    source = DummySource(hbase)
+    data = source.get_data(
+        41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+    )
+    source.save(data, "meteo_dummy")
+    source.save(data.assign(latitude=41.3), "meteo_dummy")
+
+    table = FakeConnection.store["meteo_dummy"]
+    table.scans = []
+    cached = DummySource(hbase)
+    cached_data = cached.get_data(
+        41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+    )
+    assert len(table.scans) == 1
+    assert table.scans[0]["row_start"].startswith("41.29~2.19~")
+    assert table.scans[0]["row_stop"].startswith("41.29~2.19~")
+    assert (cached_data["latitude"] == 41.29).all()
+    assert len(cached_data) == len(data)
+
+
+def test_plan_coalesces_missing_days(hbase):
+    date_from = datetime.datetime(2021, 2, 1)
+    date_to = datetime.datetime(2021, 7, 31)
+    source = DummySource(hbase)
+    data = source.get_data(
+        41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+    )
+    gaps = data["ts"].between(1614556800, 1614729599) | data["ts"].between(
+        1625097600, 1625183999
+    )
+    source.save(data[~gaps], "meteo_dummy")
+
+    source = DummySource(hbase)
+    source.max_days_per_request = None
+    assert source.plan(
+        41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+    ) == [
+        (datetime.datetime(2021, 3, 1), datetime.datetime(2021, 3, 2)),
+        (datetime.datetime(2021, 7, 1), datetime.datetime(2021, 7, 1)),
+    ]
+    source.max_days_per_request = 1
+    assert (
+        len(
+            source.plan(
+                41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy"
+            )
+        )
+        == 3
+    )
+
+    source.get_data(41.29, 2.19, TIMEZONE, date_from, date_to, "meteo_dummy")
+    assert len(source.requested) == 3
+
+
+class FlakySource(DummySource):
+    max_concurrency = 8
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        time.sleep(0.01)
+        if day.day == 13:
+            raise IOError("Connection reset by peer")
+        return super(FlakySource, self)._get_data_day(
+            latitude, longitude, timezone, day
+        )
+
+
+def test_get_data_concurrently():
+    args = (
+        41.29,
+        2.19,
+        TIMEZONE,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 31),
+    )
+    sequential = DummySource({}).get_data(*args)
+    concurrent = DummySource({}).get_data(*args, max_workers=8)
+    assert concurrent.equals(sequential)
+
+
+def test_get_data_reports_errors_per_day():
+    source = FlakySource({})
+    with pytest.raises(FetchError) as e:
+        source.get_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            datetime.datetime(2021, 1, 1),
+            datetime.datetime(2021, 3, 31),
+            max_workers=4,
+        )
+    assert list(e.value.errors) == [
+        datetime.datetime(2021, 1, 13),
+        datetime.datetime(2021, 2, 13),
+        datetime.datetime(2021, 3, 13),
+    ]
+    assert len(source.requested) == 87
+
+
+class TypedSource(DummySource):
+    schema = {"GHI": "float32", "uvIndex": "int64", "icon": "object"}
+
+    def _get_data_day(self, latitude, longitude, timezone, day):
+        data = super(TypedSource, self)._get_data_day(
+            latitude, longitude, timezone, day
+        )
+        data["uvIndex"] = data["ts"] % 11
+        data["icon"] = "clear-day"
+        data["pressure"] = 1013
+        return data
+
+
+def test_stored_data_keeps_fetched_types(hbase):
+    args = (
+        41.29,
+        2.19,
+        TIMEZONE,
+        datetime.datetime(2021, 1, 1),
+        datetime.datetime(2021, 1, 10),
+        "meteo_typed",
+    )
+    source = TypedSource(hbase)
+    data = source.get_data(*args)
+    source.save(data, "meteo_typed")
+    cached = TypedSource(hbase)
+    stored = cached.get_data(*args)
+
+    assert cached.requested == []
+    assert dict(stored.dtypes) == dict(data.dtypes)
+    assert stored["GHI"].dtype == "float32"
+    assert stored["ts"].dtype == "int64"
+    assert stored["pressure"].dtype == "float64"
+    pd.testing.assert_frame_equal(stored, data)
+
+
+def test_decode_column():
+    assert _decode_column([b"1.5", b"nan", b"None"]).tolist()[0] == 1.5
+    assert np.isnan(_decode_column([b"1.5", b"nan", b"None"])[2])
+    assert _decode_column([b"3", b"4"], "int64").dtype == "int64"
+    assert _decode_column([b"3", b"nan"], "int64").dtype == "float64"
+    assert _decode_column([b"clear", b"None"]).tolist() == ["clear", None]
+    assert _decode_column([b"1", b"2"], "object").tolist() == ["1", "2"]
+
+
+def test_iter_data_matches_get_data(hbase):
+    date_from = datetime.datetime(2021, 1, 1)
+    date_to = datetime.datetime(2021, 3, 31)
+    source = DummySource(hbase)
+    chunks = list(
+        source.iter_data(
+            41.29,
+            2.19,
+            TIMEZONE,
+            date_from,
+            date_to,
+            "meteo_dummy",
+            chunk_days=7,
+        )
+    )
+    assert len(chunks) == 13
+    # the days shared by consecutive chunks are only fetched once
+    assert len(source.requested) == len(set(source.requested))
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True),
+        DummySource(hbase).get_data(41.29, 2.19, TIMEZONE, date_from, date_to),
+    )
@@ -0,0 +1,176 @@
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from beemeteo.stations import assignment
+from beemeteo.stations import index
+from beemeteo.stations.__main__ import main
+from beemeteo.stations.coordinates import Coordinates
+from beemeteo.stations.index import StationIndex
+from beemeteo.stations.postal_code import PostalCode
+from beemeteo.stations.postal_code import load
+from click.testing import CliRunner
+
+
+@pytest.fixture(params=["tree", "numpy"])
+def tree(request, monkeypatch):
+    if request.param == "tree":
+        pytest.importorskip("scipy")
+    else:
+        monkeypatch.setattr(index, "cKDTree", None)
+        monkeypatch.setattr(index, "CHUNK_SIZE", 1000)
+    return request.param
+
+
+def _stations(n, seed=0):
+    random = np.random.RandomState(seed)
+    return pd.DataFrame(
+        {
+            "latitude": random.uniform(27, 44, n).round(2),
+            "longitude": random.uniform(-18, 5, n).round(2),
+            "timezone": "Europe/Madrid",
+        }
+    )
+
+
+def test_query_matches_haversine(tree):
+    stations = _stations(500)
+    points = _stations(50, seed=1)
+    stations_index = StationIndex(stations)
+    distances, positions = stations_index.query(
+        points["latitude"], points["longitude"], k=5
+    )
+    assert distances.shape == (50, 5)
+    for i, point in enumerate(points.itertuples()):
+        expected = Coordinates(point.latitude, point.longitude).find_closest(
+            stations
+        )[:5]
+        assert [
+            (stations.latitude[p], stations.longitude[p], d)
+            for d, p in zip(distances[i], positions[i])
+        ] == expected
+
+
+def test_query_single_point(tree):
+    stations = _stations(100)
+    closest = StationIndex(stations).closest(41.29, 2.19)
+    assert closest == Coordinates(41.29, 2.19).find_closest(stations)[:1]
+
+
+def test_query_radius(tree):
+    stations = _stations(500)
+    stations_index = StationIndex(stations)
+    results = stations_index.query_radius([41.29, 28.1], [2.19, -15.4], 150)
+    for (distances, positions), (lat, lon) in zip(
+        results, [(41.29, 2.19), (28.1, -15.4)]
+    ):
+        expected = [
+            (la, lo, d)
+            for la, lo, d in Coordinates(lat, lon).find_closest(stations)
+            if d <= 150
+        ]
+        assert len(expected) > 0
+        assert [
+            (stations.latitude[p], stations.longitude[p], d)
+            for d, p in zip(distances, positions)
+        ] == expected
+
+
+def test_postal_code_loads_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    postal_code = PostalCode("ES", "08221")
+    assert (postal_code.latitude, postal_code.longitude) == (41.5667, 2.0167)
+    assert postal_code.data["postalCode"].tolist() == ["08221"]
+    with pytest.raises(KeyError):
+        PostalCode("ES", "99999")
+    assert load.cache_info().currsize == 1
+
+
+def test_resolve_many_postal_codes():
+    resolved = PostalCode.resolve_many("ES", ["08221", "99999", "21009"])
+    assert resolved["postalCode"].tolist() == ["08221", "99999", "21009"]
+    np.testing.assert_array_equal(
+        resolved["latitude"], [41.5667, np.nan, 38.023568]
+    )
+    np.testing.assert_array_equal(
+        resolved["longitude"], [2.0167, np.nan, -6.416836]
+    )
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_assign_postal_codes_command(tmp_path, workers):
+    stations = tmp_path / "stations.txt"
+    _stations(200).to_csv(stations, sep="\t", header=False, index=False)
+    postal_codes = tmp_path / "postal_codes.txt"
+    postal_codes.write_text("ES\t08221\nES\t99999\nES\t21009\nFR\t75001\n")
+    output = tmp_path / "assigned.csv"
+    result = CliRunner().invoke(
+        main,
+        [
+            "--stations",
+            str(stations),
+            "--postal-codes",
+            str(postal_codes),
+            "--output",
+            str(output),
+            "--chunk-size",
+            "2",
+            "--workers",
+            str(workers),
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assigned = pd.read_csv(output, dtype={"postalCode": str})
+    assert assigned["postalCode"].tolist() == [
+        "08221",
+        "99999",
+        "21009",
+        "75001",
+    ]
+    assert assigned["distance"].isna().tolist() == [False, True, False, False]
+    closest = PostalCode("ES", "21009").find_closest(_stations(200))
+    assert tuple(
+        assigned.loc[2, ["station_latitude", "station_longitude", "distance"]]
+    ) == pytest.approx(closest)
+
+
+class _Executor:
+    """
+    Synchronous stand-in for ProcessPoolExecutor counting submitted chunks
+    """
+
+    submitted = 0
+
+    def __init__(self, max_workers, initializer, initargs):
+        initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def submit(self, fn, *args):
+        _Executor.submitted += 1
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+
+def test_assign_keeps_a_bounded_window_of_chunks(monkeypatch):
+    monkeypatch.setattr(assignment, "ProcessPoolExecutor", _Executor)
+    monkeypatch.setattr(_Executor, "submitted", 0)
+    postal_codes = pd.DataFrame(
+        {"country": "ES", "postalCode": ["08221", "21009"] * 10}
+    )
+    assigned = assignment.assign(
+        postal_codes, _stations(200), chunk_size=1, workers=2
+    )
+    for consumed in range(20):
+        next(assigned)
+        # chunks consumed or waiting, never more than 2 per worker
+        assert _Executor.submitted <= consumed + 2 * 2
+    assert list(assigned) == []
+    assert _Executor.submitted == 20